@@ -0,0 +1,121 @@
+# analytics.py
+"""
+استعلامات تحليل على جانب SQLite للوحة التحكم: كل التجميع (يوم/شهر/تصنيف) يتم
+في SQL على جداول التجميع، ولا يعبر إلى بايثون إلا النقاط المجمَّعة.
+"""
+import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from db import get_conn
+from perf import timed
+
+# ============= أدوات =============
+
+def _frame(user_id: int, q: str, params: Sequence[Any]) -> pd.DataFrame:
+    with get_conn(user_id) as conn:
+        cur = conn.execute(q, params)
+        cols = [d[0] for d in cur.description]
+        return pd.DataFrame.from_records(cur.fetchall(), columns=cols)
+
+def _daily_where(user_id: int, date_from: Optional[str], date_to: Optional[str],
+                 categories: Optional[Sequence[str]] = None) -> Tuple[str, List[Any]]:
+    where, params = ["user_id=?"], [user_id]
+    if date_from:
+        where.append("date>=?")
+        params.append(str(date_from))
+    if date_to:
+        where.append("date<=?")
+        params.append(str(date_to))
+    if categories:
+        where.append(f"category IN ({','.join('?' * len(categories))})")
+        params.extend(categories)
+    return " AND ".join(where), params
+
+def _ranged(date_from: Optional[str], date_to: Optional[str]) -> bool:
+    return bool(date_from or date_to)
+
+# ============= السلاسل =============
+
+def daily_series(user_id: int, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 categories: Optional[Sequence[str]] = None, running: bool = False) -> pd.DataFrame:
+    """مجموع كل يوم: date, amount, cnt (+ running_total تراكمي بدالة نافذة عند running)."""
+    where, params = _daily_where(user_id, date_from, date_to, categories)
+    running_col = ", SUM(SUM(total)) OVER (ORDER BY date) AS running_total" if running else ""
+    return _frame(
+        user_id,
+        f"""SELECT date, SUM(total) AS amount, SUM(cnt) AS cnt{running_col}
+            FROM daily_totals WHERE {where} GROUP BY date ORDER BY date""",
+        params,
+    )
+
+def monthly_series(user_id: int, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                   running: bool = False) -> pd.DataFrame:
+    """مجموع كل شهر: month, amount, cnt (+ running_total). بلا حدود → جدول الأشهر مباشرة."""
+    running_col = ", SUM(SUM(total)) OVER (ORDER BY month) AS running_total" if running else ""
+    if not _ranged(date_from, date_to):
+        return _frame(
+            user_id,
+            f"""SELECT month, SUM(total) AS amount, SUM(cnt) AS cnt{running_col}
+                FROM monthly_totals WHERE user_id=? GROUP BY month ORDER BY month""",
+            [user_id],
+        )
+    # حدود بالأيام قد تقطع شهرًا → التجميع من الجدول اليومي
+    where, params = _daily_where(user_id, date_from, date_to)
+    return _frame(
+        user_id,
+        f"""SELECT substr(date, 1, 7) AS month, SUM(total) AS amount, SUM(cnt) AS cnt{running_col}
+            FROM daily_totals WHERE {where} GROUP BY month ORDER BY month""",
+        params,
+    )
+
+def category_breakdown(user_id: int, date_from: Optional[str] = None,
+                       date_to: Optional[str] = None) -> pd.DataFrame:
+    """مجموع كل تصنيف تنازليًا: category, amount, cnt, share."""
+    if _ranged(date_from, date_to):
+        where, params = _daily_where(user_id, date_from, date_to)
+        table = "daily_totals"
+    else:
+        where, params = "user_id=?", [user_id]
+        table = "monthly_totals"
+    return _frame(
+        user_id,
+        f"""SELECT category, SUM(total) AS amount, SUM(cnt) AS cnt,
+                   SUM(total) / SUM(SUM(total)) OVER () AS share
+            FROM {table} WHERE {where} GROUP BY category ORDER BY amount DESC""",
+        params,
+    )
+
+# ============= المؤشرات =============
+
+def summary(user_id: int, date_from: Optional[str] = None, date_to: Optional[str] = None,
+            today: Optional[datetime.date] = None) -> Dict[str, Any]:
+    """مؤشرات اللوحة في استعلام واحد: إجمالي الشهر الحالي، أعلى تصنيف، المتوسط اليومي."""
+    month = (today or datetime.date.today()).strftime("%Y-%m")
+    where, params = _daily_where(user_id, date_from, date_to)
+    with get_conn(user_id) as conn:
+        row = conn.execute(
+            f"""SELECT
+                  (SELECT IFNULL(SUM(total), 0) FROM monthly_totals WHERE user_id=? AND month=?) AS month_total,
+                  (SELECT category FROM daily_totals WHERE {where}
+                   GROUP BY category ORDER BY SUM(total) DESC LIMIT 1) AS top_category,
+                  (SELECT SUM(total) / COUNT(DISTINCT date) FROM daily_totals WHERE {where}) AS avg_per_day,
+                  (SELECT IFNULL(SUM(cnt), 0) FROM daily_totals WHERE {where}) AS count""",
+            [user_id, month] + params * 3,
+        ).fetchone()
+    return dict(row)
+
+@timed(rows=lambda d: d["summary"]["count"] if d else 0)
+def dashboard_data(user_id: int, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                   running: bool = False) -> Dict[str, Any]:
+    """كل ما تحتاجه اللوحة؛ {} إن لم توجد مصاريف في الفترة."""
+    stats = summary(user_id, date_from, date_to)
+    if not stats["count"]:
+        return {}
+    return {
+        "summary": stats,
+        "daily": daily_series(user_id, date_from, date_to, running=running),
+        "monthly": monthly_series(user_id, date_from, date_to, running=running),
+        "by_cat": category_breakdown(user_id, date_from, date_to),
+    }
@@ -1,45 +1,128 @@
 # anomalies.py
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import IsolationForest
 
-def detect_anomalies(df: pd.DataFrame, window_days: int = 90, contamination: float = 0.06) -> pd.DataFrame:
+import online_anomalies
+from parallel import map_tasks
+from perf import span, timed
+
+COLUMNS = ["category", "date", "amount", "level"]
+MIN_ROWS_FOR_MODEL = 20
+MODELS = ("per_category", "global")
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame(columns=COLUMNS)
+
+def _iso_outliers(task: Tuple[np.ndarray, float]) -> np.ndarray:
+    # دالة على مستوى الوحدة لتكون قابلة لـ pickle مع ProcessPoolExecutor
+    from sklearn.ensemble import IsolationForest  # تحميل كسول: ثقيل ولا تحتاجه شاشة الدخول
+
+    X, contamination = task
+    iso = IsolationForest(contamination=contamination, random_state=42)
+    return iso.fit_predict(X) == -1
+
+def _global_outliers(amount: np.ndarray, codes: np.ndarray, contamination: float) -> np.ndarray:
+    """نموذج واحد لكل التصنيفات: المبلغ المعياري داخل تصنيفه + ترميز one-hot للتصنيف."""
+    n_cats = int(codes.max()) + 1
+    counts = np.bincount(codes, minlength=n_cats)
+    mean = np.bincount(codes, weights=amount, minlength=n_cats) / counts
+    var = np.bincount(codes, weights=(amount - mean[codes]) ** 2, minlength=n_cats) / counts
+    std = np.sqrt(var)
+    std[std == 0] = 1.0
+    z = (amount - mean[codes]) / std[codes]
+    X = np.column_stack([z, np.eye(n_cats)[codes]])
+    return _iso_outliers((X, contamination))
+
+@timed(name="anomalies.detect")
+def detect_anomalies(df: pd.DataFrame, window_days: int = 90, contamination: float = 0.06,
+                     backend: Optional[str] = None, workers: Optional[int] = None,
+                     model: str = "per_category") -> pd.DataFrame:
     """
     يأخذ DataFrame فيه الأعمدة: amount, category, date
     ويرجع جدول تنبيهات للشذوذ مع مستوى الشدة.
+    backend/workers: تدريب نماذج التصنيفات بالتوازي (serial | thread | process).
+    model: "per_category" (IsolationForest لكل تصنيف) أو "global" (نموذج واحد بترميز التصنيف).
     """
+    if model not in MODELS:
+        raise ValueError(f"unknown model {model!r}; expected one of {MODELS}")
     if df.empty:
-        return pd.DataFrame(columns=["category", "date", "amount", "level"])
+        return _empty()
 
-    data = df.copy()
+    data = df[["category", "date", "amount"]].copy()
     data["date"] = pd.to_datetime(data["date"])
+    data = data[data["category"].notna()]
     if len(data) > 0:
         max_day = data["date"].max()
         data = data[data["date"] >= (max_day - pd.Timedelta(days=window_days))]
+    if data.empty:
+        return _empty()
+
+    if isinstance(data["category"].dtype, pd.CategoricalDtype):
+        # رموز القاموس المشترك بترتيب الإضافة → ترتيب أبجدي كما مع أعمدة النصوص
+        cats = data["category"].cat.remove_unused_categories()
+        data["category"] = cats.cat.reorder_categories(sorted(cats.cat.categories))
+
+    # ترتيب ثابت (تصنيف، تاريخ) → كل تصنيف كتلة متصلة
+    codes, _ = pd.factorize(data["category"], sort=True)
+    order = np.lexsort([data["date"].to_numpy(), codes])
+    data = data.iloc[order].reset_index(drop=True)
+    codes = codes[order]
+    amount = data["amount"].to_numpy(dtype="float64")
+
+    g = data.groupby(codes, sort=True)["amount"]
+    sizes = np.bincount(codes)
+    small = sizes[codes] < MIN_ROWS_FOR_MODEL
+    p90 = g.transform("quantile", 0.90).to_numpy()
+    p95 = g.transform("quantile", 0.95).to_numpy()
+    p97 = g.transform("quantile", 0.97).to_numpy()
+
+    if model == "global":
+        with span("anomalies.isolation_forest", rows=len(amount)):
+            flagged = _global_outliers(amount, codes, contamination)
+        levels = np.select([amount >= p97, amount >= p90], ["high", "medium"], "low")
+    else:
+        # تصنيفات قليلة البيانات: كل ما فوق المئين 95 → medium
+        flagged = small & (amount >= p95)
+        starts = np.cumsum(sizes) - sizes
+        big = np.flatnonzero(sizes >= MIN_ROWS_FOR_MODEL)
+        tasks = [(amount[starts[c]:starts[c] + sizes[c]].reshape(-1, 1), contamination) for c in big]
+        with span("anomalies.isolation_forest", rows=int(sizes[big].sum())):
+            masks = map_tasks(_iso_outliers, tasks, backend, workers)
+        for c, mask in zip(big, masks):
+            flagged[starts[c]:starts[c] + sizes[c]] = mask
+        levels = np.where(
+            small, "medium",
+            np.select([amount >= p97, amount >= p90], ["high", "medium"], "low"),
+        )
+
+    out_df = data.assign(level=levels)[flagged].reset_index(drop=True)[COLUMNS]
+    if out_df.empty:
+        return _empty()
+    return out_df.sort_values(["level", "amount"], ascending=[True, False])
+
+def recalibrate_online_states(df: pd.DataFrame, window_days: int = 90,
+                              contamination: float = 0.06) -> Dict[Any, Dict[str, Any]]:
+    """
+    إعادة معايرة دورية للكاشف الفوري: يستبعد ما يعدّه IsolationForest شاذًا في النافذة
+    ثم يعيد تمرير باقي العمليات زمنيًا لبناء حالة نظيفة لكل تصنيف.
+    """
+    if df.empty:
+        return {}
+    data = df[["category", "date", "amount"]].copy()
+    data["date"] = pd.to_datetime(data["date"])
+    data = data[data["date"] >= data["date"].max() - pd.Timedelta(days=window_days)]
+    alerts = detect_anomalies(data, window_days=window_days, contamination=contamination)
+    if not alerts.empty:
+        keys = ["category", "date", "amount"]
+        marked = data.merge(alerts[keys].drop_duplicates(), on=keys, how="left", indicator=True)
+        data = data[(marked["_merge"] == "left_only").to_numpy()]
 
-    alerts = []
-    for cat, g in data.groupby("category"):
-        g = g.sort_values("date")
-        if len(g) < 20:
-            if len(g) == 0:
-                continue
-            thr = g["amount"].quantile(0.95)
-            out = g[g["amount"] >= thr]
-            for _, r in out.iterrows():
-                alerts.append({"category": cat, "date": r["date"], "amount": r["amount"], "level": "medium"})
-            continue
-
-        X = g[["amount"]].values
-        iso = IsolationForest(contamination=contamination, random_state=42)
-        scores = iso.fit_predict(X)
-        g = g.assign(is_anom=(scores == -1))
-
-        p90 = g["amount"].quantile(0.90)
-        p97 = g["amount"].quantile(0.97)
-        for _, r in g[g["is_anom"]].iterrows():
-            level = "high" if r["amount"] >= p97 else "medium" if r["amount"] >= p90 else "low"
-            alerts.append({"category": cat, "date": r["date"], "amount": r["amount"], "level": level})
-
-    if not alerts:
-        return pd.DataFrame(columns=["category", "date", "amount", "level"])
-    out_df = pd.DataFrame(alerts).sort_values(["level", "amount"], ascending=[True, False])
-    return out_df
+    states = {}
+    for cat, g in data.sort_values("date", kind="mergesort").groupby("category", observed=True):
+        st = online_anomalies.new_state()
+        for x in g["amount"].to_numpy(dtype="float64"):
+            online_anomalies.update(st, float(x))
+        states[cat] = st
+    return states
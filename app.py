@@ -1,18 +1,28 @@
+from __future__ import annotations
+
 import io
 import datetime
-import pandas as pd
-import plotly.express as px
 import streamlit as st
 
+import jobs
+import perf
+
 from db import (
-    init_db, create_user, verify_user,
-    add_expense, list_expenses, clear_all_expenses,
-    update_expense, delete_expenses
+    init_db, create_user, login_async, validate_session, revoke_session,
+    add_expense, next_cursor, search_expenses, clear_all_expenses,
+    delete_expenses,
+    get_anomaly_flag, get_anomaly_flags, save_anomaly_states, get_data_version
 )
-from forecast import train_and_forecast_per_category, monthly_projection
-from anomalies import detect_anomalies
-from optimizer import optimize_budget
+from archive import list_expenses
 from seed_data import seed_demo
+from data_io import import_file, export_file, save_editor_changes
+from utils import DATA_DIR, CATEGORIES, PAYMENT_METHODS, ADMIN_USERS, lazy_import
+
+# المكتبات الثقيلة تُحمَّل عند أول استخدام فقط، فتظهر شاشة الدخول دون انتظارها.
+# وحدات forecast / anomalies / optimizer (xgboost, sklearn, pulp) تُستورد داخل تبويباتها.
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+px = lazy_import("plotly.express")
 
 # ========== إعداد الصفحة ==========
 st.set_page_config(
@@ -42,6 +52,27 @@ html, body, .stApp, [data-testid="stAppViewContainer"], [data-testid="stSidebar"
 """, unsafe_allow_html=True)
 
 # ========== تسجيل الدخول / الحساب ==========
+LOGIN_POLL_SECONDS = 0.25
+
+@st.fragment(run_every=LOGIN_POLL_SECONDS)
+def login_status():
+    """يفحص نتيجة login_async دون حجب الواجهة؛ إعادة تشغيل كاملة عند انتهائه."""
+    future = st.session_state.get("login_future")
+    if future is None:
+        return
+    if not future.done():
+        st.info("⏳ جارٍ التحقق...")
+        return
+    del st.session_state["login_future"]
+    session = future.result()
+    if session:
+        st.session_state["session_token"] = session["token"]
+        st.session_state["user_id"] = session["user_id"]
+        st.session_state["username"] = session["username"]
+    else:
+        st.session_state["login_failed"] = True
+    st.rerun(scope="app")
+
 def login_ui():
     st.title("🔐 تسجيل الدخول")
 
@@ -50,15 +81,15 @@ def login_ui():
     with tab1:
         username = st.text_input("👤 اسم المستخدم", key="login_user")
         password = st.text_input("🔑 كلمة المرور", type="password", key="login_pass")
-        if st.button("تسجيل الدخول", use_container_width=True):
-            uid = verify_user(username, password)
-            if uid:
-                st.session_state["user_id"] = uid
-                st.session_state["username"] = username
-                st.success("تم تسجيل الدخول ✅")
-                st.rerun()
-            else:
-                st.error("بيانات الدخول غير صحيحة ❌")
+        pending = "login_future" in st.session_state
+        if st.button("تسجيل الدخول", use_container_width=True, disabled=pending):
+            # الاشتقاق المكلف في مجمّع خيوط المصادقة؛ السكربت لا ينتظره
+            st.session_state["login_future"] = login_async(username, password)
+            pending = True
+        if st.session_state.pop("login_failed", False):
+            st.error("بيانات الدخول غير صحيحة ❌")
+        if pending:
+            login_status()
 
     with tab2:
         new_user = st.text_input("👤 اسم المستخدم الجديد", key="reg_user")
@@ -82,6 +113,7 @@ def sidebar_controls(user_id: int):
         st.header(f"أهلاً، {st.session_state['username']} 👋")
 
         if st.button("🚪 تسجيل الخروج", use_container_width=True):
+            revoke_session(st.session_state.get("session_token"))
             st.session_state.clear()
             st.rerun()
 
@@ -90,15 +122,18 @@ def sidebar_controls(user_id: int):
         amount = st.number_input("المبلغ", min_value=0.0, step=1.0)
         colA, colB = st.columns(2)
         with colA:
-            category = st.selectbox("التصنيف", ["طعام","مواصلات","فواتير","تسوق","صحة","تعليم","ترفيه","أخرى"])
+            category = st.selectbox("التصنيف", CATEGORIES)
         with colB:
-            payment = st.selectbox("طريقة الدفع", ["نقدًا","بطاقة","Apple Pay","STC Pay","أخرى"])
+            payment = st.selectbox("طريقة الدفع", PAYMENT_METHODS)
         date = st.date_input("التاريخ", value=datetime.date.today())
         note = st.text_input("ملاحظة", placeholder="وصف قصير للعملية")
 
         if st.button("➕ إضافة العملية", use_container_width=True):
             if amount > 0:
-                add_expense(user_id, float(amount), category, payment, str(date), note)
+                eid = add_expense(user_id, float(amount), category, payment, str(date), note)
+                flag = get_anomaly_flag(user_id, eid)
+                if flag:
+                    st.toast(f"🚨 مصروف غير اعتيادي في {category} ({flag['level']})")
                 st.success("تمت الإضافة ✅")
                 st.rerun()
             else:
@@ -115,66 +150,158 @@ def sidebar_controls(user_id: int):
             st.warning(f"تم حذف {deleted} عملية بشكل نهائي ⚠️")
             st.rerun()
 
+# ========== التخزين المؤقت ==========
+# كل دالة مفتاحها (user_id, version): أي كتابة ترفع النسخة في db فتُبطل نتائجها تلقائيًا،
+# وإعادة التشغيل دون تغيير في البيانات لا تلمس قاعدة البيانات ولا النماذج.
+CACHE_TTL = 3600
+CACHE_MAX_ENTRIES = 64
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_expenses_df(user_id: int, version: int) -> pd.DataFrame:
+    # أعمدة مكتوبة النوع (فئوية للتصنيف/طريقة الدفع) بدل dict لكل صف
+    from columnar import load_frame
+
+    return load_frame(user_id, limit=10_000)
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_dashboard(user_id: int, version: int, date_from: str = None, date_to: str = None,
+                   running: bool = False) -> dict:
+    # التجميع كله في SQL؛ لا يصل إلى بايثون إلا النقاط المجمَّعة
+    from analytics import dashboard_data
+
+    return dashboard_data(user_id, date_from, date_to, running=running)
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_anomaly_flags(user_id: int, version: int) -> pd.DataFrame:
+    return pd.DataFrame(get_anomaly_flags(user_id, limit=50))
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_budget(user_id: int, version: int, income: float, target: float) -> dict:
+    from optimizer import optimize_budget
+
+    return optimize_budget(income, target, user_id)
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_budget_grid(user_id: int, version: int, incomes: tuple, goals: tuple) -> pd.DataFrame:
+    from optimizer import optimize_budget_grid
+
+    return optimize_budget_grid(incomes, goals, user_id)
+
+# حالة المهام تتغير دون كتابة (انتهاء مهمة) → مفتاح النسخة ومدة قصيرة بدل CACHE_TTL
+JOB_STATUS_TTL = 2
+
+@st.cache_data(ttl=JOB_STATUS_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_job_result(user_id: int, version: int, kind: str):
+    return jobs.latest(user_id, kind, version)
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_page(user_id: int, version: int, page_size: int, before, filters: dict) -> list:
+    # مع نص بحث: ترتيب بالصلة من فهرس FTS5 و before = offset؛ بدونه keyset بالتاريخ
+    filters = dict(filters)
+    query = filters.pop("query", None)
+    if query:
+        return search_expenses(user_id, query, limit=page_size, offset=before or 0, **filters)
+    return list_expenses(user_id, limit=page_size, before=before, **filters)
+
 # ========== التبويبات ==========
-def dashboard_tab(df_all: pd.DataFrame):
+def dashboard_tab(user_id: int, version: int):
     st.subheader("📊 لوحة التحكم")
-    if df_all.empty:
+    c_period, c_running = st.columns([3, 1])
+    period = c_period.date_input("الفترة (فارغة = كل الفترات)", value=(), key="dash_period")
+    running = c_running.checkbox("إجمالي تراكمي", key="dash_running")
+    period = tuple(period) if isinstance(period, (list, tuple)) else (period,)
+    date_from = str(period[0]) if len(period) >= 1 else None
+    date_to = str(period[1]) if len(period) >= 2 else None
+
+    data = load_dashboard(user_id, version, date_from, date_to, running)
+    if not data:
         st.info("أضف مصروفات لرؤية اللوحة.")
         return
-    df_all = df_all.copy()
-    df_all["date"] = pd.to_datetime(df_all["date"])
+    stats, daily, monthly, by_cat = data["summary"], data["daily"], data["monthly"], data["by_cat"]
 
     c1, c2, c3 = st.columns(3)
-    month_mask = (df_all["date"].dt.to_period("M") == pd.Timestamp.today().to_period("M"))
-    total_this_month = df_all.loc[month_mask, "amount"].sum()
-    top_cat = df_all.groupby("category")["amount"].sum().sort_values(ascending=False).index[0]
-    avg_per_day = df_all.groupby(df_all["date"].dt.date)["amount"].sum().mean()
-
-    c1.metric("إجمالي هذا الشهر", fmt_currency(total_this_month))
-    c2.metric("أعلى تصنيف صرف", top_cat)
-    c3.metric("متوسط يومي", fmt_currency(avg_per_day))
-
-    monthly = df_all.groupby(df_all["date"].dt.to_period("M"))["amount"].sum().reset_index()
-    monthly["date"] = monthly["date"].astype(str)
-    fig1 = px.bar(monthly, x="date", y="amount", title="إجمالي المصاريف الشهرية")
+    c1.metric("إجمالي هذا الشهر", fmt_currency(stats["month_total"]))
+    c2.metric("أعلى تصنيف صرف", stats["top_category"])
+    c3.metric("متوسط يومي", fmt_currency(stats["avg_per_day"]))
+
+    y = "running_total" if running else "amount"
+    fig1 = px.bar(monthly, x="month", y=y, title="إجمالي المصاريف الشهرية")
     st.plotly_chart(fig1, use_container_width=True)
 
-    by_cat = df_all.groupby("category")["amount"].sum().reset_index()
     fig2 = px.pie(by_cat, values="amount", names="category", title="توزيع المصاريف حسب التصنيف")
     st.plotly_chart(fig2, use_container_width=True)
-    daily = df_all.groupby(df_all["date"].dt.date)["amount"].sum().reset_index()
-    daily.columns = ["date", "amount"]
-    fig3 = px.line(daily, x="date", y="amount", title="المصروف اليومي")
+    fig3 = px.line(daily, x="date", y=y, title="المصروف اليومي")
     st.plotly_chart(fig3, use_container_width=True)
 
 
-def forecast_tab(df_all: pd.DataFrame):
+def job_result(user_id: int, version: int, kind: str):
+    """
+    آخر نتيجة محسوبة في الخلفية (jobs.py) أو None؛ الواجهة لا تدرّب نماذج بنفسها.
+    تعرض علامة "قديمة منذ" وزر تحديث بينما تُعاد الحسابات.
+    """
+    res = load_job_result(user_id, version, kind)
+    failed = res is not None and res["status"] == "failed"
+    if res is None or (res["stale"] and not failed):
+        col_msg, col_btn = st.columns([4, 1])
+        if res is None:
+            col_msg.info("⏳ جارٍ الحساب في الخلفية…")
+        elif res["stale_since"]:
+            since = datetime.datetime.fromtimestamp(res["stale_since"]).strftime("%H:%M:%S")
+            col_msg.caption(f"⏳ النتائج قديمة منذ {since} — يجري التحديث في الخلفية")
+        else:
+            col_msg.caption("⏳ النتائج قديمة — يجري التحديث في الخلفية")
+        col_btn.button("🔄 تحديث", key=f"refresh_{kind}", use_container_width=True)
+    if failed:
+        st.warning(f"فشل آخر حساب: {res['error']}")
+    return None if res is None else res["payload"]
+
+def forecast_tab(df_all: pd.DataFrame, user_id: int, version: int):
     st.subheader("🤖 التنبؤ بالمصروفات")
     if df_all.empty:
         st.info("لا توجد بيانات كافية للتنبؤ.")
         return
-    try:
-        preds_daily = train_and_forecast_per_category(df_all[["amount","category","date"]])
-        preds_month = monthly_projection(preds_daily, days=30)
-        pred_df = pd.DataFrame(
-            [{"التصنيف": c, "توقع يومي": round(d,2), "تقدير شهري": round(preds_month[c],2)} for c, d in preds_daily.items()]
-        ).sort_values("تقدير شهري", ascending=False)
-        st.dataframe(pred_df, use_container_width=True)
-    except Exception as e:
-        st.error(f"خطأ: {e}")
-
-def anomalies_tab(df_all: pd.DataFrame):
+    from forecast import cache_stats as forecast_cache_stats
+
+    preds = job_result(user_id, version, "forecast")
+    if preds is None:
+        return
+    pred_df = pd.DataFrame(
+        [{"التصنيف": p["category"], "توقع يومي": round(p["daily"], 2), "تقدير شهري": round(p["monthly"], 2)}
+         for p in preds], columns=["التصنيف", "توقع يومي", "تقدير شهري"]
+    ).sort_values("تقدير شهري", ascending=False)
+    st.dataframe(pred_df, use_container_width=True)
+    stats = forecast_cache_stats()
+    st.caption(f"ذاكرة النماذج: {stats['hits']} إصابة / {stats['misses']} إخفاق "
+               f"({stats['warm_starts']} تدريب تدريجي) — زمن التدريب {stats['train_seconds']:.2f}ث")
+
+def anomalies_tab(df_all: pd.DataFrame, user_id: int, version: int):
     st.subheader("🚨 المصاريف غير الاعتيادية")
     if df_all.empty:
         st.info("لا توجد بيانات.")
         return
-    alerts = detect_anomalies(df_all[["amount","category","date"]].copy(), window_days=90, contamination=0.06)
-    if alerts.empty:
-        st.success("لا توجد مصاريف غير اعتيادية ✔️")
+
+    flags = load_anomaly_flags(user_id, version)
+    st.markdown("**⚡ تنبيهات فورية (عند الإضافة)**")
+    if flags.empty:
+        st.caption("لا توجد تنبيهات فورية.")
     else:
-        st.dataframe(alerts, use_container_width=True)
+        st.dataframe(flags[["category", "date", "amount", "level", "zscore"]], use_container_width=True)
+
+    st.markdown("**🔎 فحص آخر 90 يومًا**")
+    alerts = job_result(user_id, version, "anomalies")
+    if alerts == []:
+        st.success("لا توجد مصاريف غير اعتيادية ✔️")
+    elif alerts:
+        st.dataframe(pd.DataFrame(alerts), use_container_width=True)
 
-def optimizer_tab(df_all: pd.DataFrame, user_id: int):
+    if st.button("🔄 إعادة معايرة الكشف الفوري"):
+        from anomalies import recalibrate_online_states
+
+        states = recalibrate_online_states(df_all[["amount","category","date"]], window_days=90, contamination=0.06)
+        save_anomaly_states(user_id, states)
+        st.success(f"تمت إعادة المعايرة لـ {len(states)} تصنيف ✅")
+
+def optimizer_tab(df_all: pd.DataFrame, user_id: int, version: int):
     st.subheader("🧮 مُحسّن الميزانية")
     if df_all.empty:
         st.info("أضف بيانات أولًا.")
@@ -184,7 +311,7 @@ def optimizer_tab(df_all: pd.DataFrame, user_id: int):
     target = st.number_input("🎯 هدف الادخار", min_value=0.0, value=1000.0, step=100.0)
 
     if st.button("احسب التوزيع"):
-        allocs = optimize_budget(income, target, user_id)
+        allocs = load_budget(user_id, version, income, target)
 
         if not allocs:
             st.error("⚠️ هدف الادخار أكبر من الدخل")
@@ -197,33 +324,113 @@ def optimizer_tab(df_all: pd.DataFrame, user_id: int):
             fig = px.pie(df_alloc, values="المقترح", names="التصنيف", title="التوزيع المقترح")
             st.plotly_chart(fig, use_container_width=True)
 
-
-def data_tab(user_id: int, df_all: pd.DataFrame):
+    with st.expander("🔀 سيناريوهات ماذا لو"):
+        inc_lo, inc_hi = st.slider("نطاق الدخل", 0, 50_000, (int(income * 0.5), int(income * 1.5)), step=500)
+        goal_lo, goal_hi = st.slider("نطاق هدف الادخار", 0, 20_000, (0, int(target * 2)), step=250)
+        steps = st.slider("عدد القيم في كل نطاق", 2, 20, 5)
+        grid = load_budget_grid(user_id, version, tuple(np.linspace(inc_lo, inc_hi, steps)),
+                                tuple(np.linspace(goal_lo, goal_hi, steps)))
+        st.dataframe(grid, use_container_width=True)
+
+
+def import_export_section(user_id: int):
+    col_in, col_out = st.columns(2)
+    with col_in:
+        up = st.file_uploader("⬆️ استيراد (CSV / Parquet)", type=["csv", "parquet"])
+        if up is not None and st.button("استيراد الملف", use_container_width=True):
+            stats = import_file(user_id, up)
+            st.success(f"تم استيراد {stats['rows']:,} سجلًا ({stats['rows_per_sec']:,.0f} سجل/ث) ✅")
+            if stats["errors"]:
+                st.warning("تم تجاهل صفوف غير صالحة:\n\n" + "\n".join(stats["errors"][:10]))
+    with col_out:
+        fmt = st.radio("⬇️ صيغة التصدير", ["csv", "parquet"], horizontal=True)
+        if st.button("تجهيز ملف التصدير", use_container_width=True):
+            # الكتابة إلى ملف على القرص دفعةً دفعة بدل بناء DataFrame للتاريخ كاملًا
+            out_dir = DATA_DIR / "exports"
+            out_dir.mkdir(parents=True, exist_ok=True)
+            path = out_dir / f"expenses_{user_id}.{fmt}"
+            n = export_file(user_id, path, fmt)
+            st.session_state["export_path"] = str(path)
+            st.caption(f"{n:,} سجل")
+        path = st.session_state.get("export_path")
+        if path and path.endswith(fmt):
+            with open(path, "rb") as f:
+                st.download_button("⬇️ تنزيل", f, file_name=f"expenses.{fmt}", use_container_width=True)
+
+
+def data_filters() -> dict:
+    query = st.text_input("🔎 بحث في الملاحظات", key="flt_query", placeholder="قهوة، سوبرماركت، اسم المتجر…")
+    with st.expander("🎛️ الفلاتر", expanded=False):
+        c1, c2 = st.columns(2)
+        period = c1.date_input("الفترة", value=(), key="flt_period")
+        cats = c2.multiselect("التصنيفات", CATEGORIES, key="flt_cats")
+        c3, c4, c5 = st.columns(3)
+        pays = c3.multiselect("طرق الدفع", PAYMENT_METHODS, key="flt_pays")
+        min_amt = c4.number_input("أقل مبلغ", min_value=0.0, value=0.0, step=10.0, key="flt_min")
+        max_amt = c5.number_input("أعلى مبلغ (0 = بلا حد)", min_value=0.0, value=0.0, step=10.0, key="flt_max")
+    period = tuple(period) if isinstance(period, (list, tuple)) else (period,)
+    return {
+        "query": query.strip() or None,
+        "date_from": str(period[0]) if len(period) >= 1 else None,
+        "date_to": str(period[1]) if len(period) >= 2 else None,
+        "categories": cats or None,
+        "payment_methods": pays or None,
+        "min_amount": min_amt or None,
+        "max_amount": max_amt or None,
+    }
+
+
+def data_tab(user_id: int, version: int):
     st.subheader("🗂️ إدارة البيانات")
+    import_export_section(user_id)
+    filters = data_filters()
+    page_size = st.selectbox("عدد السجلات في الصفحة", [50, 100, 250, 500], index=1)
+
+    # مؤشرات keyset للصفحات السابقة؛ تُصفّر عند تغيّر الفلاتر
+    sig = (repr(filters), page_size)
+    if st.session_state.get("page_sig") != sig:
+        st.session_state["page_sig"] = sig
+        st.session_state["page_cursors"] = [None]
+    cursors = st.session_state["page_cursors"]
+
+    rows = load_page(user_id, version, page_size, cursors[-1], filters)
+    df_all = pd.DataFrame(rows)
+    if filters["query"]:
+        cursor = (cursors[-1] or 0) + page_size if len(rows) == page_size else None
+    else:
+        cursor = next_cursor(rows, page_size)
+
+    p1, p2, p3 = st.columns([1, 2, 1])
+    if p1.button("→ السابق", disabled=len(cursors) == 1, use_container_width=True):
+        cursors.pop()
+        st.rerun()
+    p2.caption(f"صفحة {len(cursors)}")
+    if p3.button("التالي ←", disabled=cursor is None, use_container_width=True):
+        cursors.append(cursor)
+        st.rerun()
+
     if df_all.empty:
         st.info("لا توجد بيانات.")
         return
     view_cols = ["id", "amount", "category", "payment_method", "date", "note"]
-    df_view = df_all[view_cols].copy()
+    # صفوف الأشهر المؤرشفة (Parquet) تُعرض للقراءة فقط؛ الحذف وحده يعيد كتابة ملف الشهر
+    archived = (df_all["archived"].fillna(False).astype(bool) if "archived" in df_all
+                else pd.Series(False, index=df_all.index))
+    df_view = df_all.loc[~archived, view_cols].reset_index(drop=True)
     edited = st.data_editor(df_view, num_rows="dynamic", use_container_width=True, disabled=["id"])
+    if archived.any():
+        st.caption("🗄️ عمليات من أشهر مؤرشفة: للقراءة فقط، ويمكن حذفها من القائمة أدناه")
+        st.dataframe(df_all.loc[archived, view_cols], use_container_width=True, hide_index=True)
 
     if st.button("💾 حفظ التعديلات"):
-        changed = 0
-        orig = df_view.set_index("id")
-        new = edited.set_index("id")
-        for eid in new.index:
-            diff = {}
-            for col in ["amount","category","payment_method","date","note"]:
-                old_val = orig.loc[eid, col]
-                new_val = new.loc[eid, col]
-                if old_val != new_val:
-                    diff[col] = new_val
-            if diff:
-                changed += update_expense(user_id, int(eid), diff)
-        st.success(f"تم حفظ {changed} تعديلًا ✅")
+        # فرق متجهي بين الجدولين ثم كتابة جماعية في معاملة واحدة
+        stats = save_editor_changes(user_id, df_view, edited)
+        st.success(f"تم حفظ {stats['updated']} تعديلًا وإضافة {stats['inserted']} سجلًا ✅")
+        if stats["errors"]:
+            st.warning("تم تجاهل قيم غير صالحة:\n\n" + "\n".join(stats["errors"][:10]))
         st.rerun()
 
-    ids = edited["id"].tolist()
+    ids = edited["id"].dropna().tolist() + df_all.loc[archived, "id"].tolist()
     sel_to_delete = st.multiselect("اختر للحذف", ids)
     if st.button("🗑️ حذف المحدد"):
         deleted = delete_expenses(user_id, sel_to_delete)
@@ -231,24 +438,71 @@ def data_tab(user_id: int, df_all: pd.DataFrame):
         st.rerun()
 
 # ========== Main ==========
+PERF_HISTORY = 20
+
+def perf_tab(history: list):
+    """تبويب مخفي للمشرفين: spans آخر إعادة تشغيل + مئينات العملية كلها."""
+    last = history[-1]
+    st.metric("زمن آخر إعادة تشغيل", f"{last['ms']:.0f} ms")
+    spans = pd.DataFrame(last["spans"])
+    if not spans.empty:
+        spans["name"] = [" " * d + n for d, n in zip(spans["depth"], spans["name"])]
+        st.dataframe(spans[["name", "ms", "rows"]], use_container_width=True, hide_index=True)
+    st.line_chart(pd.DataFrame({"ms": [h["ms"] for h in history]}))
+
+    st.subheader("المئينات منذ بدء العملية")
+    stats = perf.snapshot()
+    if stats:
+        st.dataframe(pd.DataFrame.from_dict(stats, orient="index").round(2), use_container_width=True)
+    c1, c2, c3 = st.columns(3)
+    if c1.button("تصدير JSON", use_container_width=True):
+        st.caption(str(perf.export("json")))
+    if c2.button("تصدير Prometheus", use_container_width=True):
+        st.caption(str(perf.export("prometheus")))
+    if c3.button("تصفير العدادات", use_container_width=True):
+        perf.reset()
+
+    st.subheader("المهام الخلفية")
+    recent = jobs.job_status(limit=20)
+    if recent:
+        st.dataframe(pd.DataFrame(recent), use_container_width=True, hide_index=True)
+
 def main():
     init_db()
-    if "user_id" not in st.session_state:
+    # عمال التوقع/الشذوذ في الخلفية (مرة واحدة لكل عملية)
+    jobs.start()
+    # رمز الجلسة يُتحقق منه من ذاكرة مؤقتة قصيرة، لا من جدول المستخدمين في كل إعادة تشغيل
+    session = validate_session(st.session_state.get("session_token"))
+    if session is None:
+        for key in ("session_token", "user_id", "username"):
+            st.session_state.pop(key, None)
         login_ui()
         return
 
-    user_id = st.session_state["user_id"]
+    user_id = session["user_id"]
+    st.session_state["user_id"] = user_id
+    st.session_state["username"] = session["username"]
     sidebar_controls(user_id)
 
-    rows_all = list_expenses(user_id, limit=10_000)
-    df_all = pd.DataFrame(rows_all)
-
-    tabs = st.tabs(["📊 اللوحة", "🤖 التنبؤ", "🚨 غير الاعتيادية", "🧮 المُحسّن", "🗂️ البيانات"])
-    with tabs[0]: dashboard_tab(df_all)
-    with tabs[1]: forecast_tab(df_all)
-    with tabs[2]: anomalies_tab(df_all)
-    with tabs[3]: optimizer_tab(df_all, user_id)
-    with tabs[4]: data_tab(user_id, df_all)
+    admin = session["username"] in ADMIN_USERS
+    names = ["📊 اللوحة", "🤖 التنبؤ", "🚨 غير الاعتيادية", "🧮 المُحسّن", "🗂️ البيانات"]
+    with perf.trace() as spans, perf.span("app.rerun") as rerun:
+        # قراءة واحدة بالمفتاح الأساسي لكل إعادة تشغيل؛ كل ما عداها من الذاكرة المؤقتة
+        version = get_data_version(user_id)
+        df_all = load_expenses_df(user_id, version)
+
+        tabs = st.tabs(names + (["⏱️ الأداء"] if admin else []))
+        with tabs[0]: dashboard_tab(user_id, version)
+        with tabs[1]: forecast_tab(df_all, user_id, version)
+        with tabs[2]: anomalies_tab(df_all, user_id, version)
+        with tabs[3]: optimizer_tab(df_all, user_id, version)
+        with tabs[4]: data_tab(user_id, version)
+
+    if admin:
+        history = st.session_state.setdefault("perf_reruns", [])
+        history.append({"ms": rerun.seconds * 1000, "spans": spans})
+        del history[:-PERF_HISTORY]
+        with tabs[5]: perf_tab(history)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,432 @@
+# archive.py
+"""
+أرشفة الأشهر المغلقة: صفوف كل (مستخدم، شهر) أقدم من ARCHIVE_KEEP_MONTHS تُنقل من
+expenses إلى ملف Parquet مضغوط (zstd) تحت ARCHIVE_DIR/user_id=<id>/month=<YYYY-MM>/،
+ويُسجَّل القسم في archive_partitions. فيبقى جدول expenses وفهارسه بحجم الأشهر الحديثة.
+
+- التجميعات (daily_totals / monthly_totals) لا تتغير عند الأرشفة (جدول maintenance
+  يوقف trigger الحذف داخل معاملتها)، فاللوحة والتحليلات تغطي كل التاريخ كما هي،
+  وrebuild_rollups لا يعيد بناء الأشهر المؤرشفة.
+- list_expenses / iter_expenses هنا = نفس دوال db مع دمج الأقسام المطابقة فقط
+  (تقليم بالشهر والمبلغ ثم فلاتر داخل الملف)، بنفس الترتيب ومؤشر الصفحات.
+- صفوف الأرشيف لا تُعدَّل؛ عملية بتاريخ قديم تُضاف لاحقًا تبقى حية حتى الأرشفة التالية
+  التي تدمجها في ملف الشهر. البحث النصي (FTS5) يغطي الصفوف الحية فقط.
+- الحذف مدعوم: delete_archived يعيد كتابة ملف القسم ويطرح الصفوف من التجميعات،
+  وdrop_user_archive يمسح أقسام المستخدم كلها (db.clear_all_expenses).
+- compact() يحذف الملفات اليتيمة ويضغط ملفات SQLite (VACUUM) بعد الحذف الكبير.
+"""
+import datetime
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import db
+from perf import timed, no_rows
+from utils import ARCHIVE_DIR
+
+# الشهر الحالي + آخر ARCHIVE_KEEP_MONTHS شهرًا تبقى في SQLite (نافذة الشذوذ 90 يومًا والتوقع)
+ARCHIVE_KEEP_MONTHS = int(os.environ.get("EXPENSES_ARCHIVE_KEEP_MONTHS", "12"))
+ARCHIVE_COMPRESSION = "zstd"
+ARCHIVE_COMPRESSION_LEVEL = 9
+# ملف غير مسجَّل أحدث من هذا قد يخص أرشفة جارية لم تُثبَّت بعد → لا يُحذف
+ARCHIVE_ORPHAN_SECONDS = 3600
+ARCHIVE_COLUMNS = ("id", "user_id", "amount", "category", "payment_method", "date", "note", "created_at")
+# ترتيب أعمدة db.iter_expenses (التصدير)
+EXPORT_COLUMNS = ("id", "amount", "category", "payment_method", "date", "note")
+
+# pyarrow يُحمَّل عند أول قراءة/كتابة للأرشيف فقط
+_pa_modules = None
+
+def _arrow():
+    global _pa_modules
+    if _pa_modules is None:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+        _pa_modules = (pyarrow, pyarrow.compute, pyarrow.parquet)
+    return _pa_modules
+
+def _schema():
+    pa = _arrow()[0]
+    return pa.schema([
+        ("id", pa.int64()), ("user_id", pa.int64()), ("amount", pa.float64()),
+        ("category", pa.string()), ("payment_method", pa.string()), ("date", pa.string()),
+        ("note", pa.string()), ("created_at", pa.string()),
+    ])
+
+# ============= الأقسام =============
+
+def cutoff_month(keep_months: int = ARCHIVE_KEEP_MONTHS, today: Optional[datetime.date] = None) -> str:
+    """أول شهر يبقى حيًا (YYYY-MM)؛ الأشهر قبله مغلقة وقابلة للأرشفة. الشهر الحالي لا يُؤرشف أبدًا."""
+    today = today or datetime.date.today()
+    n = today.year * 12 + today.month - 1 - max(0, keep_months)
+    return f"{n // 12:04d}-{n % 12 + 1:02d}"
+
+def _month_end(month: str) -> str:
+    # أكبر من أي تاريخ YYYY-MM-DD في الشهر عند المقارنة النصية
+    return f"{month}-99"
+
+def partitions(user_id: int, month: Optional[int] = None, year: Optional[int] = None,
+               date_from: Optional[str] = None, date_to: Optional[str] = None,
+               min_amount: Optional[float] = None, max_amount: Optional[float] = None,
+               before: Optional[Tuple[str, int]] = None) -> List[Dict[str, Any]]:
+    """أقسام المستخدم التي قد تحوي صفوفًا مطابقة، من الأحدث للأقدم."""
+    where, params = ["user_id=?"], [user_id]
+    if month is not None and year is not None:
+        where.append("month=?")
+        params.append(f"{year:04d}-{month:02d}")
+    if date_from:
+        where.append("month>=?")
+        params.append(str(date_from)[:7])
+    if date_to:
+        where.append("month<=?")
+        params.append(str(date_to)[:7])
+    if before is not None:
+        where.append("month<=?")
+        params.append(str(before[0])[:7])
+    if min_amount is not None:
+        where.append("max_amount>=?")
+        params.append(float(min_amount))
+    if max_amount is not None:
+        where.append("min_amount<=?")
+        params.append(float(max_amount))
+    with db.get_conn(user_id) as conn:
+        rows = conn.execute(f"SELECT * FROM archive_partitions WHERE {' AND '.join(where)} ORDER BY month DESC",
+                            params).fetchall()
+        return [dict(r) for r in rows]
+
+def _arrow_filter(month: Optional[int] = None, year: Optional[int] = None,
+                  date_from: Optional[str] = None, date_to: Optional[str] = None,
+                  categories: Optional[Iterable[str]] = None,
+                  payment_methods: Optional[Iterable[str]] = None,
+                  min_amount: Optional[float] = None, max_amount: Optional[float] = None,
+                  before: Optional[Tuple[str, int]] = None):
+    # نفس شروط db._expense_filters كتعبير pyarrow (يُقيَّم بإحصاءات row groups ثم على الصفوف)
+    pc = _arrow()[1]
+    field = pc.field
+    cond = pc.scalar(True)
+    if month is not None and year is not None:
+        start, end = db._month_bounds(year, month)
+        cond &= (field("date") >= start) & (field("date") < end)
+    if date_from:
+        cond &= field("date") >= str(date_from)
+    if date_to:
+        cond &= field("date") <= str(date_to)
+    for col, values in (("category", categories), ("payment_method", payment_methods)):
+        if values is not None:
+            cond &= field(col).isin(list(values))
+    if min_amount is not None:
+        cond &= field("amount") >= float(min_amount)
+    if max_amount is not None:
+        cond &= field("amount") <= float(max_amount)
+    if before is not None:
+        d, i = str(before[0]), int(before[1])
+        cond &= (field("date") < d) | ((field("date") == d) & (field("id") < i))
+    return cond
+
+def read_partition(part: Dict[str, Any], columns: Optional[Iterable[str]] = None, filter=None):
+    """جدول pyarrow لقسم واحد (مرتب حسب date, id كما كُتب)."""
+    pq = _arrow()[2]
+    return pq.read_table(ARCHIVE_DIR / part["path"], columns=list(columns) if columns else None,
+                         filters=filter)
+
+def archived_ids(user_id: int) -> set:
+    """أرقام عمليات المستخدم في الأقسام المؤرشفة (عمود id فقط من كل ملف)."""
+    ids: set = set()
+    for part in partitions(user_id):
+        ids.update(read_partition(part, ["id"]).column("id").to_pylist())
+    return ids
+
+# ============= الأرشفة =============
+
+def _write_partition(user_id: int, month: str, table) -> Tuple[str, int]:
+    pq = _arrow()[2]
+    rel = Path(f"user_id={int(user_id)}") / f"month={month}" / f"part-{time.time_ns()}.parquet"
+    path = ARCHIVE_DIR / rel
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(table, tmp, compression=ARCHIVE_COMPRESSION,
+                   compression_level=ARCHIVE_COMPRESSION_LEVEL)
+    tmp.replace(path)
+    return rel.as_posix(), path.stat().st_size
+
+def archive_month(user_id: int, month: str) -> Dict[str, Any]:
+    """
+    ينقل صفوف الشهر الحية إلى قسمه في معاملة واحدة: قراءة → كتابة الملف → تسجيله → حذف الصفوف.
+    قسم موجود يُدمج مع الصفوف الجديدة في ملف جديد، والقديم يُحذف بعد الـ commit.
+    """
+    pa, pc, pq = _arrow()
+    year, mon = int(month[:4]), int(month[5:7])
+    start, end = db._month_bounds(year, mon)
+    written: Optional[Path] = None
+    try:
+        with db.get_conn(user_id) as conn:
+            # الكتابة أولًا تحجز قفل الكتابة: لا تعديل لصفوف الشهر بين قراءتها وحذفها
+            conn.execute("INSERT INTO maintenance(name) VALUES('archive')")
+            cur = conn.cursor()
+            cur.row_factory = None
+            rows = cur.execute(
+                f"""SELECT {', '.join(ARCHIVE_COLUMNS)} FROM expenses
+                    WHERE user_id=? AND date>=? AND date<? ORDER BY date, id""",
+                (user_id, start, end)).fetchall()
+            if not rows:
+                conn.execute("DELETE FROM maintenance WHERE name='archive'")
+                return {"month": month, "rows": 0, "bytes": 0}
+            schema = _schema()
+            table = pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(zip(*rows), schema)],
+                                         schema=schema)
+            prev = conn.execute("SELECT path FROM archive_partitions WHERE user_id=? AND month=?",
+                                (user_id, month)).fetchone()
+            if prev is not None:
+                # الصف الحي أحدث من نسخته المؤرشفة (استيراد بنفس id مثلًا)
+                old = pq.read_table(ARCHIVE_DIR / prev["path"])
+                old = old.filter(pc.invert(pc.is_in(old["id"], value_set=table["id"])))
+                table = pa.concat_tables([old, table]).sort_by([("date", "ascending"), ("id", "ascending")])
+            rel, size = _write_partition(user_id, month, table)
+            written = ARCHIVE_DIR / rel
+            amounts = table["amount"]
+            conn.execute(
+                """INSERT INTO archive_partitions(user_id, month, path, rows, total, min_amount, max_amount,
+                                                  bytes, archived_at)
+                   VALUES(?,?,?,?,?,?,?,?,?)
+                   ON CONFLICT(user_id, month) DO UPDATE SET path=excluded.path, rows=excluded.rows,
+                       total=excluded.total, min_amount=excluded.min_amount, max_amount=excluded.max_amount,
+                       bytes=excluded.bytes, archived_at=excluded.archived_at""",
+                (user_id, month, rel, table.num_rows, pc.sum(amounts).as_py(), pc.min(amounts).as_py(),
+                 pc.max(amounts).as_py(), size, time.time())
+            )
+            moved = conn.execute("DELETE FROM expenses WHERE user_id=? AND date>=? AND date<?",
+                                 (user_id, start, end)).rowcount
+            conn.execute("DELETE FROM maintenance WHERE name='archive'")
+            # مصدر الصفوف الحية تغيّر (load_frame والتوقع) → نبطل ما خُزِّن
+            db._bump_version(conn, user_id)
+    except BaseException:
+        if written is not None:
+            written.unlink(missing_ok=True)
+        raise
+    if prev is not None:
+        (ARCHIVE_DIR / prev["path"]).unlink(missing_ok=True)
+    db._written(user_id, moved)
+    return {"month": month, "rows": moved, "bytes": size}
+
+@timed(rows=lambda r: r["rows"])
+def archive_user(user_id: int, keep_months: int = ARCHIVE_KEEP_MONTHS,
+                 today: Optional[datetime.date] = None) -> Dict[str, Any]:
+    """يؤرشف كل الأشهر المغلقة للمستخدم (شهرًا شهرًا، كل شهر معاملة مستقلة)."""
+    t0 = time.perf_counter()
+    cutoff = cutoff_month(keep_months, today)
+    with db.get_conn(user_id) as conn:
+        months = [r[0] for r in conn.execute(
+            """SELECT DISTINCT substr(date, 1, 7) FROM expenses
+               WHERE user_id=? AND date<? ORDER BY 1""", (user_id, f"{cutoff}-01"))]
+    stats = [archive_month(user_id, m) for m in months]
+    return {"months": len(months), "rows": sum(s["rows"] for s in stats),
+            "bytes": sum(s["bytes"] for s in stats), "seconds": time.perf_counter() - t0}
+
+def archive_all(keep_months: int = ARCHIVE_KEEP_MONTHS,
+                today: Optional[datetime.date] = None) -> Dict[str, Any]:
+    """archive_user لكل مستخدم له صفوف حية في أشهر مغلقة، في كل ملفات البيانات."""
+    t0 = time.perf_counter()
+    cutoff = f"{cutoff_month(keep_months, today)}-01"
+    users: List[int] = []
+    for path in db.iter_shard_paths():
+        with db.shard_conn(path) as conn:
+            users += [r[0] for r in conn.execute(
+                "SELECT DISTINCT user_id FROM expenses WHERE date<? ORDER BY 1", (cutoff,))]
+    stats = [archive_user(uid, keep_months, today) for uid in users]
+    return {"users": len(users), "months": sum(s["months"] for s in stats),
+            "rows": sum(s["rows"] for s in stats), "bytes": sum(s["bytes"] for s in stats),
+            "seconds": time.perf_counter() - t0}
+
+# ============= الحذف =============
+
+# نفس طرح trg_rollup_delete_live لكل صف محذوف من الأرشيف (لا trigger على ملفات Parquet)
+_ROLLUP_REMOVE_SQL = (
+    """UPDATE daily_totals SET total = total - :amount, cnt = cnt - 1
+       WHERE user_id = :user_id AND date = :date AND category = :category AND payment_method = :pm""",
+    """DELETE FROM daily_totals
+       WHERE user_id = :user_id AND date = :date AND category = :category AND payment_method = :pm
+         AND cnt <= 0""",
+    """UPDATE monthly_totals SET total = total - :amount, cnt = cnt - 1
+       WHERE user_id = :user_id AND month = substr(:date, 1, 7) AND category = :category""",
+    """DELETE FROM monthly_totals
+       WHERE user_id = :user_id AND month = substr(:date, 1, 7) AND category = :category AND cnt <= 0""",
+)
+
+def delete_archived(user_id: int, ids: Iterable[int]) -> int:
+    """
+    يحذف عمليات مؤرشفة: كل قسم يحوي بعضها يُعاد كتابته بدونها (أو يُحذف إن فرغ) وتُطرح
+    من التجميعات، في معاملة واحدة. يرجع عدد الصفوف المحذوفة.
+    """
+    ids = {int(i) for i in ids}
+    parts = partitions(user_id) if ids else []
+    if not parts:
+        return 0
+    pa, pc, _ = _arrow()
+    value_set = pa.array(sorted(ids), type=pa.int64())
+    written: List[Path] = []
+    replaced: List[str] = []
+    removed = 0
+    try:
+        with db.get_conn(user_id) as conn:
+            for part in parts:
+                # عمود id وحده أولًا: الأقسام بلا صفوف مطلوبة لا تُقرأ كاملة
+                if not pc.any(pc.is_in(read_partition(part, ["id"])["id"], value_set=value_set)).as_py():
+                    continue
+                table = read_partition(part)
+                hit = pc.is_in(table["id"], value_set=value_set)
+                gone = table.filter(hit)
+                args = [{"user_id": user_id, "amount": r["amount"], "date": r["date"],
+                         "category": r["category"], "pm": r["payment_method"] or ""} for r in gone.to_pylist()]
+                for stmt in _ROLLUP_REMOVE_SQL:
+                    conn.executemany(stmt, args)
+                keep = table.filter(pc.invert(hit))
+                if keep.num_rows:
+                    rel, size = _write_partition(user_id, part["month"], keep)
+                    written.append(ARCHIVE_DIR / rel)
+                    amounts = keep["amount"]
+                    conn.execute(
+                        """UPDATE archive_partitions SET path=?, rows=?, total=?, min_amount=?, max_amount=?,
+                               bytes=? WHERE user_id=? AND month=?""",
+                        (rel, keep.num_rows, pc.sum(amounts).as_py(), pc.min(amounts).as_py(),
+                         pc.max(amounts).as_py(), size, user_id, part["month"]))
+                else:
+                    conn.execute("DELETE FROM archive_partitions WHERE user_id=? AND month=?",
+                                 (user_id, part["month"]))
+                replaced.append(part["path"])
+                removed += gone.num_rows
+            if removed:
+                db._bump_version(conn, user_id)
+    except BaseException:
+        for f in written:
+            f.unlink(missing_ok=True)
+        raise
+    remove_partition_files(replaced)
+    return db._written(user_id, removed)
+
+def drop_user_archive(conn, user_id: int) -> Tuple[int, List[str]]:
+    """
+    داخل معاملة المستدعي: يلغي تسجيل أقسام المستخدم ويمسح تجميعات أشهرها المؤرشفة.
+    يرجع (عدد الصفوف، مسارات الملفات) لتُحذف الملفات بعد الـ commit.
+    """
+    parts = conn.execute("SELECT month, path, rows FROM archive_partitions WHERE user_id=?",
+                         (user_id,)).fetchall()
+    if not parts:
+        return 0, []
+    months = [p["month"] for p in parts]
+    marks = ",".join("?" * len(months))
+    conn.execute(f"DELETE FROM daily_totals WHERE user_id=? AND substr(date, 1, 7) IN ({marks})",
+                 (user_id, *months))
+    conn.execute(f"DELETE FROM monthly_totals WHERE user_id=? AND month IN ({marks})", (user_id, *months))
+    conn.execute("DELETE FROM archive_partitions WHERE user_id=?", (user_id,))
+    return sum(p["rows"] for p in parts), [p["path"] for p in parts]
+
+def remove_partition_files(paths: Iterable[str]) -> None:
+    """يحذف ملفات أقسام لم تعد مسجلة (بعد commit) ومجلداتها إن فرغت."""
+    for rel in paths:
+        f = ARCHIVE_DIR / rel
+        f.unlink(missing_ok=True)
+        for d in (f.parent, f.parent.parent):
+            try:
+                d.rmdir()
+            except OSError:
+                break
+
+# ============= الضغط =============
+
+def _file_size(path: Path) -> int:
+    # الملف الرئيسي + WAL
+    return sum(p.stat().st_size for p in (path, Path(f"{path}-wal")) if p.exists())
+
+@timed(rows=no_rows)
+def compact(vacuum: bool = True, orphan_age: float = ARCHIVE_ORPHAN_SECONDS) -> Dict[str, Any]:
+    """
+    يحذف ملفات الأرشيف غير المسجلة (أرشفة فشلت أو نسخ استُبدلت)، ثم يدمج فهرس البحث
+    ويضغط كل ملف بيانات (checkpoint + VACUUM) لاسترداد مساحة الصفوف المؤرشفة.
+    VACUUM يعيد كتابة الملف ويحجب الكتّاب أثناءه → يُشغَّل في وقت هادئ.
+    """
+    t0 = time.perf_counter()
+    paths = db.iter_shard_paths()
+    referenced = set()
+    for path in paths:
+        with db.shard_conn(path) as conn:
+            referenced.update(r[0] for r in conn.execute("SELECT path FROM archive_partitions"))
+    removed = 0
+    now = time.time()
+    if ARCHIVE_DIR.exists():
+        for f in ARCHIVE_DIR.rglob("part-*"):
+            if f.relative_to(ARCHIVE_DIR).as_posix() not in referenced and now - f.stat().st_mtime > orphan_age:
+                f.unlink(missing_ok=True)
+                removed += 1
+        # مجلدات الأشهر ثم المستخدمين التي فرغت
+        for d in [*ARCHIVE_DIR.glob("*/*"), *ARCHIVE_DIR.glob("*")]:
+            if d.is_dir() and not any(d.iterdir()):
+                d.rmdir()
+
+    before = after = 0
+    for path in paths:
+        before += _file_size(path)
+        with db.shard_conn(path) as conn:
+            conn.execute("INSERT INTO expenses_fts(expenses_fts) VALUES('optimize')")
+        if vacuum:
+            pool = db._pool_for(path)
+            conn = pool.acquire()
+            try:
+                # خارج أي معاملة (VACUUM لا يعمل داخلها)
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.execute("VACUUM")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                pool.release(conn)
+        after += _file_size(path)
+    return {"files_removed": removed, "shards": len(paths), "bytes_before": before,
+            "bytes_after": after, "seconds": time.perf_counter() - t0}
+
+# ============= طبقة الاستعلام الموحدة =============
+
+@timed(name="archive.list_expenses")
+def list_expenses(user_id: int, limit: int = 50,
+                  month: Optional[int] = None, year: Optional[int] = None,
+                  *, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                  categories: Optional[Iterable[str]] = None,
+                  payment_methods: Optional[Iterable[str]] = None,
+                  min_amount: Optional[float] = None, max_amount: Optional[float] = None,
+                  before: Optional[Tuple[str, int]] = None) -> List[Dict[str, Any]]:
+    """
+    مثل db.list_expenses على الصفوف الحية والمؤرشفة معًا. الأقسام تُقرأ من الأحدث للأقدم
+    وتتوقف القراءة متى اكتملت الصفحة بصفوف أحدث من القسم التالي — فالصفحات الحديثة
+    لا تفتح أي ملف Parquet. الصف المؤرشف يحمل archived=True (لا يُعدَّل، يُحذف فقط).
+    """
+    categories = None if categories is None else list(categories)
+    payment_methods = None if payment_methods is None else list(payment_methods)
+    filters = dict(date_from=date_from, date_to=date_to, categories=categories,
+                   payment_methods=payment_methods, min_amount=min_amount, max_amount=max_amount)
+    rows = db.list_expenses(user_id, limit, month, year, before=before, **filters)
+    if categories == [] or payment_methods == []:
+        return rows
+    # صفحة حية كاملة: الأقسام الأقدم من آخر صف فيها لا تدخلها
+    newest = max(str(date_from or ""), rows[-1]["date"]) if len(rows) >= limit else date_from
+    parts = partitions(user_id, month, year, newest, date_to, min_amount, max_amount, before)
+    cond = None
+    for part in parts:
+        if len(rows) >= limit and rows[-1]["date"] > _month_end(part["month"]):
+            break
+        cond = cond if cond is not None else _arrow_filter(month, year, before=before, **filters)
+        table = read_partition(part, ARCHIVE_COLUMNS, cond)
+        seen = {r["id"] for r in rows}
+        rows += [{**r, "archived": True} for r in table.to_pylist() if r["id"] not in seen]
+        rows.sort(key=lambda r: (r["date"], r["id"]), reverse=True)
+        del rows[limit:]
+    return rows
+
+def iter_expenses(user_id: int, chunk_size: int = db.INGEST_CHUNK_SIZE) -> Iterator[List[Tuple[Any, ...]]]:
+    """
+    مثل db.iter_expenses (دفعات (id, amount, category, payment_method, date, note))
+    لكل التاريخ: الأقسام المؤرشفة أولًا من الأقدم ثم الصفوف الحية.
+    """
+    for part in reversed(partitions(user_id)):
+        table = read_partition(part, EXPORT_COLUMNS)
+        for batch in table.to_batches(max_chunksize=chunk_size):
+            yield list(zip(*(col.to_pylist() for col in batch.columns)))
+    yield from db.iter_expenses(user_id, chunk_size)
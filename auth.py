@@ -1,43 +1,13 @@
-import sqlite3
-import hashlib
-from utils import DB_PATH, ensure_dirs
+# auth.py
+# واجهة توافق قديمة: المصادقة كلها صارت في db.py (جدول users واحد بمفتاح id).
+# init_db يحوّل جدول users القديم (username PRIMARY KEY) تلقائيًا عند أول تشغيل.
+from db import (  # noqa: F401
+    init_db, hash_password, check_password, create_user, verify_user,
+    login, login_async, validate_session, revoke_session,
+)
 
-SCHEMA_AUTH = """
-CREATE TABLE IF NOT EXISTS users (
-    username TEXT PRIMARY KEY,
-    password_hash TEXT NOT NULL,
-    created_at TEXT NOT NULL
-);
-"""
-
-def get_conn():
-    ensure_dirs()
-    return sqlite3.connect(DB_PATH)
-
-def init_auth():
-    with get_conn() as conn:
-        conn.execute(SCHEMA_AUTH)
-
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode("utf-8")).hexdigest()
-
-def create_user(username: str, password: str) -> bool:
-    try:
-        with get_conn() as conn:
-            conn.execute(
-                "INSERT INTO users(username, password_hash, created_at) VALUES (?,?,datetime('now'))",
-                (username, hash_password(password))
-            )
-        return True
-    except sqlite3.IntegrityError:
-        return False  # username موجود مسبقاً
+def init_auth() -> None:
+    init_db()
 
 def validate_user(username: str, password: str) -> bool:
-    with get_conn() as conn:
-        row = conn.execute(
-            "SELECT password_hash FROM users WHERE username=?",
-            (username,)
-        ).fetchone()
-        if not row:
-            return False
-        return row[0] == hash_password(password)
+    return verify_user(username, password) is not None
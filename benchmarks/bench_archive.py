@@ -0,0 +1,85 @@
+# benchmarks/bench_archive.py
+"""
+أثر الأرشفة: حجم ملف SQLite وزمن المسارات الساخنة (الصفحة الأولى، صفحة قديمة، فلتر،
+اللوحة، الإضافة) قبل archive_all + compact وبعدهما، لمستخدمين بتاريخ طويل.
+
+    python benchmarks/bench_archive.py --rows 1000000 --users 4 --years 10
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def timed_ms(fn, repeat: int) -> float:
+    fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=1_000_000, help="إجمالي الصفوف على كل المستخدمين")
+    ap.add_argument("--users", type=int, default=4)
+    ap.add_argument("--years", type=int, default=10)
+    ap.add_argument("--keep-months", type=int, default=12)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_archive_")
+    os.environ["EXPENSES_DB_PATH"] = str(Path(tmp) / "expenses.db")
+    import archive
+    import db
+    from analytics import dashboard_data
+    from seed_data import demo_rows
+
+    random.seed(0)
+    db.init_db()
+    uids = []
+    for i in range(args.users):
+        db.create_user(f"__bench_archive_{i}__", "bench")
+        uid = db.verify_user(f"__bench_archive_{i}__", "bench")
+        db.add_expenses_many(uid, demo_rows(args.rows // args.users, days=365 * args.years))
+        uids.append(uid)
+    uid = uids[0]
+    old = (f"{archive.cutoff_month(args.keep_months + 24)}-01", 0)
+
+    def measure() -> dict:
+        return {
+            "file MB": sum(archive._file_size(p) for p in db.iter_shard_paths()) / 1e6,
+            "page 1 ms": timed_ms(lambda: archive.list_expenses(uid, 100), args.repeat),
+            "old page ms": timed_ms(lambda: archive.list_expenses(uid, 100, before=old), args.repeat),
+            "filtered ms": timed_ms(lambda: archive.list_expenses(uid, 100, categories=["صحة"], min_amount=550),
+                                    args.repeat),
+            "dashboard ms": timed_ms(lambda: dashboard_data(uid), args.repeat),
+            "add ms": timed_ms(lambda: db.add_expense(uid, 50.0, "طعام", "بطاقة",
+                                                      time.strftime("%Y-%m-%d"), "bench"), args.repeat),
+        }
+
+    before = measure()
+    stats = archive.archive_all(args.keep_months)
+    print(f"archived {stats['rows']:,} rows / {stats['months']} partitions in {stats['seconds']:.1f}s "
+          f"({stats['rows'] / max(stats['seconds'], 1e-9):,.0f} rows/s, {stats['bytes'] / 1e6:.1f} MB parquet)")
+    comp = archive.compact()
+    print(f"compact: {comp['bytes_before'] / 1e6:.1f} MB -> {comp['bytes_after'] / 1e6:.1f} MB "
+          f"in {comp['seconds']:.1f}s")
+    after = measure()
+
+    print(f"\n{'':<14s} {'before':>10s} {'after':>10s}")
+    for key in before:
+        print(f"{key:<14s} {before[key]:10.2f} {after[key]:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
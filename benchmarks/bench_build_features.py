@@ -0,0 +1,79 @@
+# benchmarks/bench_build_features.py
+"""
+مقارنة build_features المتجهة بالتنفيذ السابق (حلقة groupby + concat).
+
+    python benchmarks/bench_build_features.py --sizes 10000 100000 1000000 --categories 8
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from forecast import build_features, build_daily_features, FEATURES  # noqa: E402
+
+
+def build_features_loop(df: pd.DataFrame) -> pd.DataFrame:
+    """التنفيذ السابق كما هو، للمقارنة فقط."""
+    df = df.copy()
+    df['date'] = pd.to_datetime(df['date'])
+    sort_cols = ['date', 'id'] if 'id' in df.columns else ['date']
+    df = df.sort_values(sort_cols, kind='mergesort')
+    df['month'] = df['date'].dt.month
+    df['dow'] = df['date'].dt.dayofweek
+    df['is_weekend'] = (df['dow'] >= 5).astype(int)
+
+    parts = []
+    for cat, g in df.groupby('category'):
+        g = g.copy()
+        g['lag7'] = g['amount'].shift(7)
+        g['lag14'] = g['amount'].shift(14)
+        g['lag28'] = g['amount'].shift(28)
+        g['roll7'] = g['amount'].rolling(7, min_periods=1).mean()
+        parts.append(g)
+    return pd.concat(parts).fillna(0.0)
+
+
+def synth(n: int, categories: int = 8, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "amount": rng.lognormal(4, 0.8, n).round(2),
+        "category": rng.choice([f"cat{i}" for i in range(categories)], n),
+        "date": (pd.Timestamp("2015-01-01")
+                 + pd.to_timedelta(rng.integers(0, 3650, n), unit="D")).strftime("%Y-%m-%d"),
+    })
+
+
+def _best(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--categories", type=int, default=8)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'rows':>9s} {'loop s':>8s} {'vector s':>8s} {'speedup':>8s} {'daily s':>8s} match")
+    for n in args.sizes:
+        df = synth(n, args.categories)
+        t_old, old = _best(lambda: build_features_loop(df), args.repeat)
+        t_new, new = _best(lambda: build_features(df), args.repeat)
+        t_day, _ = _best(lambda: build_daily_features(df), args.repeat)
+        match = (old.index.equals(new.index)
+                 and np.allclose(old[FEATURES].to_numpy(float), new[FEATURES].to_numpy(float)))
+        print(f"{n:9d} {t_old:8.3f} {t_new:8.3f} {t_old / t_new:8.1f} {t_day:8.3f} {match}")
+
+
+if __name__ == "__main__":
+    main()
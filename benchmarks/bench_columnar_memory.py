@@ -0,0 +1,65 @@
+# benchmarks/bench_columnar_memory.py
+"""
+مقارنة الذاكرة والزمن: المسار السابق (list_expenses → dict لكل صف → DataFrame)
+مقابل المحمّل العمودي (columnar.load_frame). يعمل على قاعدة مؤقتة.
+
+    python benchmarks/bench_columnar_memory.py --sizes 10000 100000 1000000
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("EXPENSES_DB_PATH", str(Path(tempfile.mkdtemp()) / "bench_columnar.db"))
+
+import pandas as pd  # noqa: E402
+
+import db  # noqa: E402
+from columnar import load_frame  # noqa: E402
+from seed_data import demo_rows  # noqa: E402
+
+
+def legacy_frame(user_id: int, n: int) -> pd.DataFrame:
+    return pd.DataFrame(db.list_expenses(user_id, limit=n))
+
+
+def measure(fn):
+    """(الزمن، ذروة الذاكرة أثناء التحميل بالميغابايت، الناتج)."""
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, (peak - base) / 2**20, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = ap.parse_args()
+
+    db.init_db()
+    print(f"{'rows':>9s} {'path':>8s} {'load s':>8s} {'peak MB':>9s} {'frame MB':>9s}")
+    for n in args.sizes:
+        username = f"__bench_columnar_{n}__"
+        db.create_user(username, "bench")
+        uid = db.verify_user(username, "bench")
+        db.clear_all_expenses(uid)
+        db.add_expenses_many(uid, demo_rows(n, days=3650))
+        for name, fn in (("dict", lambda: legacy_frame(uid, n)), ("columnar", lambda: load_frame(uid, n))):
+            elapsed, peak, df = measure(fn)
+            frame_mb = df.memory_usage(deep=True).sum() / 2**20
+            print(f"{n:9d} {name:>8s} {elapsed:8.3f} {peak:9.1f} {frame_mb:9.1f}")
+            del df
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_dashboard.py
+"""
+زمن بيانات لوحة التحكم لمستخدم بعدد كبير من العمليات: analytics.dashboard_data
+(تجميع في SQL على جداول التجميع) مقابل --with-pandas (تحميل التاريخ كاملًا ثم groupby).
+
+    python benchmarks/bench_dashboard.py --rows 1000000 --with-pandas
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ.setdefault("EXPENSES_DB_PATH", str(Path(tempfile.mkdtemp()) / "bench_dashboard.db"))
+
+import pandas as pd  # noqa: E402
+
+import db  # noqa: E402
+from analytics import dashboard_data  # noqa: E402
+from seed_data import demo_rows  # noqa: E402
+
+
+def pandas_dashboard(user_id: int) -> dict:
+    """مسار المقارنة: كل العمليات إلى DataFrame ثم التجميع في pandas."""
+    df = pd.DataFrame(db.list_expenses(user_id, limit=-1))  # LIMIT -1 = بلا حد في SQLite
+    daily = df.groupby("date")["amount"].sum()
+    return {
+        "month_total": df.loc[df["date"].str[:7] == pd.Timestamp.today().strftime("%Y-%m"), "amount"].sum(),
+        "top_category": df.groupby("category")["amount"].sum().idxmax(),
+        "avg_per_day": daily.mean(),
+        "monthly": df.groupby(df["date"].str[:7])["amount"].sum(),
+        "daily": daily,
+    }
+
+
+def _best(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--days", type=int, default=3650, help="مدى التواريخ في البيانات التجريبية")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--with-pandas", action="store_true", help="قياس المسار القديم أيضًا (بطيء)")
+    args = ap.parse_args()
+
+    db.init_db()
+    username = f"__bench_dashboard_{args.rows}__"
+    db.create_user(username, "bench")
+    uid = db.verify_user(username, "bench")
+    with db.get_conn(uid) as conn:
+        have = conn.execute("SELECT COUNT(*) FROM expenses WHERE user_id=?", (uid,)).fetchone()[0]
+    if have != args.rows:
+        db.clear_all_expenses(uid)
+        stats = db.add_expenses_many(uid, demo_rows(args.rows, days=args.days))
+        print(f"seeded {stats['rows']:,} rows in {stats['seconds']:.1f}s")
+
+    t_all, data = _best(lambda: dashboard_data(uid), args.repeat)
+    points = sum(len(data[k]) for k in ("daily", "monthly", "by_cat"))
+    print(f"sql dashboard (all time):      {t_all * 1000:8.1f} ms, {points:,} points")
+    t_run, _ = _best(lambda: dashboard_data(uid, running=True), args.repeat)
+    print(f"sql dashboard (running):       {t_run * 1000:8.1f} ms")
+    last = data["daily"]["date"].iloc[-1]
+    first = str((pd.Timestamp(last) - pd.Timedelta(days=90)).date())
+    t_rng, _ = _best(lambda: dashboard_data(uid, first, last), args.repeat)
+    print(f"sql dashboard (last 90 days):  {t_rng * 1000:8.1f} ms")
+    if args.with_pandas:
+        t_pd, _ = _best(lambda: pandas_dashboard(uid), 1)
+        print(f"pandas dashboard (all time):   {t_pd * 1000:8.1f} ms ({t_pd / t_all:.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
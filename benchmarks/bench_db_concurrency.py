@@ -0,0 +1,116 @@
+# benchmarks/bench_db_concurrency.py
+"""
+قياس التزامن: N خيوط كتابة و M خيوط قراءة على data/expenses.db (أو EXPENSES_DB_PATH).
+
+    python benchmarks/bench_db_concurrency.py --writers 4 --readers 8 --ops 500
+"""
+import argparse
+import random
+import statistics
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import db  # noqa: E402
+
+BENCH_USER = "__bench_concurrency__"
+
+
+def _bench_user_id() -> int:
+    db.create_user(BENCH_USER, "bench")
+    with db.get_conn() as conn:
+        return conn.execute("SELECT id FROM users WHERE username=?", (BENCH_USER,)).fetchone()["id"]
+
+
+def _pct(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run(writers: int, readers: int, ops: int) -> dict:
+    db.init_db()
+    uid = _bench_user_id()
+    cats = ["طعام", "مواصلات", "فواتير", "تسوق"]
+    lat = {"write": [], "read": []}
+    errors = {"write": 0, "read": 0}
+    lock = threading.Lock()
+
+    def writer():
+        local, errs = [], 0
+        for _ in range(ops):
+            t0 = time.perf_counter()
+            try:
+                db.add_expense(uid, round(random.uniform(10, 600), 2), random.choice(cats),
+                               "بطاقة", "2024-01-01", "bench")
+            except sqlite3.OperationalError:
+                errs += 1
+            local.append(time.perf_counter() - t0)
+        with lock:
+            lat["write"].extend(local)
+            errors["write"] += errs
+
+    def reader():
+        local, errs = [], 0
+        for _ in range(ops):
+            t0 = time.perf_counter()
+            try:
+                db.list_expenses(uid, limit=50)
+            except sqlite3.OperationalError:
+                errs += 1
+            local.append(time.perf_counter() - t0)
+        with lock:
+            lat["read"].extend(local)
+            errors["read"] += errs
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    db.clear_all_expenses(uid)
+    with db.get_conn() as conn:
+        conn.execute("DELETE FROM users WHERE id=?", (uid,))
+
+    result = {"writers": writers, "readers": readers, "ops_per_thread": ops,
+              "elapsed_s": round(elapsed, 3)}
+    for kind in ("write", "read"):
+        xs = lat[kind]
+        result[kind] = {
+            "ops": len(xs),
+            "ops_per_s": round(len(xs) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(_pct(xs, 0.50) * 1000, 3),
+            "p95_ms": round(_pct(xs, 0.95) * 1000, 3),
+            "mean_ms": round(statistics.fmean(xs) * 1000, 3) if xs else 0.0,
+            "locked_errors": errors[kind],
+        }
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--writers", type=int, default=4)
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--ops", type=int, default=500)
+    args = ap.parse_args()
+    res = run(args.writers, args.readers, args.ops)
+    print(f"db={db.DB_PATH} writers={res['writers']} readers={res['readers']} "
+          f"ops/thread={res['ops_per_thread']} elapsed={res['elapsed_s']}s")
+    for kind in ("write", "read"):
+        r = res[kind]
+        print(f"  {kind:5s} ops={r['ops']:6d} {r['ops_per_s']:9.1f} ops/s  p50={r['p50_ms']}ms "
+              f"p95={r['p95_ms']}ms  locked={r['locked_errors']}")
+    db.close_db()
+
+
+if __name__ == "__main__":
+    main()
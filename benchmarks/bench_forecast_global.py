@@ -0,0 +1,121 @@
+# benchmarks/bench_forecast_global.py
+"""
+النموذج العام متعدد الآفاق مقابل نموذج لكل تصنيف (train_and_forecast_per_category):
+اختبار رجعي على آخر --horizon يومًا لمستخدمين اصطناعيين بمستويات صرف مختلفة وتصنيفات
+نادرة، ثم الدقة (WAPE الشهري، MAE اليومي) وزمن التدريب والتوقع لكل طريقة.
+
+    python benchmarks/bench_forecast_global.py --users 20 --days 400
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+# (احتمال عملية في اليوم، متوسط المبلغ، أثر عطلة الأسبوع)
+PROFILES = {
+    "طعام": (0.9, 45, 1.4), "مواصلات": (0.7, 25, 0.6), "فواتير": (0.04, 350, 1.0),
+    "تسوق": (0.25, 180, 1.8), "صحة": (0.05, 120, 1.0), "تعليم": (0.03, 400, 0.8),
+    "ترفيه": (0.15, 90, 2.2), "أخرى": (0.1, 60, 1.0),
+}
+# تصنيفات أقل من هذا العدد من العمليات قبل نقطة القطع تُعدّ نادرة في التقرير
+SPARSE_ROWS = 40
+
+
+def synthetic(users: int, days: int, seed: int = 0) -> pd.DataFrame:
+    """(id, user_id, amount, category, date): موسمية أسبوعية واتجاه خفيف ومقياس لكل مستخدم."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=pd.Timestamp("2025-06-30"), periods=days, freq="D")
+    weekend = np.asarray(dates.dayofweek >= 4)
+    frames = []
+    for uid in range(1, users + 1):
+        scale = rng.lognormal(0, 0.7)
+        trend = 1 + rng.normal(0, 0.3) * np.arange(days) / days
+        for cat, (p, mean, wk) in PROFILES.items():
+            p_user = min(1.0, p * rng.uniform(0.3, 1.5))
+            mult = np.where(weekend, wk, 1.0) * trend
+            hit = rng.random(days) < np.minimum(1.0, p_user * mult)
+            amount = rng.gamma(4, mean * scale / 4, days) * mult
+            frames.append(pd.DataFrame({"user_id": uid, "category": cat,
+                                        "date": dates[hit], "amount": amount[hit].round(2)}))
+    df = pd.concat(frames, ignore_index=True)
+    df["id"] = np.arange(1, len(df) + 1)
+    return df
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--days", type=int, default=400)
+    ap.add_argument("--horizon", type=int, default=30)
+    args = ap.parse_args()
+
+    import forecast
+
+    if forecast._xgb() is None:
+        sys.exit("xgboost is required for this benchmark")
+    df = synthetic(args.users, args.days)
+    cutoff = df["date"].max() - pd.Timedelta(days=args.horizon)
+    train, test = df[df["date"] <= cutoff], df[df["date"] > cutoff]
+    print(f"{len(df):,} rows, {args.users} users, cutoff {cutoff.date()}, horizon {args.horizon} days")
+
+    # الحقيقة: مسار يومي لكل (مستخدم، تصنيف) ظهر قبل القطع
+    keys = train[["user_id", "category"]].drop_duplicates()
+    days = pd.date_range(cutoff + pd.Timedelta(days=1), periods=args.horizon, freq="D")
+    actual = (test.groupby(["user_id", "category", "date"])["amount"].sum()
+              .unstack("date").reindex(columns=days, fill_value=0.0))
+    actual = actual.reindex(pd.MultiIndex.from_frame(keys)).fillna(0.0)
+    counts = train.groupby(["user_id", "category"]).size().reindex(actual.index)
+    sparse = (counts < SPARSE_ROWS).to_numpy()
+
+    # نموذج لكل تصنيف: تدريب لكل مستخدم، والمسار = التوقع اليومي ثابتًا
+    t0 = time.perf_counter()
+    per_cat = {}
+    for uid, g in train.groupby("user_id"):
+        preds = forecast.train_and_forecast_per_category(g[["id", "amount", "category", "date"]], user_id=None)
+        per_cat.update({(uid, c): v for c, v in preds.items()})
+    per_cat_s = time.perf_counter() - t0
+    p_cat = np.array([[per_cat.get(k, 0.0)] * args.horizon for k in actual.index])
+
+    # النموذج العام: تدريب واحد على كل السلاسل اليومية ثم predict واحد لكل المستخدمين
+    daily = train.groupby(["user_id", "category", "date"], as_index=False)["amount"].sum()
+    t0 = time.perf_counter()
+    entry = forecast.train_global_model(daily, horizon=args.horizon)
+    global_train_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    paths = forecast.predict_paths(entry, daily, args.horizon)
+    global_predict_s = time.perf_counter() - t0
+    one_user = daily[daily["user_id"] == 1]
+    t0 = time.perf_counter()
+    forecast.predict_paths(entry, one_user, args.horizon)
+    user_predict_s = time.perf_counter() - t0
+    p_glob = np.array([paths.get(k, np.zeros(args.horizon)) for k in actual.index])
+
+    y = actual.to_numpy()
+
+    def metrics(pred, mask):
+        m_pred, m_act = pred[mask].sum(axis=1), y[mask].sum(axis=1)
+        wape = np.abs(m_pred - m_act).sum() / max(m_act.sum(), 1e-9)
+        return wape, np.abs(pred[mask] - y[mask]).mean()
+
+    print(f"\n{'series':<10s} {'n':>5s} {'per-cat WAPE':>13s} {'global WAPE':>12s} "
+          f"{'per-cat MAE':>12s} {'global MAE':>11s}")
+    for label, mask in (("all", np.ones(len(y), bool)), ("dense", ~sparse), ("sparse", sparse)):
+        if not mask.any():
+            continue
+        (wc, mc), (wg, mg) = metrics(p_cat, mask), metrics(p_glob, mask)
+        print(f"{label:<10s} {mask.sum():5d} {wc:13.1%} {wg:12.1%} {mc:12.1f} {mg:11.1f}")
+
+    print(f"\nper-category: train+predict {per_cat_s:.2f}s for {args.users} users "
+          f"({per_cat_s / args.users * 1000:.0f} ms/user)")
+    print(f"global:       train {global_train_s:.2f}s once ({entry['rows']:,} rows, {entry['series']} series), "
+          f"predict all {global_predict_s * 1000:.0f} ms, one user {user_predict_s * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
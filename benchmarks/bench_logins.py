@@ -0,0 +1,86 @@
+# benchmarks/bench_logins.py
+"""
+عدد عمليات الدخول في الثانية بكلفة PBKDF2 معطاة، ومقارنتها بالتحقق من رمز الجلسة.
+كل كلفة تُقاس في عملية مستقلة (EXPENSES_PBKDF2_ITERATIONS) وقاعدة مؤقتة.
+
+    python benchmarks/bench_logins.py --iterations 50000 200000 600000 --logins 40 --clients 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def worker(logins: int, clients: int) -> dict:
+    """يعمل داخل العملية الفرعية؛ الكلفة ومسار القاعدة من متغيرات البيئة."""
+    import db
+
+    db.init_db()
+    db.create_user("__bench_login__", "bench-password")
+
+    t0 = time.perf_counter()
+    for _ in range(logins):
+        db.verify_user("__bench_login__", "bench-password")
+    serial = logins / (time.perf_counter() - t0)
+
+    # عملاء متزامنون كجلسات Streamlit مختلفة؛ الاشتقاق نفسه في مجمّع المصادقة
+    with ThreadPoolExecutor(max_workers=clients) as ex:
+        t0 = time.perf_counter()
+        sessions = list(ex.map(lambda _: db.login_async("__bench_login__", "bench-password").result(), range(logins)))
+        concurrent = logins / (time.perf_counter() - t0)
+
+    token = sessions[0]["token"]
+    n = 20_000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        db.validate_session(token)
+    cached = n / (time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    for s in sessions:
+        db._session_cache.clear()
+        db.validate_session(s["token"])
+    uncached = len(sessions) / (time.perf_counter() - t0)
+    return {"serial": serial, "concurrent": concurrent, "session_cached": cached, "session_db": uncached}
+
+
+def measure(iterations: int, logins: int, clients: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, EXPENSES_DB_PATH=str(Path(tmp) / "expenses.db"),
+                   EXPENSES_PBKDF2_ITERATIONS=str(iterations))
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", "--logins", str(logins), "--clients", str(clients)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--iterations", type=int, nargs="+", default=[50_000, 200_000, 600_000])
+    ap.add_argument("--logins", type=int, default=40)
+    ap.add_argument("--clients", type=int, default=4)
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.logins, args.clients)))
+        return
+
+    print(f"{'iterations':>10s} {'login/s':>9s} {f'x{args.clients} /s':>9s} {'ms/login':>9s} "
+          f"{'token/s (cache)':>16s} {'token/s (db)':>13s}")
+    for it in args.iterations:
+        r = measure(it, args.logins, args.clients)
+        print(f"{it:10d} {r['serial']:9.1f} {r['concurrent']:9.1f} {1000 / r['serial']:9.1f} "
+              f"{r['session_cached']:16,.0f} {r['session_db']:13,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_parallel_training.py
+"""
+تسريع تدريب نماذج التصنيفات بالتوازي مقابل عدد التصنيفات وعدد الصفوف لكل تصنيف.
+
+    python benchmarks/bench_parallel_training.py --categories 4 8 16 --rows 200 2000 --workers 4
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import parallel  # noqa: E402
+from anomalies import detect_anomalies  # noqa: E402
+from forecast import train_and_forecast_per_category  # noqa: E402
+
+
+def synth(categories: int, rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n = categories * rows
+    days = rng.integers(0, 365, n)
+    return pd.DataFrame({
+        "id": np.arange(n),
+        "amount": rng.lognormal(4, 0.8, n).round(2),
+        "category": np.repeat([f"cat{i:02d}" for i in range(categories)], rows),
+        "date": pd.Timestamp("2024-01-01") + pd.to_timedelta(days, unit="D"),
+    })
+
+
+def _time(fn, repeat: int):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--categories", type=int, nargs="+", default=[4, 8, 16])
+    ap.add_argument("--rows", type=int, nargs="+", default=[200, 2000])
+    ap.add_argument("--workers", type=int, default=parallel.DEFAULT_WORKERS)
+    ap.add_argument("--repeat", type=int, default=2)
+    args = ap.parse_args()
+
+    jobs = {
+        "forecast": lambda df, b: train_and_forecast_per_category(df, backend=b, workers=args.workers),
+        "anomalies": lambda df, b: detect_anomalies(df, window_days=10_000, backend=b, workers=args.workers),
+    }
+    print(f"workers={args.workers}")
+    print(f"{'job':10s} {'cats':>5s} {'rows/cat':>8s} {'serial':>8s} {'thread':>8s} {'process':>8s} "
+          f"{'x thread':>8s} {'x proc':>8s} same")
+    for name, job in jobs.items():
+        for cats in args.categories:
+            for rows in args.rows:
+                df = synth(cats, rows)
+                res = {}
+                for backend in parallel.BACKENDS:
+                    job(df, backend)  # تسخين المجمّع
+                    res[backend] = _time(lambda: job(df, backend), args.repeat)
+                base = res["serial"][1]
+                same = all(
+                    (r[1].equals(base) if isinstance(base, pd.DataFrame) else r[1] == base)
+                    for r in res.values()
+                )
+                ts, tt, tp = (res[b][0] for b in parallel.BACKENDS)
+                print(f"{name:10s} {cats:5d} {rows:8d} {ts:8.3f} {tt:8.3f} {tp:8.3f} "
+                      f"{ts / tt:8.2f} {ts / tp:8.2f} {same}")
+    parallel.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/bench_search.py
+"""
+زمن البحث في الملاحظات: search_expenses (FTS5 + bm25) مقابل مسح LIKE '%نص%'،
+وكلفة الفهرس على الإدخال الجماعي. القاعدة مؤقتة؛ المستخدم المقاس واحد من --users.
+
+    python benchmarks/bench_search.py --rows 1000000 --users 10 --repeat 20
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+MERCHANTS = ["ستاربكس", "الدانوب", "بنده", "كارفور", "هرفي", "البيك", "جرير", "اكسترا", "نون", "أمازون",
+             "صيدلية النهدي", "محطة ساسكو", "أوبر", "كريم", "مطعم الرومانسية", "نتفلكس", "stc", "موبايلي"]
+WORDS = ["قهوة", "سوبرماركت", "أجرة", "فاتورة", "مطعم", "ملابس", "عشاء", "غداء", "فطور", "هدية",
+         "اشتراك", "وقود", "دواء", "كتب", "شحن", "إنترنت", "كهرباء", "ماء", "صيانة", "تذكرة"]
+QUERIES = ["قهوة", "ستاربكس", "قهوه ستاربكس", "صيدل", "فاتورة كهرباء", "netflix"]
+
+
+def rows(n: int):
+    from utils import CATEGORIES, PAYMENT_METHODS
+
+    for i in range(n):
+        note = "" if i % 5 == 0 else f"{random.choice(WORDS)} {random.choice(MERCHANTS)}"
+        day = f"20{15 + i % 10}-{1 + i % 12:02d}-{1 + i % 28:02d}"
+        yield (round(random.uniform(5, 800), 2), random.choice(CATEGORIES), random.choice(PAYMENT_METHODS), day, note)
+
+
+def timed_ms(fn, repeat: int) -> float:
+    fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=1_000_000, help="إجمالي الصفوف على كل المستخدمين")
+    ap.add_argument("--users", type=int, default=10)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_search_")
+    os.environ["EXPENSES_DB_PATH"] = str(Path(tmp) / "expenses.db")
+    import db
+
+    random.seed(0)
+    db.init_db()
+    uids = []
+    per_user = args.rows // args.users
+    t0 = time.perf_counter()
+    for i in range(args.users):
+        db.create_user(f"__bench_search_{i}__", "bench")
+        uid = db.verify_user(f"__bench_search_{i}__", "bench")
+        db.add_expenses_many(uid, rows(per_user))
+        uids.append(uid)
+    elapsed = time.perf_counter() - t0
+    print(f"ingest {per_user * args.users:,} rows with FTS triggers: {per_user * args.users / elapsed:,.0f} rows/s")
+
+    uid = uids[len(uids) // 2]
+
+    def like(text):
+        with db.get_conn(uid) as conn:
+            return conn.execute("SELECT * FROM expenses WHERE user_id=? AND note LIKE ? "
+                                "ORDER BY date DESC, id DESC LIMIT 50", (uid, f"%{text}%")).fetchall()
+
+    print(f"{'query':<16s} {'hits/50':>8s} {'fts ms':>8s} {'+filters':>9s} {'page 5':>8s} {'LIKE ms':>8s}")
+    for text in QUERIES:
+        hits = len(db.search_expenses(uid, text, limit=50))
+        fts = timed_ms(lambda: db.search_expenses(uid, text, limit=50), args.repeat)
+        filt = timed_ms(lambda: db.search_expenses(uid, text, limit=50, categories=["طعام"],
+                                                   date_from="2020-01-01"), args.repeat)
+        page = timed_ms(lambda: db.search_expenses(uid, text, limit=50, offset=200), args.repeat)
+        scan = timed_ms(lambda: like(text), max(3, args.repeat // 5))
+        print(f"{text:<16s} {hits:8d} {fts:8.2f} {filt:9.2f} {page:8.2f} {scan:8.2f}")
+
+    stats = db.rebuild_search_index()
+    print(f"rebuild + optimize: {stats['rows']:,} notes in {stats['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_shard_writes.py
+"""
+اختبار حمل للكتابة: K مستخدمين متزامنين (خيط أو عملية لكل مستخدم) يضيف كل منهم عمليات
+بـ add_expense، في كل وضع تقسيم (off | hash | user). كل قياس في عملية مستقلة
+وقاعدة مؤقتة جديدة، والناتج إجمالي الكتابات في الثانية.
+
+    python benchmarks/bench_shard_writes.py --users 1 2 4 8 --ops 300 --modes off hash user [--processes]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+def _write_ops(task) -> list:
+    # دالة على مستوى الوحدة لتكون قابلة لـ pickle مع ProcessPoolExecutor
+    import db
+
+    uid, ops = task
+    local = []
+    for i in range(ops):
+        t0 = time.perf_counter()
+        db.add_expense(uid, 10.0 + i % 500, "طعام", "بطاقة", "2024-01-01", "bench")
+        local.append(time.perf_counter() - t0)
+    return local
+
+
+def worker(users: int, ops: int, processes: bool) -> dict:
+    """يعمل داخل العملية الفرعية؛ الوضع ومسار القاعدة من متغيرات البيئة."""
+    import db
+
+    db.init_db()
+    uids = []
+    for i in range(users):
+        db.create_user(f"__bench_shard_{i}__", "bench")
+        uids.append(db.verify_user(f"__bench_shard_{i}__", "bench"))
+    for uid in uids:  # تهيئة ملفات الأجزاء خارج القياس
+        db.get_data_version(uid)
+
+    tasks = [(uid, ops) for uid in uids]
+    Executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with Executor(max_workers=users) as ex:
+        if processes:  # بدء العمليات خارج القياس
+            list(ex.map(time.sleep, [0.05] * users))
+        t0 = time.perf_counter()
+        latencies = [x for part in ex.map(_write_ops, tasks) for x in part]
+        elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {"writes": len(latencies), "elapsed_s": elapsed,
+            "writes_per_s": len(latencies) / elapsed,
+            "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000}
+
+
+def measure(mode: str, users: int, ops: int, buckets: int, processes: bool) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, EXPENSES_DB_PATH=str(Path(tmp) / "expenses.db"),
+                   EXPENSES_SHARD_MODE=mode, EXPENSES_SHARD_BUCKETS=str(buckets))
+        out = subprocess.run(
+            [sys.executable, __file__, "--worker", "--users", str(users), "--ops", str(ops)]
+            + (["--processes"] if processes else []),
+            env=env, capture_output=True, text=True, check=True,
+        )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--ops", type=int, default=300, help="عمليات لكل مستخدم")
+    ap.add_argument("--modes", nargs="+", default=["off", "hash", "user"], choices=["off", "hash", "user"])
+    ap.add_argument("--buckets", type=int, default=16)
+    ap.add_argument("--processes", action="store_true",
+                    help="عملية لكل مستخدم بدل خيط (كعدة نسخ من التطبيق على نفس البيانات)")
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.users[0], args.ops, args.processes)))
+        return
+
+    print(f"{'mode':>5s} {'users':>6s} {'writes/s':>10s} {'p99 ms':>8s} {'scaling':>8s}")
+    for mode in args.modes:
+        base = None
+        for k in args.users:
+            r = measure(mode, k, args.ops, args.buckets, args.processes)
+            base = base or r["writes_per_s"]
+            print(f"{mode:>5s} {k:6d} {r['writes_per_s']:10.0f} {r['p99_ms']:8.1f} {r['writes_per_s'] / base:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
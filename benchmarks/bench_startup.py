@@ -0,0 +1,116 @@
+# benchmarks/bench_startup.py
+"""
+قياس زمن الإقلاع البارد حتى ظهور شاشة الدخول، مع تقرير -X importtime.
+
+    python benchmarks/bench_startup.py                      # تقرير + قياس
+    python benchmarks/bench_startup.py --budget-ms 1500     # يفشل (exit 1) إذا تجاوز الميزانية
+    python benchmarks/bench_startup.py --save-baseline      # يحفظ القياس الحالي كمرجع
+    python benchmarks/bench_startup.py --max-regression 0.25
+
+يفشل أيضًا إذا حُمِّلت أي مكتبة ثقيلة (xgboost / sklearn / pulp ...) قبل الدخول.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+BASELINE = Path(__file__).resolve().parent / "baselines" / "startup.json"
+# لا يجوز تحميلها قبل فتح تبويب يحتاجها
+HEAVY_MODULES = ["xgboost", "sklearn", "pulp", "plotly.express", "pandas", "pyarrow",
+                 "forecast", "anomalies", "optimizer"]
+
+# يُشغَّل في عملية جديدة في كل مرة ليكون الإقلاع باردًا فعلًا
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+t1 = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+at.run()
+t2 = time.perf_counter()
+assert not at.exception, at.exception
+assert at.title and "تسجيل الدخول" in at.title[0].value, "login screen did not render"
+heavy = [m for m in json.loads(sys.argv[2]) if m in sys.modules]
+print(json.dumps({"harness_ms": (t1 - t0) * 1000, "login_render_ms": (t2 - t1) * 1000, "heavy_loaded": heavy}))
+"""
+
+
+def importtime_report(top: int):
+    """أثقل الوحدات عند `import app` حسب الزمن التراكمي من -X importtime."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                          cwd=ROOT, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cum_us, name = (p.strip(" ") for p in line[len("import time:"):].split("|", 2))
+        if not cum_us.isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2  # سطران لكل مستوى تداخل
+        rows.append((int(cum_us), int(self_us), depth, name.strip()))
+    total = next((r[0] for r in rows if r[3] == "app"), 0)
+    return total / 1000, sorted((r for r in rows if r[2] <= 2), reverse=True)[:top]
+
+
+def measure_login(runs: int):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "EXPENSES_DB_PATH": str(Path(tmp) / "startup.db")}
+        for _ in range(runs):
+            proc = subprocess.run([sys.executable, "-c", PROBE, str(ROOT / "app.py"), json.dumps(HEAVY_MODULES)],
+                                  cwd=ROOT, env=env, capture_output=True, text=True)
+            if proc.returncode != 0:
+                raise SystemExit(f"login render failed:\n{proc.stderr}")
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--budget-ms", type=float, default=None, help="حد مطلق لزمن ظهور شاشة الدخول")
+    ap.add_argument("--max-regression", type=float, default=0.25, help="نسبة التراجع المسموحة عن المرجع")
+    ap.add_argument("--save-baseline", action="store_true")
+    args = ap.parse_args()
+
+    total_ms, top = importtime_report(args.top)
+    print(f"import app: {total_ms:.0f} ms (cumulative, -X importtime)")
+    print(f"{'cum ms':>9s} {'self ms':>9s}  module")
+    for cum, self_, depth, name in top:
+        print(f"{cum / 1000:9.1f} {self_ / 1000:9.1f}  {'  ' * depth}{name}")
+
+    results = measure_login(args.runs)
+    login_ms = statistics.median(r["login_render_ms"] for r in results)
+    heavy = sorted({m for r in results for m in r["heavy_loaded"]})
+    print(f"\ntime to first login render: median {login_ms:.0f} ms over {args.runs} cold runs")
+    print(f"heavy modules loaded before login: {heavy or 'none'}")
+
+    failures = []
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+    if args.budget_ms is not None and login_ms > args.budget_ms:
+        failures.append(f"login render {login_ms:.0f} ms > budget {args.budget_ms:.0f} ms")
+    if BASELINE.exists() and not args.save_baseline:
+        base = json.loads(BASELINE.read_text())["login_render_ms"]
+        if login_ms > base * (1 + args.max_regression):
+            failures.append(f"login render {login_ms:.0f} ms regressed > {args.max_regression:.0%} "
+                            f"vs baseline {base:.0f} ms")
+
+    if args.save_baseline:
+        BASELINE.parent.mkdir(parents=True, exist_ok=True)
+        BASELINE.write_text(json.dumps({"login_render_ms": login_ms, "import_app_ms": total_ms}, indent=2) + "\n")
+        print(f"baseline saved to {BASELINE}")
+
+    for f in failures:
+        print(f"FAIL: {f}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
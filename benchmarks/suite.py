@@ -0,0 +1,217 @@
+# benchmarks/suite.py
+"""
+مجموعة قياس للمسارات الساخنة (db / forecast / anomalies / optimizer) مع مراجع JSON.
+
+    python benchmarks/suite.py run                                  # 1k / 100k / 1M صف
+    python benchmarks/suite.py run --sizes 1000 100000 --only db. render
+    python benchmarks/suite.py run --save-baseline                  # benchmarks/baselines/suite.json
+    python benchmarks/suite.py run --output /tmp/now.json
+    python benchmarks/suite.py compare /tmp/now.json [--baseline FILE] [--threshold 0.2]
+
+كل حجم = مستخدم اصطناعي بمولّد seed_demo (بذرة ثابتة، تواريخ على 10 سنوات).
+--data-dir يحتفظ بالقاعدة المولَّدة بين التشغيلات بدل إعادة توليد 1M صف كل مرة.
+compare يرجع exit 1 إذا تباطأ أي قياس بأكثر من --threshold عن المرجع.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+BASELINE = Path(__file__).resolve().parent / "baselines" / "suite.json"
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+SEED_DAYS = 3650
+
+# ============= البيانات الاصطناعية =============
+
+def synthetic_user(size: int, seed: int = 0) -> int:
+    """مستخدم بـ size عملية (يُعاد استخدامه إن وُجد بنفس العدد)."""
+    import db
+    from seed_data import demo_rows
+
+    username = f"__bench_suite_{size}__"
+    db.create_user(username, "bench")
+    uid = db.verify_user(username, "bench")
+    with db.get_conn(uid) as conn:
+        have = conn.execute("SELECT COUNT(*) FROM expenses WHERE user_id=?", (uid,)).fetchone()[0]
+    if have != size:
+        db.clear_all_expenses(uid)
+        random.seed(seed)
+        stats = db.add_expenses_many(uid, demo_rows(size, days=SEED_DAYS))
+        print(f"  seeded {size:,} rows in {stats['seconds']:.1f}s", flush=True)
+    return uid
+
+# ============= المسارات المقاسة =============
+
+def render_headless(uid: int) -> None:
+    """
+    ما يفعله app.main لمستخدم مسجّل (كل التبويبات) بلا واجهة ولا ذاكرة مؤقتة.
+    التوقع والشذوذ يُقرآن من نتائج jobs.py (تدريبهما مقاس في forecast.train / anomalies.detect).
+    """
+    import db
+    import jobs
+    from analytics import dashboard_data
+    from columnar import load_frame
+    from optimizer import optimize_budget, _solve
+
+    version = db.get_data_version(uid)
+    load_frame(uid, limit=10_000)
+    dashboard_data(uid)
+    jobs.latest(uid, "forecast", version)
+    db.get_anomaly_flags(uid, limit=50)
+    jobs.latest(uid, "anomalies", version)
+    _solve.cache_clear()
+    optimize_budget(8000.0, 1000.0, uid)
+    db.list_expenses(uid, limit=100)
+
+
+def hot_paths(uid: int) -> Dict[str, Callable[[], object]]:
+    import db
+    from analytics import dashboard_data
+    from anomalies import detect_anomalies
+    from columnar import load_frame
+    from forecast import build_features, train_and_forecast_per_category
+    from optimizer import optimize_budget, _solve, _unit_allocation
+
+    df = load_frame(uid)
+    last = str(df["date"].max().date())
+
+    def optimize():
+        _solve.cache_clear()
+        _unit_allocation.cache_clear()
+        return optimize_budget(8000.0, 1000.0, uid)
+
+    return {
+        "db.list_expenses": lambda: db.list_expenses(uid, limit=100),
+        "db.list_expenses_filtered": lambda: db.list_expenses(uid, limit=100, categories=["طعام", "تسوق"],
+                                                               min_amount=100, date_to=last),
+        "db.load_frame": lambda: load_frame(uid),
+        "db.dashboard_data": lambda: dashboard_data(uid),
+        "forecast.build_features": lambda: build_features(df[["id", "amount", "category", "date"]]),
+        "forecast.train": lambda: train_and_forecast_per_category(df[["id", "amount", "category", "date"]],
+                                                                 user_id=None),
+        "anomalies.detect": lambda: detect_anomalies(df[["amount", "category", "date"]], window_days=90),
+        "optimizer.optimize_budget": optimize,
+        "render": lambda: render_headless(uid),
+    }
+
+
+def _time(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    fn()  # إحماء: استيرادات كسولة وذاكرة SQLite
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {"median_s": statistics.median(times), "min_s": min(times), "repeat": repeat}
+
+# ============= run / compare =============
+
+def _meta() -> Dict[str, str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "machine": platform.machine(),
+            "cpus": str(os.cpu_count()), "timestamp": datetime.datetime.utcnow().isoformat(timespec="seconds")}
+
+
+def cmd_run(args) -> int:
+    data_dir = Path(args.data_dir or tempfile.mkdtemp(prefix="bench_suite_"))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    os.environ["EXPENSES_DB_PATH"] = str(data_dir / "suite.db")
+    import db
+    import jobs
+
+    db.init_db()
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'benchmark':<40s} {'median ms':>10s} {'min ms':>10s}")
+    for size in args.sizes:
+        uid = synthetic_user(size)
+        jobs.schedule_user(uid, delay=0)
+        jobs.run_pending()  # نتائج الخلفية جاهزة كما في التطبيق بعد انتهاء العمال
+        for name, fn in hot_paths(uid).items():
+            if args.only and not any(o in name for o in args.only):
+                continue
+            key = f"{name}[{size}]"
+            results[key] = _time(fn, args.repeat)
+            print(f"{key:<40s} {results[key]['median_s'] * 1000:10.1f} {results[key]['min_s'] * 1000:10.1f}",
+                  flush=True)
+
+    doc = {"meta": _meta(), "results": results}
+    outputs = [Path(args.output)] if args.output else []
+    if args.save_baseline:
+        outputs.append(BASELINE)
+    for out in outputs:
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(doc, indent=2, ensure_ascii=False) + "\n")
+        print(f"saved {out}")
+    return 0
+
+
+def compare(base: Dict[str, Dict[str, float]], cur: Dict[str, Dict[str, float]],
+            threshold: float, min_delta_ms: float) -> List[str]:
+    """أسماء القياسات التي تباطأت أكثر من threshold (ومن min_delta_ms مطلقًا لتجاهل الضجيج)."""
+    regressions = []
+    print(f"{'benchmark':<40s} {'base ms':>10s} {'now ms':>10s} {'change':>8s}")
+    for key in sorted(set(base) & set(cur)):
+        b, c = base[key]["median_s"], cur[key]["median_s"]
+        change = c / b - 1 if b > 0 else 0.0
+        regressed = change > threshold and (c - b) * 1000 > min_delta_ms
+        mark = "  REGRESSION" if regressed else ("  faster" if change < -threshold else "")
+        print(f"{key:<40s} {b * 1000:10.1f} {c * 1000:10.1f} {change:+8.1%}{mark}")
+        if regressed:
+            regressions.append(key)
+    for key in sorted(set(base) ^ set(cur)):
+        print(f"{key:<40s} {'(only in ' + ('baseline' if key in base else 'current') + ')':>30s}")
+    return regressions
+
+
+def cmd_compare(args) -> int:
+    base = json.loads(Path(args.baseline).read_text())
+    cur = json.loads(Path(args.current).read_text())
+    print(f"baseline {base['meta'].get('commit', '?')}  vs  current {cur['meta'].get('commit', '?')}")
+    regressions = compare(base["results"], cur["results"], args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"FAIL: {len(regressions)} benchmark(s) slower than baseline by > {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="تشغيل القياسات")
+    p.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--only", nargs="+", default=None, help="أجزاء من أسماء القياسات المطلوبة")
+    p.add_argument("--data-dir", default=None, help="مجلد لقاعدة البيانات الاصطناعية (يُعاد استخدامها)")
+    p.add_argument("--output", default=None)
+    p.add_argument("--save-baseline", action="store_true")
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("compare", help="مقارنة نتيجة بالمرجع")
+    p.add_argument("current")
+    p.add_argument("--baseline", default=str(BASELINE))
+    p.add_argument("--threshold", type=float, default=0.20, help="نسبة التباطؤ المسموحة")
+    p.add_argument("--min-delta-ms", type=float, default=1.0, help="تجاهل الفروق الأصغر من هذا")
+    p.set_defaults(func=cmd_compare)
+
+    args = ap.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
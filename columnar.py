@@ -0,0 +1,110 @@
+# columnar.py
+"""
+مخزن عمودي مضغوط لمصاريف المستخدم للتحليل: يُقرأ من المؤشر مباشرة إلى مصفوفات
+NumPy مكتوبة النوع (id int64، amount float64، date datetime64[D]، ورموز صحيحة
+للتصنيف وطريقة الدفع) بدل dict لكل صف ثم DataFrame بأعمدة object.
+قاموس النصوص مشترك بين كل الجلسات في العملية، فكل نص يُخزَّن مرة واحدة.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from db import iter_expense_columns, INGEST_CHUNK_SIZE
+from perf import timed
+from utils import CATEGORIES, PAYMENT_METHODS
+
+CODE_DTYPE = np.int32
+COLUMNS = ("id", "amount", "category", "payment_method", "date")
+
+# ============= القاموس المشترك =============
+
+class Vocabulary:
+    """
+    قاموس نص ↔ رمز يُضاف إليه فقط، فالرمز ثابت طوال عمر العملية ويصلح لكل الجلسات.
+    القراءة بلا قفل؛ الإضافة فقط تحت القفل.
+    """
+
+    def __init__(self, initial: Iterable[str] = ()):
+        self._lock = threading.Lock()
+        self._codes: Dict[str, int] = {}
+        self._values: List[str] = []
+        self._dtypes: Dict[int, pd.CategoricalDtype] = {}
+        for v in initial:
+            self._add(v)
+
+    def _add(self, value: str) -> None:
+        if value not in self._codes:
+            self._codes[value] = len(self._values)
+            self._values.append(value)
+
+    def encode(self, values: List[str]) -> np.ndarray:
+        try:
+            return np.fromiter(map(self._codes.__getitem__, values), dtype=CODE_DTYPE, count=len(values))
+        except KeyError:
+            with self._lock:
+                for v in dict.fromkeys(values):
+                    self._add(v)
+            return np.fromiter(map(self._codes.__getitem__, values), dtype=CODE_DTYPE, count=len(values))
+
+    def dtype(self) -> pd.CategoricalDtype:
+        """نوع pandas الفئوي لكل الرموز الحالية (يُعاد استخدامه ما لم يكبر القاموس)."""
+        with self._lock:
+            n = len(self._values)
+            if n not in self._dtypes:
+                self._dtypes = {n: pd.CategoricalDtype(list(self._values))}
+            return self._dtypes[n]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+CATEGORY_VOCAB = Vocabulary(CATEGORIES)
+PAYMENT_VOCAB = Vocabulary(PAYMENT_METHODS)
+
+# ============= التحميل =============
+
+@timed(rows=lambda cols: len(cols["id"]))
+def load_columns(user_id: int, limit: Optional[int] = None,
+                 chunk_size: int = INGEST_CHUNK_SIZE) -> Dict[str, np.ndarray]:
+    """
+    يقرأ مصاريف المستخدم (مرتبة زمنيًا) دفعةً دفعة إلى مصفوفات مكتوبة النوع.
+    كائنات بايثون تعيش بحجم الدفعة فقط؛ الناتج مصفوفات متجاورة.
+    """
+    parts: Dict[str, List[np.ndarray]] = {c: [] for c in COLUMNS}
+    for chunk in iter_expense_columns(user_id, chunk_size, limit):
+        ids, amounts, cats, pays, days = zip(*chunk)
+        if None in days:
+            # تاريخ لا يفهمه julianday (بيانات قديمة قبل التحقق) → الصف يُتجاهل
+            chunk = [r for r in chunk if r[4] is not None]
+            if not chunk:
+                continue
+            ids, amounts, cats, pays, days = zip(*chunk)
+        parts["id"].append(np.fromiter(ids, dtype=np.int64, count=len(chunk)))
+        parts["amount"].append(np.fromiter(amounts, dtype=np.float64, count=len(chunk)))
+        parts["category"].append(CATEGORY_VOCAB.encode(cats))
+        parts["payment_method"].append(PAYMENT_VOCAB.encode(pays))
+        parts["date"].append(np.fromiter(days, dtype=np.int64, count=len(chunk)).view("datetime64[D]"))
+    empty = {"id": np.int64, "amount": np.float64, "category": CODE_DTYPE,
+             "payment_method": CODE_DTYPE, "date": "datetime64[D]"}
+    return {c: np.concatenate(p) if p else np.empty(0, dtype=empty[c]) for c, p in parts.items()}
+
+@timed()
+def to_frame(cols: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """DataFrame بلا نسخ للنصوص: category/payment_method فئويان على القاموس المشترك."""
+    return pd.DataFrame({
+        "id": cols["id"],
+        "amount": cols["amount"],
+        "category": pd.Categorical.from_codes(cols["category"], dtype=CATEGORY_VOCAB.dtype()),
+        "payment_method": pd.Categorical.from_codes(cols["payment_method"], dtype=PAYMENT_VOCAB.dtype()),
+        "date": cols["date"].astype("datetime64[ns]"),
+    })
+
+def load_frame(user_id: int, limit: Optional[int] = None) -> pd.DataFrame:
+    return to_frame(load_columns(user_id, limit))
+
+def category_totals(cols: Dict[str, np.ndarray]) -> Dict[str, float]:
+    """مجموع المبالغ لكل تصنيف مباشرة من الرموز (bincount) دون DataFrame."""
+    sums = np.bincount(cols["category"], weights=cols["amount"], minlength=len(CATEGORY_VOCAB))
+    values = CATEGORY_VOCAB.dtype().categories
+    return {values[i]: float(sums[i]) for i in np.flatnonzero(sums)}
@@ -0,0 +1,234 @@
+# data_io.py
+import csv
+import datetime
+import io
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, IO, List, Optional, Union
+
+from archive import iter_expenses
+from db import (upsert_expenses_many, add_expenses_many, update_expenses_many,
+                INGEST_CHUNK_SIZE, EXPENSE_FIELDS)
+from utils import CATEGORIES
+
+CSV_COLUMNS = ["amount", "category", "payment_method", "date", "note"]
+EXPORT_COLUMNS = ["id"] + CSV_COLUMNS
+MAX_REPORTED_ERRORS = 100
+
+Source = Union[str, Path, IO]
+
+# ============= التحقق =============
+
+def validate_row(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """يحوّل صفًا خامًا إلى صف صالح للإدخال أو يرمي ValueError."""
+    try:
+        amount = float(raw.get("amount"))
+    except (TypeError, ValueError):
+        raise ValueError(f"amount غير صالح: {raw.get('amount')!r}")
+    if not amount > 0:
+        raise ValueError(f"amount يجب أن يكون أكبر من 0: {amount}")
+
+    category = str(raw.get("category") or "").strip()
+    if not category:
+        raise ValueError("category فارغ")
+
+    date_raw = raw.get("date")
+    if isinstance(date_raw, (datetime.date, datetime.datetime)):
+        date_iso = date_raw.strftime("%Y-%m-%d")
+    else:
+        date_iso = str(date_raw or "").strip()[:10]
+        try:
+            datetime.date.fromisoformat(date_iso)
+        except ValueError:
+            raise ValueError(f"date ليس بصيغة YYYY-MM-DD: {date_raw!r}")
+
+    row = {
+        "amount": amount,
+        "category": category,
+        "payment_method": str(raw.get("payment_method") or "").strip(),
+        "date": date_iso,
+        "note": str(raw.get("note") or "").strip(),
+    }
+    eid = raw.get("id")
+    if eid not in (None, ""):
+        try:
+            row["id"] = int(float(eid))
+        except (TypeError, ValueError):
+            raise ValueError(f"id غير صالح: {eid!r}")
+    return row
+
+def iter_valid_rows(rows: Iterable[Dict[str, Any]], errors: List[str]) -> Iterator[Dict[str, Any]]:
+    """يمرر الصفوف الصالحة فقط ويسجل أول MAX_REPORTED_ERRORS خطأ في errors."""
+    for line_no, raw in enumerate(rows, start=2):  # السطر 1 هو العناوين
+        try:
+            yield validate_row(raw)
+        except ValueError as e:
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f"سطر {line_no}: {e}")
+
+# ============= القراءة =============
+
+def _open_text(source: Source) -> IO[str]:
+    if isinstance(source, (str, Path)):
+        return open(source, newline="", encoding="utf-8-sig")
+    if isinstance(source, io.TextIOBase):
+        return source
+    # ملف ثنائي (مثل st.file_uploader) → نقرأه كنص بدون تحميله كاملًا
+    return io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+
+def iter_csv_rows(source: Source) -> Iterator[Dict[str, Any]]:
+    """يقرأ CSV سطرًا بسطر بالأعمدة: [id?], amount, category, payment_method, date, note?"""
+    f = _open_text(source)
+    try:
+        yield from csv.DictReader(f)
+    finally:
+        if isinstance(source, (str, Path)):
+            f.close()
+        elif isinstance(f, io.TextIOWrapper) and f is not source:
+            f.detach()  # لا نغلق ملف المستدعي
+
+def iter_parquet_rows(source: Source, batch_size: int = INGEST_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """يقرأ Parquet على دفعات (record batches) بدل تحميل الملف كاملًا."""
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(source)
+    for batch in pf.iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+def _detect_format(source: Source, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt.lower()
+    name = str(source) if isinstance(source, (str, Path)) else getattr(source, "name", "")
+    return "parquet" if str(name).lower().endswith((".parquet", ".pq")) else "csv"
+
+def import_file(user_id: int, source: Source, fmt: Optional[str] = None,
+                chunk_size: int = INGEST_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    استيراد متدفق مع تحقق وupsert جماعي: الصفوف التي تحمل id لنفس المستخدم
+    تُحدَّث، والباقي يُضاف. الذاكرة ثابتة بحجم الدفعة.
+    """
+    fmt = _detect_format(source, fmt)
+    raw = iter_parquet_rows(source, chunk_size) if fmt == "parquet" else iter_csv_rows(source)
+    errors: List[str] = []
+    stats: Dict[str, Any] = upsert_expenses_many(user_id, iter_valid_rows(raw, errors), chunk_size=chunk_size)
+    if stats["archived"]:
+        errors.append(f"{stats['archived']} صف لعمليات في أشهر مؤرشفة لم يُستورد (الأشهر المغلقة لا تُعدَّل)")
+    stats["errors"] = errors
+    return stats
+
+def import_csv(user_id: int, source: Source,
+               chunk_size: int = INGEST_CHUNK_SIZE) -> Dict[str, Any]:
+    return import_file(user_id, source, "csv", chunk_size)
+
+# ============= التصدير =============
+
+def export_csv(user_id: int, dest: Source, chunk_size: int = INGEST_CHUNK_SIZE) -> int:
+    """يكتب كل مصاريف المستخدم إلى CSV دفعةً دفعة ويرجع عدد الصفوف."""
+    f = open(dest, "w", newline="", encoding="utf-8-sig") if isinstance(dest, (str, Path)) else dest
+    n = 0
+    try:
+        w = csv.writer(f)
+        w.writerow(EXPORT_COLUMNS)
+        for chunk in iter_expenses(user_id, chunk_size):
+            w.writerows(tuple(r) for r in chunk)
+            n += len(chunk)
+    finally:
+        if f is not dest:
+            f.close()
+    return n
+
+def export_parquet(user_id: int, dest: Source, chunk_size: int = INGEST_CHUNK_SIZE,
+                   compression: str = "zstd") -> int:
+    """يكتب كل دفعة كـ row group مستقل في ملف Parquet ويرجع عدد الصفوف."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()), ("amount", pa.float64()), ("category", pa.string()),
+        ("payment_method", pa.string()), ("date", pa.string()), ("note", pa.string()),
+    ])
+    n = 0
+    with pq.ParquetWriter(dest, schema, compression=compression) as writer:
+        for chunk in iter_expenses(user_id, chunk_size):
+            cols = list(zip(*chunk))
+            writer.write_batch(pa.record_batch([pa.array(c, type=f.type) for c, f in zip(cols, schema)],
+                                               schema=schema))
+            n += len(chunk)
+    return n
+
+def export_file(user_id: int, dest: Source, fmt: str = "csv",
+                chunk_size: int = INGEST_CHUNK_SIZE) -> int:
+    if fmt == "parquet":
+        return export_parquet(user_id, dest, chunk_size)
+    return export_csv(user_id, dest, chunk_size)
+
+# ============= تعديلات محرر الجدول =============
+
+def _py(v: Any) -> Any:
+    # قيم numpy → قيم بايثون يقبلها sqlite3
+    return v.item() if hasattr(v, "item") else v
+
+_CATEGORY_COL = EXPENSE_FIELDS.index("category")
+
+def diff_editor_changes(original, edited) -> Dict[str, Any]:
+    """
+    يقارن جدول المحرر قبل/بعد التعديل عمودًا كاملًا في كل مرة (بلا حلقات على الصفوف).
+    يرجع {"updates": [(id, {عمود: قيمة})], "inserts": [صفوف جديدة صالحة], "errors": [...]}؛
+    الصفوف المحذوفة من المحرر لا تُعامل هنا (الحذف له زر مستقل).
+    """
+    import numpy as np
+    import pandas as pd
+
+    errors: List[str] = []
+    ids = pd.to_numeric(edited["id"], errors="coerce")
+    is_new = ids.isna().to_numpy()
+
+    # صفوف أضيفت بـ num_rows="dynamic": بلا id → إدخال جماعي بعد التحقق
+    fresh = edited.loc[is_new, list(EXPENSE_FIELDS)].astype(object)
+    new_rows = [r for r in fresh.where(fresh.notna(), None).to_dict("records")
+                if any(v not in (None, "") for v in r.values())]
+    inserts = list(iter_valid_rows(new_rows, errors))
+
+    cur = edited.loc[~is_new].set_index(ids[~is_new].astype("int64"))
+    orig = original.set_index(pd.to_numeric(original["id"]).astype("int64")).reindex(cur.index)
+    found = orig["category"].notna().to_numpy() if len(orig) else np.zeros(0, dtype=bool)
+    cur, orig = cur[found], orig[found]
+
+    changed = np.zeros((len(cur), len(EXPENSE_FIELDS)), dtype=bool)
+    for j, col in enumerate(EXPENSE_FIELDS):
+        a, b = orig[col], cur[col]
+        if col == "amount":
+            a, b = pd.to_numeric(a, errors="coerce"), pd.to_numeric(b, errors="coerce")
+        else:
+            a, b = a.fillna("").astype(str), b.fillna("").astype(str)
+            if col == "date":
+                a, b = a.str[:10], b.str[:10]
+        changed[:, j] = ~((a.to_numpy() == b.to_numpy()) | (a.isna().to_numpy() & b.isna().to_numpy()))
+
+    # العمل بعد هذه النقطة يتناسب مع عدد الخلايا المتغيرة فقط
+    updates = []
+    rows, cols = np.nonzero(changed)  # مرتبة حسب الصف
+    values = {col: cur[col].to_numpy(dtype=object) for col in EXPENSE_FIELDS}
+    index = cur.index.to_numpy()
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else rows
+    for i, row_cols in zip(rows[starts], np.split(cols, starts[1:])):
+        # الصف كاملًا يمر بنفس تحقق الإدخال، ثم تُكتب الأعمدة المتغيرة فقط
+        try:
+            valid = validate_row({col: _py(values[col][i]) for col in EXPENSE_FIELDS})
+            # تصنيف غيّره المستخدم يجب أن يكون من القائمة؛ تصنيفات مستوردة قديمة تبقى كما هي
+            if _CATEGORY_COL in row_cols and valid["category"] not in CATEGORIES:
+                raise ValueError(f"category غير معروف: {valid['category']!r}")
+        except ValueError as e:
+            errors.append(f"id {index[i]}: {e}")
+            continue
+        updates.append((int(index[i]), {EXPENSE_FIELDS[j]: valid[EXPENSE_FIELDS[j]] for j in row_cols}))
+    return {"updates": updates, "inserts": inserts, "errors": errors[:MAX_REPORTED_ERRORS]}
+
+def save_editor_changes(user_id: int, original, edited) -> Dict[str, Any]:
+    """يطبق فرق المحرر: كل التحديثات في معاملة واحدة، والصفوف الجديدة إدخال جماعي."""
+    t0 = time.perf_counter()
+    diff = diff_editor_changes(original, edited)
+    updated = update_expenses_many(user_id, diff["updates"])
+    inserted = add_expenses_many(user_id, diff["inserts"])["rows"] if diff["inserts"] else 0
+    return {"updated": updated, "inserted": inserted, "errors": diff["errors"],
+            "seconds": time.perf_counter() - t0}
@@ -1,11 +1,27 @@
 # db.py
+import hmac
+import json
+import logging
+import re
+import secrets
 import sqlite3
-from typing import List, Tuple, Optional, Dict, Any, Iterable
-from datetime import datetime
-from utils import DB_PATH, ensure_dirs
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import List, Tuple, Optional, Dict, Any, Callable, Iterable, Iterator, ContextManager
+from datetime import datetime, timedelta
+from pathlib import Path
+from utils import DB_PATH, SHARD_MODE, SHARD_BUCKETS, SHARD_DIR, PBKDF2_ITERATIONS
+from db_pool import get_pool, close_all
+import online_anomalies
+from perf import timed, no_rows
 import hashlib
 
-SCHEMA_SQL = """
+log = logging.getLogger(__name__)
+
+# فهرس المستخدمين العام (دائمًا في DB_PATH)
+CATALOG_SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT UNIQUE NOT NULL,
@@ -13,6 +29,124 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TEXT NOT NULL
 );
 
+-- جلسات الدخول: يُخزَّن sha256 للرمز فقط، فتسريب الجدول لا يكشف رموزًا صالحة
+CREATE TABLE IF NOT EXISTS sessions (
+    token_hash TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL,
+    FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);
+
+-- طابور المهام الخلفية (jobs.py)؛ الأوقات unix seconds.
+-- صف queued واحد على الأكثر لكل (مستخدم، نوع): تكرار الطلب يؤجّل موعده فقط (debounce)
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',  -- queued | running | done | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT,
+    data_version INTEGER  -- نسخة بيانات المستخدم التي حُسبت عليها آخر محاولة
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_queued ON jobs(user_id, kind) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, run_after);
+"""
+
+# ============= تطبيع النص العربي للبحث =============
+# يُطبّق بنفس الجدول في الـ triggers (replace متداخلة) وعلى نص البحث في بايثون،
+# فـ "أحمد" و"احمد" و"قَهْوَة" و"قهوه" تتطابق. unicode61 يوحّد حالة الأحرف اللاتينية.
+_AR_FOLD = (
+    [(chr(c), "") for c in range(0x064B, 0x0653)]   # التشكيل: تنوين، فتحة ... سكون
+    + [("\u0670", ""), ("\u0640", "")]               # ألف خنجرية، تطويل
+    + [("أ", "ا"), ("إ", "ا"), ("آ", "ا"), ("ى", "ي"), ("ة", "ه")]
+)
+
+def normalize_arabic(text: str) -> str:
+    for src, dst in _AR_FOLD:
+        text = text.replace(src, dst)
+    return text
+
+# علامات الترقيم والرموز الشائعة تصير مسافات عند الفهرسة، فكل كلمة تحمل بادئة مستخدمها
+# (انظر _indexed_sql). ما لم يُذكر هنا (رموز تعبيرية مثلًا) يبقى ملتصقًا ويقسمه unicode61
+# إلى جزء بلا بادئة، وsearch_query يطابق هذه الأجزاء أيضًا.
+_SEPARATORS = ("!\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~\n\t"
+               "،؛؟٪٫٬۔«»“”‘’„‹›…–—•·×÷€£¥")
+# نص البحث يُقسَّم على كل ما ليس حرفًا أو رقمًا، كما يفعل unicode61 ("_" فاصل فيه أيضًا)
+_NON_WORD = re.compile(r"[\W_]+")
+# يتغير مع _SEPARATORS أو _AR_FOLD: triggers بعلامة أخرى تُعاد ويُبنى الفهرس من جديد
+SEARCH_INDEX_VERSION = 2
+
+# replace متداخلة لكل استعلام فرعي: مكدس محلل SQLite يتسع لأربعة مستويات بهذا الحجم تقريبًا
+_REPLACE_DEPTH = 20
+
+def _replace_sql(expr: str, pairs: Iterable[Tuple[str, str]]) -> str:
+    for src, dst in pairs:
+        expr = f"replace({expr}, '{src.replace(chr(39), chr(39) * 2)}', '{dst}')"
+    return expr
+
+def _indexed_sql(note: str, user_id: str) -> str:
+    """
+    تعبير SQL للنص المفهرس: "قهوة ستاربكس" للمستخدم 7 → "u7xقهوه u7xستاربكس".
+    كل مستخدم له مفرداته في الفهرس، فالمطابقة وحساب bm25 يمران على قوائمه فقط
+    مهما كبر الملف. الاستعلامات الفرعية تُبقي عمق replace المتداخلة تحت حد محلل SQLite.
+    SQL خالص بلا دوال بايثون: الكتابة من sqlite3 أو أي أداة أخرى تحدّث الفهرس أيضًا.
+    """
+    tag = f"'u' || {user_id} || 'x'"
+    src = f"(SELECT {_replace_sql(note, _AR_FOLD)} AS f)"
+    seps = [(c, " ") for c in _SEPARATORS]
+    for i in range(0, len(seps), _REPLACE_DEPTH):
+        src = f"(SELECT {_replace_sql('f', seps[i:i + _REPLACE_DEPTH])} AS f FROM {src})"
+    return f"(SELECT {tag} || replace(f, ' ', ' ' || {tag}) FROM {src})"
+
+def _search_terms(text: str) -> List[str]:
+    return [t for t in _NON_WORD.split(normalize_arabic(text or "")) if t]
+
+def _user_term(user_id: int, term: str) -> str:
+    return f"u{int(user_id)}x{term}"
+
+# فهرس FTS5 بلا محتوى (contentless): يخزن الفهرس فقط، والنص الأصلي في expenses.
+# حذف صف من فهرس contentless يتطلب نفس القيم المفهرسة → نفس التعبير في كل trigger.
+SEARCH_SCHEMA_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+    note, content='', tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON expenses
+WHEN IFNULL(NEW.note, '') != '' BEGIN
+    -- search index v{SEARCH_INDEX_VERSION}
+    INSERT INTO expenses_fts(rowid, note) VALUES (NEW.id, {_indexed_sql("NEW.note", "NEW.user_id")});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON expenses
+WHEN IFNULL(OLD.note, '') != '' BEGIN
+    INSERT INTO expenses_fts(expenses_fts, rowid, note)
+    VALUES ('delete', OLD.id, {_indexed_sql("OLD.note", "OLD.user_id")});
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_fts_update AFTER UPDATE OF note, user_id ON expenses BEGIN
+    INSERT INTO expenses_fts(expenses_fts, rowid, note)
+    SELECT 'delete', OLD.id, {_indexed_sql("OLD.note", "OLD.user_id")}
+    WHERE IFNULL(OLD.note, '') != '';
+    INSERT INTO expenses_fts(rowid, note)
+    SELECT NEW.id, {_indexed_sql("NEW.note", "NEW.user_id")}
+    WHERE IFNULL(NEW.note, '') != '';
+END;
+"""
+
+REBUILD_SEARCH_SQL = f"""
+INSERT INTO expenses_fts(expenses_fts) VALUES('delete-all');
+INSERT INTO expenses_fts(rowid, note)
+SELECT id, {_indexed_sql("note", "user_id")} FROM expenses WHERE IFNULL(note, '') != '';
+"""
+
+# بيانات المستخدمين (في DB_PATH نفسه أو في ملف الجزء الخاص بالمستخدم)
+SHARD_SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS expenses (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
@@ -27,74 +161,800 @@ CREATE TABLE IF NOT EXISTS expenses (
 
 CREATE INDEX IF NOT EXISTS idx_date ON expenses(date);
 CREATE INDEX IF NOT EXISTS idx_category ON expenses(category);
-CREATE INDEX IF NOT EXISTS idx_user ON expenses(user_id);
+-- فهرس مركّب يخدم فلترة المستخدم + نطاق التاريخ + ترتيب (date, id) بلا فرز
+CREATE INDEX IF NOT EXISTS idx_user_date_id ON expenses(user_id, date, id);
+-- idx_user صار بادئة مكررة من idx_user_date_id
+DROP INDEX IF EXISTS idx_user;
+
+-- أعمال صيانة جارية؛ الصف يُضاف ويُحذف داخل معاملة الصيانة نفسها، فلا يراه غيرها
+CREATE TABLE IF NOT EXISTS maintenance (
+    name TEXT PRIMARY KEY
+);
+
+-- ============= التجميعات المسبقة (rollups) =============
+-- تُحدَّث تلقائيًا بالـ triggers مع كل إضافة/تعديل/حذف، فتكلفة اللوحة
+-- تتبع عدد الأيام والتصنيفات لا عدد العمليات.
+CREATE TABLE IF NOT EXISTS daily_totals (
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    payment_method TEXT NOT NULL,
+    total REAL NOT NULL,
+    cnt INTEGER NOT NULL,
+    PRIMARY KEY (user_id, date, category, payment_method)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS monthly_totals (
+    user_id INTEGER NOT NULL,
+    month TEXT NOT NULL,       -- YYYY-MM
+    category TEXT NOT NULL,
+    total REAL NOT NULL,
+    cnt INTEGER NOT NULL,
+    PRIMARY KEY (user_id, month, category)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_rollup_insert AFTER INSERT ON expenses BEGIN
+    INSERT INTO daily_totals(user_id, date, category, payment_method, total, cnt)
+    VALUES (NEW.user_id, NEW.date, NEW.category, IFNULL(NEW.payment_method, ''), NEW.amount, 1)
+    ON CONFLICT(user_id, date, category, payment_method)
+    DO UPDATE SET total = total + excluded.total, cnt = cnt + 1;
+    INSERT INTO monthly_totals(user_id, month, category, total, cnt)
+    VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.category, NEW.amount, 1)
+    ON CONFLICT(user_id, month, category)
+    DO UPDATE SET total = total + excluded.total, cnt = cnt + 1;
+END;
+
+-- الحذف عند الأرشفة (archive.py) لا يمس التجميعات: الأشهر المؤرشفة تبقى في اللوحة.
+-- الاسم القديم trg_rollup_delete كان بلا شرط WHEN
+DROP TRIGGER IF EXISTS trg_rollup_delete;
+CREATE TRIGGER IF NOT EXISTS trg_rollup_delete_live AFTER DELETE ON expenses
+WHEN NOT EXISTS (SELECT 1 FROM maintenance WHERE name = 'archive') BEGIN
+    UPDATE daily_totals SET total = total - OLD.amount, cnt = cnt - 1
+    WHERE user_id = OLD.user_id AND date = OLD.date AND category = OLD.category
+      AND payment_method = IFNULL(OLD.payment_method, '');
+    DELETE FROM daily_totals
+    WHERE user_id = OLD.user_id AND date = OLD.date AND category = OLD.category
+      AND payment_method = IFNULL(OLD.payment_method, '') AND cnt <= 0;
+    UPDATE monthly_totals SET total = total - OLD.amount, cnt = cnt - 1
+    WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7) AND category = OLD.category;
+    DELETE FROM monthly_totals
+    WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7) AND category = OLD.category
+      AND cnt <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_rollup_update
+AFTER UPDATE OF user_id, amount, category, payment_method, date ON expenses BEGIN
+    UPDATE daily_totals SET total = total - OLD.amount, cnt = cnt - 1
+    WHERE user_id = OLD.user_id AND date = OLD.date AND category = OLD.category
+      AND payment_method = IFNULL(OLD.payment_method, '');
+    DELETE FROM daily_totals
+    WHERE user_id = OLD.user_id AND date = OLD.date AND category = OLD.category
+      AND payment_method = IFNULL(OLD.payment_method, '') AND cnt <= 0;
+    UPDATE monthly_totals SET total = total - OLD.amount, cnt = cnt - 1
+    WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7) AND category = OLD.category;
+    DELETE FROM monthly_totals
+    WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7) AND category = OLD.category
+      AND cnt <= 0;
+    INSERT INTO daily_totals(user_id, date, category, payment_method, total, cnt)
+    VALUES (NEW.user_id, NEW.date, NEW.category, IFNULL(NEW.payment_method, ''), NEW.amount, 1)
+    ON CONFLICT(user_id, date, category, payment_method)
+    DO UPDATE SET total = total + excluded.total, cnt = cnt + 1;
+    INSERT INTO monthly_totals(user_id, month, category, total, cnt)
+    VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.category, NEW.amount, 1)
+    ON CONFLICT(user_id, month, category)
+    DO UPDATE SET total = total + excluded.total, cnt = cnt + 1;
+END;
+
+-- ============= الكشف الفوري عن الشذوذ =============
+CREATE TABLE IF NOT EXISTS anomaly_state (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    state TEXT NOT NULL,       -- JSON من online_anomalies
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, category)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS anomaly_flags (
+    expense_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    date TEXT NOT NULL,
+    amount REAL NOT NULL,
+    level TEXT NOT NULL,
+    zscore REAL NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_flags_user_date ON anomaly_flags(user_id, date);
+
+CREATE TRIGGER IF NOT EXISTS trg_flags_delete AFTER DELETE ON expenses BEGIN
+    DELETE FROM anomaly_flags WHERE expense_id = OLD.id;
+END;
+
+-- تنبيه عملية عُدِّل مبلغها أو تصنيفها أو تاريخها لم يعد يصفها
+CREATE TRIGGER IF NOT EXISTS trg_flags_update AFTER UPDATE OF amount, category, date ON expenses
+WHEN OLD.amount IS NOT NEW.amount OR OLD.category IS NOT NEW.category OR OLD.date IS NOT NEW.date BEGIN
+    DELETE FROM anomaly_flags WHERE expense_id = OLD.id;
+END;
+
+-- ============= نسخة البيانات =============
+-- عدّاد متزايد لكل مستخدم يرتفع مع كل كتابة؛ مفتاح للتخزين المؤقت في الواجهة
+CREATE TABLE IF NOT EXISTS data_versions (
+    user_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+-- ============= الأرشيف =============
+-- شهر مغلق لمستخدم نُقلت صفوفه من expenses إلى ملف Parquet (archive.py)؛
+-- path نسبي إلى ARCHIVE_DIR، وmin/max_amount لتقليم الأقسام عند الاستعلام
+CREATE TABLE IF NOT EXISTS archive_partitions (
+    user_id INTEGER NOT NULL,
+    month TEXT NOT NULL,       -- YYYY-MM
+    path TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    total REAL NOT NULL,
+    min_amount REAL NOT NULL,
+    max_amount REAL NOT NULL,
+    bytes INTEGER NOT NULL,
+    archived_at REAL NOT NULL,
+    PRIMARY KEY (user_id, month)
+) WITHOUT ROWID;
+
+-- آخر نتيجة ناجحة لكل مهمة خلفية؛ data_version = النسخة التي حُسبت منها
+CREATE TABLE IF NOT EXISTS job_results (
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data_version INTEGER NOT NULL,
+    payload TEXT NOT NULL,          -- JSON
+    computed_at REAL NOT NULL,
+    PRIMARY KEY(user_id, kind)
+);
+""" + SEARCH_SCHEMA_SQL
+
+SCHEMA_SQL = CATALOG_SCHEMA_SQL + SHARD_SCHEMA_SQL
+
+# الأشهر المؤرشفة ليست في expenses: تجميعاتها تُحفظ كما هي ولا يُعاد بناؤها
+LIVE_MONTH_SQL = """NOT EXISTS (SELECT 1 FROM archive_partitions a
+                WHERE a.user_id = {table}.user_id AND a.month = {month})"""
+
+REBUILD_ROLLUPS_SQL = f"""
+INSERT INTO daily_totals(user_id, date, category, payment_method, total, cnt)
+SELECT user_id, date, category, IFNULL(payment_method, ''), SUM(amount), COUNT(*)
+FROM expenses WHERE {LIVE_MONTH_SQL.format(table="expenses", month="substr(expenses.date, 1, 7)")} {{user}}
+GROUP BY user_id, date, category, IFNULL(payment_method, '');
+INSERT INTO monthly_totals(user_id, month, category, total, cnt)
+SELECT user_id, substr(date, 1, 7), category, SUM(amount), COUNT(*)
+FROM expenses WHERE {LIVE_MONTH_SQL.format(table="expenses", month="substr(expenses.date, 1, 7)")} {{user}}
+GROUP BY user_id, substr(date, 1, 7), category;
 """
 
-def get_conn() -> sqlite3.Connection:
-    ensure_dirs()
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# ============= التوجيه إلى الأجزاء (shards) =============
+
+SHARD_MODES = ("off", "user", "hash")
+# في وضع user قد توجد ملفات كثيرة → مجمّع أصغر لكل ملف
+USER_SHARD_POOL_SIZE = 2
+
+def shard_path(user_id: int, mode: str = SHARD_MODE, buckets: int = SHARD_BUCKETS) -> Path:
+    """ملف قاعدة البيانات الذي يحمل بيانات المستخدم في وضع التقسيم المعطى."""
+    if mode == "off":
+        return DB_PATH
+    if mode == "user":
+        return SHARD_DIR / f"user_{int(user_id)}.db"
+    if mode == "hash":
+        return SHARD_DIR / f"bucket_{int(user_id) % buckets:03d}.db"
+    raise ValueError(f"unknown shard mode {mode!r}; expected one of {SHARD_MODES}")
+
+def iter_shard_paths(mode: str = SHARD_MODE) -> List[Path]:
+    """كل ملفات البيانات الموجودة (للعمليات على كل المستخدمين)."""
+    if mode == "off":
+        return [DB_PATH]
+    return sorted(SHARD_DIR.glob("user_*.db" if mode == "user" else "bucket_*.db"))
+
+def _pool_for(path: Path):
+    size = USER_SHARD_POOL_SIZE if path.name.startswith("user_") else None
+    # الفهرس (DB_PATH) يبقى مفتوحًا دائمًا؛ ملفات الأجزاء تُغلق عند تجاوز SHARD_POOL_CACHE
+    return get_pool(path, size, evictable=path != DB_PATH)
+
+def shard_conn(path: Path) -> ContextManager[sqlite3.Connection]:
+    """اتصال داخل معاملة على ملف بيانات محدد (بعد التأكد من مخططه)."""
+    _ensure_schema(path, SCHEMA_SQL if path == DB_PATH else SHARD_SCHEMA_SQL)
+    return _pool_for(path).connection()
+
+def get_conn(user_id: Optional[int] = None) -> ContextManager[sqlite3.Connection]:
+    """
+    اتصال مُستعار من المجمّع داخل معاملة؛ يُعاد تلقائيًا عند الخروج من with.
+    بدون user_id → فهرس المستخدمين (DB_PATH)، ومعه → ملف بيانات ذلك المستخدم.
+    """
+    if user_id is None or SHARD_MODE == "off":
+        return get_pool(DB_PATH).connection()
+    return shard_conn(shard_path(user_id))
+
+def close_db() -> None:
+    close_all()
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+def _ensure_schema(path: Path, schema: str) -> None:
+    # المخطط يُطبّق مرة واحدة لكل ملف في العملية بدل كل إعادة تشغيل للسكربت
+    if str(path) in _initialized:
+        return
+    with _init_lock:
+        if str(path) in _initialized:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with _pool_for(path).connection() as conn:
+            if path == DB_PATH:
+                _migrate_legacy_users(conn)
+            reindex = "expenses_fts" in schema and _migrate_search_triggers(conn)
+            conn.executescript(schema)
+            if reindex:
+                conn.executescript(REBUILD_SEARCH_SQL)
+            if path == DB_PATH:
+                _migrate_jobs(conn)
+            # قاعدة قديمة بلا تجميعات → نملؤها مرة واحدة
+            if "daily_totals" in schema and (
+                    conn.execute("SELECT 1 FROM daily_totals LIMIT 1").fetchone() is None
+                    and conn.execute("SELECT 1 FROM expenses LIMIT 1").fetchone() is not None):
+                _rebuild_rollups(conn)
+            # وكذلك فهرس البحث لقاعدة أُنشئت قبله
+            if "expenses_fts" in schema and (
+                    conn.execute("SELECT 1 FROM expenses_fts LIMIT 1").fetchone() is None
+                    and conn.execute("SELECT 1 FROM expenses WHERE note != '' LIMIT 1").fetchone() is not None):
+                conn.executescript(REBUILD_SEARCH_SQL)
+        _initialized.add(str(path))
 
 def init_db() -> None:
-    with get_conn() as conn:
-        conn.executescript(SCHEMA_SQL)
+    # في وضع off يحمل DB_PATH الفهرس والبيانات معًا؛ ملفات الأجزاء تُهيأ عند أول استخدام
+    _ensure_schema(DB_PATH, SCHEMA_SQL if SHARD_MODE == "off" else CATALOG_SCHEMA_SQL)
+
+def _rebuild_rollups(conn: sqlite3.Connection, user_id: Optional[int] = None) -> None:
+    user, params = ("", ()) if user_id is None else ("AND user_id=?", (user_id,))
+    conn.execute(f"""DELETE FROM daily_totals WHERE {LIVE_MONTH_SQL.format(
+        table="daily_totals", month="substr(daily_totals.date, 1, 7)")} {user}""", params)
+    conn.execute(f"""DELETE FROM monthly_totals WHERE {LIVE_MONTH_SQL.format(
+        table="monthly_totals", month="monthly_totals.month")} {user}""", params)
+    for stmt in REBUILD_ROLLUPS_SQL.format(user=user).split(";"):
+        if stmt.strip():
+            conn.execute(stmt, params)
+
+@timed(rows=no_rows)
+def rebuild_rollups(user_id: Optional[int] = None) -> None:
+    """يعيد بناء جداول التجميع من expenses (لكل المستخدمين أو لمستخدم واحد)، عدا الأشهر المؤرشفة."""
+    if user_id is not None:
+        with get_conn(user_id) as conn:
+            _rebuild_rollups(conn, user_id)
+            # جداول التجميع تغيّرت → نبطل ما خُزِّن من اللوحات
+            _bump_version(conn, user_id)
+        _written(user_id, 1)
+        return
+    for path in iter_shard_paths():
+        with shard_conn(path) as conn:
+            _rebuild_rollups(conn)
+            conn.execute(
+                """INSERT INTO data_versions(user_id, version)
+                   SELECT DISTINCT user_id, 1 FROM expenses WHERE true
+                   ON CONFLICT(user_id) DO UPDATE SET version = version + 1"""
+            )
 
 # ============= المستخدمين =============
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+# رمز الجلسة صالح 7 أيام؛ نتيجة التحقق منه تُخزَّن في الذاكرة دقيقة واحدة
+SESSION_TTL_SECONDS = 7 * 24 * 3600
+SESSION_CACHE_SECONDS = 60
+AUTH_WORKERS = 4
+_HASH_SCHEME = "pbkdf2_sha256"
+_DUMMY_SALT = secrets.token_bytes(16)
+
+def _migrate_search_triggers(conn: sqlite3.Connection) -> bool:
+    # triggers من نسخة فهرسة أخرى → نعيد إنشاءها ونبني الفهرس (الحذف من contentless يتطلب نفس النص)
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='trigger' AND name='trg_fts_insert'").fetchone()
+    if row is None or f"search index v{SEARCH_INDEX_VERSION}" in row[0]:
+        return False
+    for name in ("trg_fts_insert", "trg_fts_delete", "trg_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    return True
+
+def _migrate_jobs(conn: sqlite3.Connection) -> None:
+    # طابور أُنشئ قبل عمود data_version
+    if "data_version" not in {r[1] for r in conn.execute("PRAGMA table_info(jobs)")}:
+        conn.execute("ALTER TABLE jobs ADD COLUMN data_version INTEGER")
+
+def _migrate_legacy_users(conn: sqlite3.Connection) -> None:
+    # auth.py القديم أنشأ users(username PRIMARY KEY) بلا id → نحوله لمخطط واحد مرة واحدة
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(users)")}
+    if not cols or "id" in cols:
+        return
+    conn.executescript("""
+        CREATE TABLE users_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        INSERT INTO users_new(username, password_hash, created_at)
+        SELECT username, password_hash, created_at FROM users ORDER BY created_at, username;
+        DROP TABLE users;
+        ALTER TABLE users_new RENAME TO users;
+    """)
+
+def hash_password(password: str, iterations: int = PBKDF2_ITERATIONS,
+                  salt: Optional[bytes] = None) -> str:
+    """PBKDF2-SHA256 بملح عشوائي: "pbkdf2_sha256$iterations$salt$hash"."""
+    salt = salt or secrets.token_bytes(16)
+    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"{_HASH_SCHEME}${iterations}${salt.hex()}${dk.hex()}"
+
+def check_password(password: str, stored: str) -> Tuple[bool, bool]:
+    """(صحيحة؟، تحتاج ترقية؟) — يقبل أيضًا sha256 القديم بلا ملح."""
+    if not stored.startswith(_HASH_SCHEME + "$"):
+        legacy = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        ok = hmac.compare_digest(legacy, stored)
+        return ok, ok
+    _, iterations, salt, expected = stored.split("$")
+    dk = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), bytes.fromhex(salt), int(iterations))
+    ok = hmac.compare_digest(dk.hex(), expected)
+    return ok, ok and int(iterations) < PBKDF2_ITERATIONS
 
 def create_user(username: str, password: str) -> bool:
     now = datetime.utcnow().isoformat(timespec="seconds")
+    # الاشتقاق المكلف خارج المعاملة حتى لا يمسك قفل الكتابة
+    password_hash = hash_password(password)
     try:
         with get_conn() as conn:
             conn.execute(
                 "INSERT INTO users(username, password_hash, created_at) VALUES(?,?,?)",
-                (username, hash_password(password), now)
+                (username, password_hash, now)
             )
         return True
     except sqlite3.IntegrityError:
         return False  # اسم المستخدم موجود
 
+@timed(rows=no_rows)
 def verify_user(username: str, password: str) -> Optional[int]:
     with get_conn() as conn:
         row = conn.execute(
             "SELECT id, password_hash FROM users WHERE username=?", (username,)
         ).fetchone()
-        if row and row["password_hash"] == hash_password(password):
-            return row["id"]
-    return None
+    if row is None:
+        # نفس كلفة الاشتقاق لاسم غير موجود: زمن الرد لا يكشف الأسماء المسجلة
+        hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), _DUMMY_SALT, PBKDF2_ITERATIONS)
+        return None
+    ok, upgrade = check_password(password, row["password_hash"])
+    if not ok:
+        return None
+    if upgrade:
+        # sha256 قديم أو كلفة أقل من الحالية → نعيد الاشتقاق بالإعداد الحالي
+        with get_conn() as conn:
+            conn.execute("UPDATE users SET password_hash=? WHERE id=? AND password_hash=?",
+                         (hash_password(password), row["id"], row["password_hash"]))
+    return row["id"]
+
+_auth_executor: Optional[ThreadPoolExecutor] = None
+_auth_lock = threading.Lock()
+
+def _auth_pool() -> ThreadPoolExecutor:
+    # pbkdf2_hmac يحرر الـ GIL، وAUTH_WORKERS يحد عدد الاشتقاقات المتزامنة
+    global _auth_executor
+    if _auth_executor is None:
+        with _auth_lock:
+            if _auth_executor is None:
+                _auth_executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+    return _auth_executor
+
+def verify_user_async(username: str, password: str) -> "Future[Optional[int]]":
+    """verify_user في مجمّع خيوط المصادقة المحدود."""
+    return _auth_pool().submit(verify_user, username, password)
+
+# ============= الجلسات =============
+
+_session_cache: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+_session_lock = threading.Lock()
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def create_session(user_id: int, ttl: int = SESSION_TTL_SECONDS) -> str:
+    """ينشئ رمز جلسة عشوائيًا ويرجعه (يُخزَّن sha256 له فقط)."""
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    with get_conn() as conn:
+        conn.execute(
+            "INSERT INTO sessions(token_hash, user_id, created_at, expires_at) VALUES(?,?,?,?)",
+            (_token_hash(token), user_id, now.isoformat(timespec="seconds"),
+             (now + timedelta(seconds=ttl)).isoformat(timespec="seconds"))
+        )
+    return token
+
+def login(username: str, password: str) -> Optional[Dict[str, Any]]:
+    """تحقق ثم جلسة جديدة: {user_id, username, token} أو None (في الخيط الحالي)."""
+    uid = verify_user(username, password)
+    if uid is None:
+        return None
+    return {"user_id": uid, "username": username, "token": create_session(uid)}
+
+def login_async(username: str, password: str) -> "Future[Optional[Dict[str, Any]]]":
+    """
+    login في مجمّع المصادقة: الواجهة تحفظ الـ Future في الجلسة وتفحصه عبر إعادات
+    التشغيل بدل انتظار الاشتقاق في خيط السكربت.
+    """
+    return _auth_pool().submit(login, username, password)
+
+def validate_session(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """{user_id, username} لرمز صالح وغير منتهٍ، وإلا None. النتيجة تُخزَّن SESSION_CACHE_SECONDS."""
+    if not token:
+        return None
+    key = _token_hash(token)
+    now = time.monotonic()
+    hit = _session_cache.get(key)
+    if hit is not None and hit[0] > now:
+        return hit[1]
+    with get_conn() as conn:
+        row = conn.execute(
+            """SELECT s.user_id, u.username, s.expires_at FROM sessions s JOIN users u ON u.id = s.user_id
+               WHERE s.token_hash=? AND s.expires_at > ?""",
+            (key, datetime.utcnow().isoformat(timespec="seconds"))
+        ).fetchone()
+    result = {"user_id": row["user_id"], "username": row["username"]} if row else None
+    # لا نخزن بعد انتهاء الجلسة نفسها
+    until = now + SESSION_CACHE_SECONDS
+    if row:
+        left = (datetime.fromisoformat(row["expires_at"]) - datetime.utcnow()).total_seconds()
+        until = now + min(SESSION_CACHE_SECONDS, max(left, 0))
+    with _session_lock:
+        _session_cache[key] = (until, result)
+        if len(_session_cache) > 10_000:
+            for k in [k for k, (t, _) in _session_cache.items() if t <= now]:
+                del _session_cache[k]
+    return result
+
+def revoke_session(token: Optional[str]) -> None:
+    if not token:
+        return
+    key = _token_hash(token)
+    with _session_lock:
+        _session_cache.pop(key, None)
+    with get_conn() as conn:
+        conn.execute("DELETE FROM sessions WHERE token_hash=?", (key,))
+
+def purge_expired_sessions() -> int:
+    with get_conn() as conn:
+        return conn.execute("DELETE FROM sessions WHERE expires_at <= ?",
+                            (datetime.utcnow().isoformat(timespec="seconds"),)).rowcount
+
+# ============= نسخة البيانات =============
+
+# دوال تُستدعى بـ user_id بعد كل معاملة غيّرت بياناته (بعد commit)، مثل جدولة jobs.py
+_write_hooks: List[Callable[[int], None]] = []
+
+def add_write_hook(fn: Callable[[int], None]) -> None:
+    if fn not in _write_hooks:
+        _write_hooks.append(fn)
+
+def _written(user_id: int, changed: int) -> int:
+    # الكتابة التزمت فعلًا: فشل مستمع (جدولة مهمة مثلًا) يُسجَّل ولا يصل للمستدعي
+    if changed:
+        for fn in _write_hooks:
+            try:
+                fn(user_id)
+            except Exception:
+                log.exception("write hook %r failed for user %s", fn, user_id)
+    return changed
+
+def _bump_version(conn: sqlite3.Connection, user_id: int) -> None:
+    # داخل نفس معاملة الكتابة: إما تُرى الكتابة والنسخة الجديدة معًا أو لا شيء
+    conn.execute(
+        """INSERT INTO data_versions(user_id, version) VALUES(?, 1)
+           ON CONFLICT(user_id) DO UPDATE SET version = version + 1""",
+        (user_id,)
+    )
+
+@timed(rows=no_rows)
+def get_data_version(user_id: int) -> int:
+    """نسخة بيانات المستخدم؛ تتغير بعد أي إضافة/تعديل/حذف فقط."""
+    with get_conn(user_id) as conn:
+        row = conn.execute("SELECT version FROM data_versions WHERE user_id=?", (user_id,)).fetchone()
+        return row["version"] if row else 0
 
 # ============= المصاريف =============
 
+@timed(rows=lambda _: 1)
 def add_expense(user_id: int, amount: float, category: str, payment_method: str,
                 date_iso: str, note: str = "") -> int:
     now = datetime.utcnow().isoformat(timespec="seconds")
-    with get_conn() as conn:
+    with get_conn(user_id) as conn:
         cur = conn.execute(
             """INSERT INTO expenses(user_id, amount, category, payment_method, date, note, created_at)
                VALUES(?,?,?,?,?,?,?)""",
             (user_id, amount, category, payment_method, date_iso, note, now)
         )
-        return cur.lastrowid
+        _score_online(conn, user_id, cur.lastrowid, amount, category, date_iso, now)
+        _bump_version(conn, user_id)
+    _written(user_id, 1)
+    return cur.lastrowid
 
-def list_expenses(user_id: int, limit: int = 50,
-                  month: Optional[int] = None, year: Optional[int] = None) -> List[Dict[str, Any]]:
-    q = "SELECT * FROM expenses WHERE user_id=?"
-    params: Tuple[Any, ...] = (user_id,)
-    where = []
+def _score_online(conn: sqlite3.Connection, user_id: int, expense_id: int, amount: float,
+                  category: str, date_iso: str, now: str) -> Optional[str]:
+    # تقييم O(1) داخل نفس معاملة الإضافة: قراءة الحالة → تقييم → تحديث → حفظ
+    row = conn.execute(
+        "SELECT state FROM anomaly_state WHERE user_id=? AND category=?", (user_id, category)
+    ).fetchone()
+    state = json.loads(row["state"]) if row else None
+    state, level, z = online_anomalies.score_and_update(state, float(amount))
+    conn.execute(
+        """INSERT INTO anomaly_state(user_id, category, state, updated_at) VALUES(?,?,?,?)
+           ON CONFLICT(user_id, category) DO UPDATE SET state=excluded.state, updated_at=excluded.updated_at""",
+        (user_id, category, json.dumps(state), now)
+    )
+    if level is not None:
+        conn.execute(
+            """INSERT OR REPLACE INTO anomaly_flags(expense_id, user_id, category, date, amount, level, zscore, created_at)
+               VALUES(?,?,?,?,?,?,?,?)""",
+            (expense_id, user_id, category, date_iso, float(amount), level, z, now)
+        )
+    return level
+
+EXPENSE_FIELDS = ("amount", "category", "payment_method", "date", "note")
+INGEST_CHUNK_SIZE = 5_000
+
+def _expense_tuple(user_id: int, row: Any, now: str) -> Tuple[Any, ...]:
+    # يقبل dict بأسماء الأعمدة أو tuple بالترتيب (amount, category, payment_method, date, note)
+    if isinstance(row, dict):
+        amount, category, payment_method, date_iso, note = (row.get(k) for k in EXPENSE_FIELDS)
+    else:
+        amount, category, payment_method, date_iso, *rest = row
+        note = rest[0] if rest else ""
+    return (user_id, float(amount), category, payment_method, date_iso, note or "", now)
+
+@timed(rows=lambda r: r["rows"])
+def add_expenses_many(user_id: int, rows: Iterable[Any],
+                      chunk_size: int = INGEST_CHUNK_SIZE) -> Dict[str, float]:
+    """
+    إدخال جماعي: يستهلك rows (قد تكون generator) على دفعات executemany
+    داخل معاملة واحدة، ويرجع عدد الصفوف وسرعة الإدخال (صف/ثانية).
+    """
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    it = iter(rows)
+    total = 0
+    t0 = time.perf_counter()
+    with get_conn(user_id) as conn:
+        while True:
+            chunk = [_expense_tuple(user_id, r, now) for r in islice(it, chunk_size)]
+            if not chunk:
+                break
+            conn.executemany(
+                """INSERT INTO expenses(user_id, amount, category, payment_method, date, note, created_at)
+                   VALUES(?,?,?,?,?,?,?)""",
+                chunk
+            )
+            total += len(chunk)
+        if total:
+            _bump_version(conn, user_id)
+    _written(user_id, total)
+    elapsed = time.perf_counter() - t0
+    return {"rows": total, "seconds": elapsed,
+            "rows_per_sec": total / elapsed if elapsed > 0 else float(total)}
+
+def _foreign_ids(conn: sqlite3.Connection, user_id: int, ids: Iterable[Optional[int]]) -> set:
+    """أرقام من ids موجودة لمستخدم آخر في نفس الملف."""
+    ids = [int(i) for i in ids if i is not None]
+    if not ids:
+        return set()
+    return {r[0] for r in conn.execute(
+        "SELECT id FROM expenses WHERE id IN (SELECT value FROM json_each(?)) AND user_id != ?",
+        (json.dumps(ids), user_id))}
+
+@timed(rows=lambda r: r["rows"])
+def upsert_expenses_many(user_id: int, rows: Iterable[Dict[str, Any]],
+                         chunk_size: int = INGEST_CHUNK_SIZE) -> Dict[str, float]:
+    """
+    مثل add_expenses_many لكن الصفوف التي تحمل id تُحدِّث السجل الموجود
+    (لنفس المستخدم فقط) بدل إضافة نسخة مكررة. id يخص مستخدمًا آخر (استيراد تصدير
+    حساب آخر) يُضاف برقم جديد. id في شهر مؤرشف لا يُكتب (الأشهر المغلقة لا تُعدَّل)
+    ويُعدّ في archived. rows = الصفوف المكتوبة فعلًا.
+    """
+    from archive import archived_ids
+
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    it = iter(rows)
+    total = skipped = 0
+    t0 = time.perf_counter()
+    # الصف المؤرشف لم يعد في expenses: upsert بنفس id كان سيضيفه حيًا مرة ثانية
+    archived = archived_ids(user_id)
+    with get_conn(user_id) as conn:
+        while True:
+            chunk = [(r.get("id"),) + _expense_tuple(user_id, r, now) for r in islice(it, chunk_size)]
+            if not chunk:
+                break
+            if archived:
+                kept = [r for r in chunk if r[0] not in archived]
+                skipped += len(chunk) - len(kept)
+                chunk = kept
+            foreign = _foreign_ids(conn, user_id, [r[0] for r in chunk])
+            if foreign:
+                chunk = [(None,) + r[1:] if r[0] in foreign else r for r in chunk]
+            cur = conn.executemany(
+                """INSERT INTO expenses(id, user_id, amount, category, payment_method, date, note, created_at)
+                   VALUES(?,?,?,?,?,?,?,?)
+                   ON CONFLICT(id) DO UPDATE SET
+                       amount=excluded.amount, category=excluded.category,
+                       payment_method=excluded.payment_method, date=excluded.date, note=excluded.note
+                   WHERE expenses.user_id=excluded.user_id""",
+                chunk
+            )
+            total += cur.rowcount
+        if total:
+            _bump_version(conn, user_id)
+    _written(user_id, total)
+    elapsed = time.perf_counter() - t0
+    return {"rows": total, "archived": skipped, "seconds": elapsed,
+            "rows_per_sec": total / elapsed if elapsed > 0 else float(total)}
+
+def iter_expenses(user_id: int, chunk_size: int = INGEST_CHUNK_SIZE) -> Iterator[List[sqlite3.Row]]:
+    """يمر على كل مصاريف المستخدم دفعةً دفعة عبر المؤشر دون تحميلها كاملة في الذاكرة."""
+    with get_conn(user_id) as conn:
+        cur = conn.execute(
+            """SELECT id, amount, category, payment_method, date, note
+               FROM expenses WHERE user_id=? ORDER BY date, id""",
+            (user_id,)
+        )
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def iter_expense_columns(user_id: int, chunk_size: int = INGEST_CHUNK_SIZE,
+                         limit: Optional[int] = None) -> Iterator[List[Tuple[Any, ...]]]:
+    """
+    دفعات (id, amount, category, payment_method, day) للتحليل العمودي: بلا ملاحظات،
+    وday رقم اليوم منذ 1970-01-01 يحسبه SQLite، وبلا كائنات sqlite3.Row.
+    limit: أحدث limit عملية فقط (بالترتيب الزمني).
+    """
+    q = """SELECT id, amount, category, IFNULL(payment_method, ''),
+                  CAST(julianday(date) - 2440587.5 AS INTEGER)
+           FROM expenses WHERE user_id=?"""
+    params: List[Any] = [user_id]
+    if limit is not None:
+        q = f"SELECT * FROM ({q} ORDER BY date DESC, id DESC LIMIT ?)"
+        params.append(limit)
+    with get_conn(user_id) as conn:
+        cur = conn.cursor()
+        cur.row_factory = None
+        cur.execute(q + (" ORDER BY 5, 1" if limit is not None else " ORDER BY date, id"), params)
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def _month_bounds(year: int, month: int) -> Tuple[str, str]:
+    start = f"{year:04d}-{month:02d}-01"
+    end = f"{year + month // 12:04d}-{month % 12 + 1:02d}-01"
+    return start, end
+
+def _expense_filters(user_id: int, month: Optional[int] = None, year: Optional[int] = None,
+                     date_from: Optional[str] = None, date_to: Optional[str] = None,
+                     categories: Optional[Iterable[str]] = None,
+                     payment_methods: Optional[Iterable[str]] = None,
+                     min_amount: Optional[float] = None,
+                     max_amount: Optional[float] = None) -> Tuple[List[str], List[Any]]:
+    # كل الشروط قابلة للفهرسة (sargable): لا دوال على عمود date
+    where, params = ["user_id=?"], [user_id]
     if month is not None and year is not None:
-        where.append("substr(date,1,7)=?")
-        params += (f"{year:04d}-{month:02d}",)
-    if where:
-        q += " AND " + " AND ".join(where)
-    q += " ORDER BY date DESC, id DESC LIMIT ?"
-    params += (limit,)
-    with get_conn() as conn:
+        start, end = _month_bounds(year, month)
+        where += ["date>=?", "date<?"]
+        params += [start, end]
+    if date_from:
+        where.append("date>=?")
+        params.append(str(date_from))
+    if date_to:
+        where.append("date<=?")
+        params.append(str(date_to))
+    for col, values in (("category", categories), ("payment_method", payment_methods)):
+        if values is not None:
+            values = list(values)
+            if not values:
+                where.append("0")
+            else:
+                where.append(f"{col} IN ({','.join('?' * len(values))})")
+                params += values
+    if min_amount is not None:
+        where.append("amount>=?")
+        params.append(float(min_amount))
+    if max_amount is not None:
+        where.append("amount<=?")
+        params.append(float(max_amount))
+    return where, params
+
+@timed()
+def list_expenses(user_id: int, limit: int = 50,
+                  month: Optional[int] = None, year: Optional[int] = None,
+                  *, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                  categories: Optional[Iterable[str]] = None,
+                  payment_methods: Optional[Iterable[str]] = None,
+                  min_amount: Optional[float] = None, max_amount: Optional[float] = None,
+                  before: Optional[Tuple[str, int]] = None) -> List[Dict[str, Any]]:
+    """
+    صفحة من المصاريف مرتبة تنازليًا حسب (date, id).
+    before: مؤشر الصفحة التالية (date, id) لآخر صف في الصفحة السابقة — انظر next_cursor.
+    """
+    where, params = _expense_filters(user_id, month, year, date_from, date_to,
+                                     categories, payment_methods, min_amount, max_amount)
+    if before is not None:
+        where.append("(date, id) < (?, ?)")
+        params += [before[0], int(before[1])]
+    q = f"SELECT * FROM expenses WHERE {' AND '.join(where)} ORDER BY date DESC, id DESC LIMIT ?"
+    params.append(limit)
+    with get_conn(user_id) as conn:
         rows = conn.execute(q, params).fetchall()
         return [dict(r) for r in rows]
 
+def next_cursor(rows: List[Dict[str, Any]], limit: int) -> Optional[Tuple[str, int]]:
+    """مؤشر keyset للصفحة التالية، أو None إن كانت هذه آخر صفحة."""
+    if len(rows) < limit:
+        return None
+    return rows[-1]["date"], rows[-1]["id"]
+
+# ============= البحث النصي =============
+
+def search_query(user_id: int, text: str) -> Optional[str]:
+    """
+    نص المستخدم → تعبير FTS5 آمن: كل كلمة (بعد التطبيع) بادئة بين علامتي تنصيص
+    ضمن مفردات المستخدم، وكلها مطلوبة (AND). None إن لم تبقَ كلمات.
+    """
+    terms = _search_terms(text)
+    if not terms:
+        return None
+    # الجزء بلا بادئة (بعد رمز غير مذكور في _SEPARATORS) قد يخص مستخدمًا آخر؛ الربط مع expenses
+    # بشرط user_id في search_expenses يستبعده
+    return " AND ".join(f'("{_user_term(user_id, t)}"* OR "{t}"*)' for t in terms)
+
+@timed()
+def search_expenses(user_id: int, text: str, limit: int = 50, offset: int = 0,
+                    *, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                    categories: Optional[Iterable[str]] = None,
+                    payment_methods: Optional[Iterable[str]] = None,
+                    min_amount: Optional[float] = None,
+                    max_amount: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    بحث في الملاحظات مرتب بالصلة (bm25، الأقل أفضل في عمود rank) مع نفس فلاتر list_expenses.
+    الترقيم بـ offset: الترتيب بالصلة لا يصلح لمؤشر keyset.
+    """
+    match = search_query(user_id, text)
+    if match is None:
+        return []
+    where, params = _expense_filters(user_id, date_from=date_from, date_to=date_to,
+                                     categories=categories, payment_methods=payment_methods,
+                                     min_amount=min_amount, max_amount=max_amount)
+    q = f"""SELECT e.*, f.rank FROM (
+                SELECT rowid, bm25(expenses_fts) AS rank FROM expenses_fts
+                WHERE expenses_fts MATCH ?
+            ) f JOIN expenses e ON e.id = f.rowid
+            WHERE {' AND '.join(where)}
+            ORDER BY f.rank, e.date DESC, e.id DESC LIMIT ? OFFSET ?"""
+    with get_conn(user_id) as conn:
+        return [dict(r) for r in conn.execute(q, [match] + params + [limit, offset])]
+
+def rebuild_search_index(optimize_only: bool = False) -> Dict[str, Any]:
+    """
+    يعيد بناء expenses_fts من expenses في كل ملفات البيانات (أو يدمج أجزاءه فقط
+    مع optimize_only)، ويرجع عدد الملاحظات المفهرسة والزمن.
+    """
+    t0 = time.perf_counter()
+    paths = iter_shard_paths()
+    rows = 0
+    for path in paths:
+        with shard_conn(path) as conn:
+            if not optimize_only:
+                conn.execute("INSERT INTO expenses_fts(expenses_fts) VALUES('delete-all')")
+                rows += conn.execute(
+                    f"""INSERT INTO expenses_fts(rowid, note)
+                        SELECT id, {_indexed_sql("note", "user_id")}
+                        FROM expenses WHERE IFNULL(note, '') != ''"""
+                ).rowcount
+            conn.execute("INSERT INTO expenses_fts(expenses_fts) VALUES('optimize')")
+    return {"rows": rows, "shards": len(paths), "seconds": time.perf_counter() - t0}
+
 def update_expense(user_id: int, expense_id: int, fields: Dict[str, Any]) -> int:
     if not fields:
         return 0
@@ -104,21 +964,199 @@ def update_expense(user_id: int, expense_id: int, fields: Dict[str, Any]) -> int
         return 0
     set_clause = ", ".join([f"{k}=?" for k, _ in pairs])
     params = [v for _, v in pairs] + [expense_id, user_id]
-    with get_conn() as conn:
+    with get_conn(user_id) as conn:
         cur = conn.execute(f"UPDATE expenses SET {set_clause} WHERE id=? AND user_id=?", params)
-        return cur.rowcount
+        if cur.rowcount:
+            _bump_version(conn, user_id)
+    return _written(user_id, cur.rowcount)
 
+@timed(rows=int)
+def update_expenses_many(user_id: int, changes: Iterable[Tuple[int, Dict[str, Any]]]) -> int:
+    """
+    تحديث جماعي: changes = [(expense_id, {العمود: القيمة})].
+    الصفوف تُجمَّع حسب مجموعة الأعمدة المتغيرة، وكل مجموعة executemany واحد
+    داخل معاملة واحدة. يرجع عدد الصفوف المحدَّثة.
+    """
+    groups: Dict[Tuple[str, ...], List[Tuple[Any, ...]]] = {}
+    for eid, fields in changes:
+        cols = tuple(k for k in EXPENSE_FIELDS if k in fields)
+        if cols:
+            groups.setdefault(cols, []).append(tuple(fields[k] for k in cols) + (eid, user_id))
+    if not groups:
+        return 0
+    total = 0
+    with get_conn(user_id) as conn:
+        for cols, params in groups.items():
+            set_clause = ", ".join(f"{k}=?" for k in cols)
+            cur = conn.executemany(f"UPDATE expenses SET {set_clause} WHERE id=? AND user_id=?", params)
+            total += cur.rowcount
+        if total:
+            _bump_version(conn, user_id)
+    return _written(user_id, total)
+
+@timed(rows=int)
 def delete_expenses(user_id: int, ids: Iterable[int]) -> int:
-    ids = list(ids)
+    """يحذف عمليات المستخدم الحية والمؤرشفة؛ يرجع عدد المحذوف فعلًا."""
+    from archive import delete_archived
+
+    ids = [int(i) for i in ids]
     if not ids:
         return 0
     qmarks = ",".join(["?"]*len(ids))
-    with get_conn() as conn:
-        cur = conn.execute(f"DELETE FROM expenses WHERE id IN ({qmarks}) AND user_id=?",
-                           (*ids, user_id))
-        return cur.rowcount
+    with get_conn(user_id) as conn:
+        live = {r[0] for r in conn.execute(
+            f"DELETE FROM expenses WHERE id IN ({qmarks}) AND user_id=? RETURNING id", (*ids, user_id))}
+        if live:
+            _bump_version(conn, user_id)
+    _written(user_id, len(live))
+    # ما لم يُحذف حيًا قد يكون في شهر مؤرشف
+    rest = [i for i in ids if i not in live]
+    return len(live) + (delete_archived(user_id, rest) if rest else 0)
 
+@timed(rows=int)
 def clear_all_expenses(user_id: int) -> int:
-    with get_conn() as conn:
+    """يحذف كل عمليات المستخدم: الحية والأقسام المؤرشفة وتجميعاتها. يرجع عدد الصفوف."""
+    from archive import drop_user_archive, remove_partition_files
+
+    with get_conn(user_id) as conn:
         cur = conn.execute("DELETE FROM expenses WHERE user_id=?", (user_id,))
-        return cur.rowcount
+        archived, files = drop_user_archive(conn, user_id)
+        # الخطوط الأساسية للكاشف الفوري تعلّمت من البيانات المحذوفة
+        conn.execute("DELETE FROM anomaly_state WHERE user_id=?", (user_id,))
+        if cur.rowcount or archived:
+            _bump_version(conn, user_id)
+    remove_partition_files(files)
+    return _written(user_id, cur.rowcount + archived)
+
+# ============= استعلامات التجميعات =============
+
+@timed()
+def get_daily_totals(user_id: int, date_from: Optional[str] = None,
+                     date_to: Optional[str] = None) -> List[Dict[str, Any]]:
+    """مجموع كل يوم: [{date, total, cnt}] مرتبة تصاعديًا."""
+    q = "SELECT date, SUM(total) AS total, SUM(cnt) AS cnt FROM daily_totals WHERE user_id=?"
+    params: List[Any] = [user_id]
+    if date_from:
+        q += " AND date>=?"
+        params.append(str(date_from))
+    if date_to:
+        q += " AND date<=?"
+        params.append(str(date_to))
+    q += " GROUP BY date ORDER BY date"
+    with get_conn(user_id) as conn:
+        return [dict(r) for r in conn.execute(q, params).fetchall()]
+
+@timed()
+def get_monthly_totals(user_id: int) -> List[Dict[str, Any]]:
+    """مجموع كل شهر: [{month, total, cnt}] مرتبة تصاعديًا."""
+    with get_conn(user_id) as conn:
+        rows = conn.execute(
+            """SELECT month, SUM(total) AS total, SUM(cnt) AS cnt FROM monthly_totals
+               WHERE user_id=? GROUP BY month ORDER BY month""",
+            (user_id,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+@timed()
+def get_category_totals(user_id: int, month: Optional[int] = None,
+                        year: Optional[int] = None) -> List[Dict[str, Any]]:
+    """مجموع كل تصنيف (لكل الفترة أو لشهر محدد): [{category, total, cnt}] تنازليًا."""
+    q = "SELECT category, SUM(total) AS total, SUM(cnt) AS cnt FROM monthly_totals WHERE user_id=?"
+    params: List[Any] = [user_id]
+    if month is not None and year is not None:
+        q += " AND month=?"
+        params.append(f"{year:04d}-{month:02d}")
+    q += " GROUP BY category ORDER BY total DESC"
+    with get_conn(user_id) as conn:
+        return [dict(r) for r in conn.execute(q, params).fetchall()]
+
+# ============= الكشف الفوري عن الشذوذ =============
+
+@timed()
+def get_anomaly_flags(user_id: int, limit: int = 100,
+                      date_from: Optional[str] = None) -> List[Dict[str, Any]]:
+    q = "SELECT * FROM anomaly_flags WHERE user_id=?"
+    params: List[Any] = [user_id]
+    if date_from:
+        q += " AND date>=?"
+        params.append(str(date_from))
+    q += " ORDER BY date DESC, expense_id DESC LIMIT ?"
+    params.append(limit)
+    with get_conn(user_id) as conn:
+        return [dict(r) for r in conn.execute(q, params).fetchall()]
+
+def get_anomaly_flag(user_id: int, expense_id: int) -> Optional[Dict[str, Any]]:
+    # user_id يحدد ملف الجزء؛ أرقام العمليات فريدة داخل الملف فقط
+    with get_conn(user_id) as conn:
+        row = conn.execute("SELECT * FROM anomaly_flags WHERE expense_id=? AND user_id=?",
+                           (expense_id, user_id)).fetchone()
+        return dict(row) if row else None
+
+def save_anomaly_states(user_id: int, states: Dict[str, Dict[str, Any]]) -> None:
+    """يستبدل حالة الكاشف الفوري للمستخدم بالكامل (بعد إعادة المعايرة)."""
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    with get_conn(user_id) as conn:
+        conn.execute("DELETE FROM anomaly_state WHERE user_id=?", (user_id,))
+        conn.executemany(
+            "INSERT INTO anomaly_state(user_id, category, state, updated_at) VALUES(?,?,?,?)",
+            [(user_id, cat, json.dumps(st), now) for cat, st in states.items()]
+        )
+
+# ============= الترحيل إلى الأجزاء =============
+
+# جداول بيانات المستخدم التي تُنقل (التجميعات تُبنى في الجزء بالـ triggers)
+SHARD_COPY_TABLES = ("expenses", "anomaly_flags", "anomaly_state", "data_versions", "job_results",
+                     "archive_partitions")
+# تجميعات الأشهر المؤرشفة لا تأتي من صفوف expenses فتُنسخ كما هي
+ARCHIVED_ROLLUPS = (("daily_totals", "substr(date, 1, 7)"), ("monthly_totals", "month"))
+
+def split_into_shards(mode: str, buckets: int = SHARD_BUCKETS,
+                      delete_source: bool = False) -> Dict[str, Any]:
+    """
+    يقسم قاعدة الملف الواحد (DB_PATH): بيانات كل مستخدم تُنسخ إلى ملف جزئه
+    بنفس أرقام العمليات. آمن للإعادة (بيانات المستخدم في الجزء تُستبدل)،
+    والمصدر يبقى كما هو ما لم يُطلب delete_source.
+    """
+    if mode not in SHARD_MODES or mode == "off":
+        raise ValueError(f"shard mode must be 'user' or 'hash', got {mode!r}")
+    t0 = time.perf_counter()
+    _ensure_schema(DB_PATH, SCHEMA_SQL)
+    with get_pool(DB_PATH).connection() as conn:
+        user_ids = [r[0] for r in conn.execute(
+            "SELECT user_id FROM expenses UNION SELECT user_id FROM data_versions ORDER BY 1")]
+
+    rows, shards = 0, set()
+    for uid in user_ids:
+        path = shard_path(uid, mode, buckets)
+        _ensure_schema(path, SHARD_SCHEMA_SQL)
+        pool = _pool_for(path)
+        conn = pool.acquire()
+        try:
+            conn.execute("ATTACH DATABASE ? AS src", (str(DB_PATH),))
+            try:
+                with conn:
+                    for table in reversed(SHARD_COPY_TABLES):
+                        conn.execute(f"DELETE FROM main.{table} WHERE user_id=?", (uid,))
+                    for table in SHARD_COPY_TABLES:
+                        cur = conn.execute(f"INSERT INTO main.{table} SELECT * FROM src.{table} WHERE user_id=?",
+                                           (uid,))
+                        if table == "expenses":
+                            rows += cur.rowcount
+                    for table, month in ARCHIVED_ROLLUPS:
+                        archived = f"{month} IN (SELECT month FROM src.archive_partitions WHERE user_id=?)"
+                        conn.execute(f"DELETE FROM main.{table} WHERE user_id=? AND {archived}", (uid, uid))
+                        conn.execute(f"INSERT INTO main.{table} SELECT * FROM src.{table} "
+                                     f"WHERE user_id=? AND {archived}", (uid, uid))
+            finally:
+                conn.execute("DETACH DATABASE src")
+        finally:
+            pool.release(conn)
+        shards.add(path.name)
+
+    if delete_source and user_ids:
+        with get_pool(DB_PATH).connection() as conn:
+            for table in SHARD_COPY_TABLES:
+                conn.execute(f"DELETE FROM {table}")
+    return {"users": len(user_ids), "rows": rows, "shards": len(shards),
+            "seconds": time.perf_counter() - t0}
+
@@ -0,0 +1,187 @@
+# db_pool.py
+import atexit
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+from utils import SHARD_POOL_CACHE, ensure_dirs
+
+# تُطبّق على كل اتصال جديد مرة واحدة فقط
+PRAGMAS = {
+    "journal_mode": "WAL",      # القرّاء لا يحجبون الكاتب والعكس
+    "synchronous": "NORMAL",    # آمن مع WAL وأسرع بكثير من FULL
+    "cache_size": -65536,       # 64MB (القيمة السالبة بالكيلوبايت)
+    "mmap_size": 268435456,     # 256MB
+    "busy_timeout": 5000,       # ms — انتظر القفل بدل "database is locked"
+    "temp_store": "MEMORY",
+}
+
+POOL_SIZE = 8
+ACQUIRE_TIMEOUT = 10.0
+# ذاكرة الجمل المُجهّزة لكل اتصال (sqlite3 يعيد استخدام الجمل المتطابقة)
+STATEMENT_CACHE_SIZE = 256
+
+
+def open_connection(path: Union[str, Path]) -> sqlite3.Connection:
+    ensure_dirs()
+    conn = sqlite3.connect(
+        str(path),
+        timeout=PRAGMAS["busy_timeout"] / 1000,
+        check_same_thread=False,  # الاتصال يُستعار من خيط واحد في كل مرة
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.row_factory = sqlite3.Row
+    for key, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {key}={value}")
+    return conn
+
+
+class ConnectionPool:
+    """مجمّع اتصالات محدود الحجم لملف SQLite واحد."""
+
+    def __init__(self, path: Union[str, Path], size: int = POOL_SIZE):
+        self.path = str(path)
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self, timeout: float = ACQUIRE_TIMEOUT) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError(f"connection pool for {self.path} is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return open_connection(self.path)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"no free connection for {self.path} after {timeout}s")
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """يستعير اتصالًا داخل معاملة: commit عند النجاح و rollback عند الخطأ."""
+        conn = self.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    @property
+    def in_use(self) -> int:
+        """اتصالات مستعارة الآن."""
+        return self._created - self._idle.qsize()
+
+    def drain(self) -> None:
+        """يغلق الاتصالات الخاملة؛ المجمّع يبقى صالحًا ويفتح اتصالًا جديدًا عند الطلب."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pools: Dict[str, ConnectionPool] = {}
+# المجمّعات القابلة للإخلاء (ملفات الأجزاء) بترتيب آخر استخدام
+_lru: "OrderedDict[str, ConnectionPool]" = OrderedDict()
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: Union[str, Path], size: Optional[int] = None, evictable: bool = False) -> ConnectionPool:
+    """
+    مجمّع الملف (يُنشأ عند أول طلب). evictable: ملف جزء قد تكون ملفاته بالآلاف؛ يبقى منها
+    SHARD_POOL_CACHE مفتوحًا على الأكثر، والأقدم استخدامًا بلا اتصالات مستعارة يُغلق.
+    """
+    key = str(path)
+    if not evictable:
+        pool = _pools.get(key)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    pool = _pools[key] = ConnectionPool(key, size or POOL_SIZE)
+        return pool
+    with _pools_lock:
+        pool = _lru.get(key)
+        if pool is not None:
+            _lru.move_to_end(key)
+            return pool
+        pool = _lru[key] = ConnectionPool(key, size or POOL_SIZE)
+        _evict_locked()
+        return pool
+
+
+def _evict_locked() -> None:
+    # من يحمل مرجعًا لمجمّع مُخلى يبقى يعمل: drain لا يغلقه بل يفرغ اتصالاته الخاملة
+    excess = len(_lru) - max(1, SHARD_POOL_CACHE)
+    for key in list(_lru):
+        if excess <= 0:
+            break
+        pool = _lru[key]
+        if pool.in_use:
+            continue
+        del _lru[key]
+        pool.drain()
+        excess -= 1
+
+
+def open_pools() -> int:
+    """عدد المجمّعات المفتوحة (للقياس والاختبارات)."""
+    with _pools_lock:
+        return len(_pools) + len(_lru)
+
+
+def close_all() -> None:
+    """يغلق كل الاتصالات الخاملة (يُستدعى تلقائيًا عند إنهاء العملية)."""
+    with _pools_lock:
+        pools = list(_pools.values()) + list(_lru.values())
+        _pools.clear()
+        _lru.clear()
+    for pool in pools:
+        pool.close()
+
+
+atexit.register(close_all)
@@ -1,60 +1,512 @@
 # forecast.py
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
 import pandas as pd
 import numpy as np
 from dateutil import parser
 
-try:
-    import xgboost as xgb
-    HAS_XGB = True
-except Exception:
-    HAS_XGB = False
+from utils import DATA_DIR
+from parallel import map_tasks, is_parallel
+from perf import span, timed
 
-def build_features(df: pd.DataFrame) -> pd.DataFrame:
+# xgboost يُحمَّل عند أول تدريب فقط (استيراده وحده يستغرق ~ثانية مع sklearn)
+_xgb_module = None
+
+def _xgb():
+    global _xgb_module
+    if _xgb_module is None:
+        try:
+            import xgboost
+            _xgb_module = xgboost
+        except Exception:
+            _xgb_module = False
+    return _xgb_module or None
+
+FEATURES = ['month', 'dow', 'is_weekend', 'lag7', 'lag14', 'lag28', 'roll7']
+MIN_ROWS_FOR_MODEL = 40
+XGB_PARAMS = dict(
+    n_estimators=200, max_depth=4, learning_rate=0.07,
+    subsample=0.9, colsample_bytree=0.9, reg_lambda=1.0,
+    objective="reg:squarederror", random_state=42
+)
+# عند إضافة صفوف جديدة فقط: أشجار إضافية تُدرَّب على الصفوف الجديدة
+WARM_START_TREES = 20
+# بعد هذا العدد من التحديثات التدريجية يُعاد التدريب كاملًا
+MAX_WARM_UPDATES = 5
+MODEL_DIR = DATA_DIR / "models"
+PERSIST_MODELS = os.environ.get("EXPENSES_PERSIST_MODELS") == "1"
+
+def _sorted_by_date(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
     df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values('date')
+    # id (إن وُجد) يثبّت ترتيب عمليات اليوم الواحد فتصبح الإضافات الجديدة في النهاية
+    sort_cols = ['date', 'id'] if 'id' in df.columns else ['date']
+    return df.sort_values(sort_cols, kind='mergesort')
+
+LAGS = (7, 14, 28)
+ROLL_WINDOW = 7
+
+def _group_offsets(n: int, sizes: np.ndarray) -> np.ndarray:
+    """موضع كل صف داخل مجموعته لمصفوفة مرتبة حسب المجموعة (بدون حلقات)."""
+    starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return np.arange(n) - starts
+
+def _lag_features(df: pd.DataFrame, sizes: np.ndarray) -> pd.DataFrame:
+    # df مرتب حسب التصنيف ثم التاريخ؛ الإزاحات داخل كل تصنيف تُحسب دفعة واحدة بـ NumPy
+    a = df['amount'].to_numpy(dtype='float64')
+    n = len(a)
+    pos = _group_offsets(n, sizes)
+    idx = np.arange(n)
+
+    def shifted(k: int) -> np.ndarray:
+        out = np.zeros(n)
+        ok = pos >= k
+        out[ok] = a[idx[ok] - k]
+        return out
+
+    for k in LAGS:
+        df[f'lag{k}'] = shifted(k)
+    window = shifted(0)
+    for k in range(1, ROLL_WINDOW):
+        window += shifted(k)
+    df[f'roll{ROLL_WINDOW}'] = window / np.minimum(pos + 1, ROLL_WINDOW)
+    return df
+
+def _calendar_features(df: pd.DataFrame) -> pd.DataFrame:
     df['month'] = df['date'].dt.month
     df['dow'] = df['date'].dt.dayofweek
     df['is_weekend'] = (df['dow'] >= 5).astype(int)
+    return df
+
+def _category_date_order(codes: np.ndarray, dates: pd.Series, ids: Optional[np.ndarray]) -> np.ndarray:
+    """ترتيب ثابت حسب (التصنيف، التاريخ، id) بفرز واحد على مفتاح صحيح مركّب."""
+    t = dates.to_numpy().view(np.int64)
+    base = np.arange(len(codes)) if ids is None else np.argsort(ids)
+    t_min, span = (int(t.min()), int(t.max()) - int(t.min()) + 1) if len(t) else (0, 1)
+    if (int(codes.max(initial=0)) + 1) * span >= 2 ** 62:
+        keys = [t, codes] if ids is None else [ids, t, codes]
+        return np.lexsort(keys)
+    key = codes.astype(np.int64) * span + (t - t_min)
+    return base[np.argsort(key[base], kind='stable')]
+
+@timed()
+def build_features(df: pd.DataFrame) -> pd.DataFrame:
+    """خصائص التقويم + lag7/lag14/lag28/roll7 لكل تصنيف بإزاحة الصفوف، في مرور واحد."""
+    df = df[df['category'].notna()].copy()
+    df['date'] = pd.to_datetime(df['date'])
+    codes, _ = pd.factorize(df['category'], sort=True)
+    ids = df['id'].to_numpy() if 'id' in df.columns else None
+    df = df.iloc[_category_date_order(codes, df['date'], ids)]
+    df = _calendar_features(df)
+    return _lag_features(df, np.bincount(codes))
+
+def build_daily_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    مثل build_features لكن على سلسلة يومية مُعاد تشكيلها لكل تصنيف (الأيام بلا صرف = 0)،
+    فتصبح lag7 = قيمة قبل 7 أيام تقويمية لا قبل 7 عمليات.
+    """
+    dates = pd.to_datetime(df['date']).dt.normalize()
+    daily = df['amount'].groupby([df['category'], dates], observed=True).sum()
+    cats = daily.index.get_level_values(0)
+    days = daily.index.get_level_values(1)
+    bounds = pd.DataFrame({'category': cats, 'date': days}).groupby('category', observed=True)['date'].min()
+    end = days.max()
+    sizes = ((end - bounds).dt.days + 1).to_numpy()
+    n = int(sizes.sum())
+    full_dates = np.repeat(bounds.to_numpy(), sizes) + pd.to_timedelta(_group_offsets(n, sizes), unit='D')
+    full_index = pd.MultiIndex.from_arrays([np.repeat(bounds.index.to_numpy(), sizes), full_dates],
+                                           names=['category', 'date'])
+    out = daily.reindex(full_index, fill_value=0.0).reset_index()
+    out = _calendar_features(out)
+    return _lag_features(out, sizes)
+
+# ============= ذاكرة النماذج =============
+
+def _digest(g: pd.DataFrame, n: Optional[int] = None) -> str:
+    """بصمة بيانات تصنيف واحد (التاريخ + المبلغ بالترتيب) — تتغير مع أي تعديل."""
+    if n is not None:
+        g = g.iloc[:n]
+    h = hashlib.sha1()
+    h.update(pd.to_datetime(g['date']).values.astype('datetime64[ns]').tobytes())
+    h.update(g['amount'].to_numpy(dtype='float64').tobytes())
+    return h.hexdigest()
+
+class ModelCache:
+    """
+    ذاكرة LRU لنماذج التنبؤ مفتاحها (user_id, category, نسخة البيانات).
+    عند إضافة صفوف فقط يُكمَل تدريب النموذج السابق (warm start) بدل البدء من الصفر.
+    """
+
+    def __init__(self, max_entries: int = 512, persist_dir: Optional[Union[str, Path]] = None):
+        self.max_entries = max_entries
+        self.persist_dir = Path(persist_dir) if persist_dir else None
+        self._entries: "OrderedDict[Tuple[int, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "warm_starts": 0, "full_fits": 0,
+                      "evictions": 0, "train_seconds": 0.0}
+
+    def _path(self, key: Tuple[int, str]) -> Path:
+        cat = hashlib.sha1(str(key[1]).encode("utf-8")).hexdigest()[:16]
+        return self.persist_dir / f"{key[0]}_{cat}.pkl"
 
-    parts = []
-    for cat, g in df.groupby('category'):
-        g = g.sort_values('date').copy()
-        g['lag7']  = g['amount'].shift(7)
-        g['lag14'] = g['amount'].shift(14)
-        g['lag28'] = g['amount'].shift(28)
-        g['roll7'] = g['amount'].rolling(7, min_periods=1).mean()
-        parts.append(g)
-    out = pd.concat(parts).fillna(0.0)
+    def get(self, key: Tuple[int, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self.persist_dir is not None:
+            path = self._path(key)
+            if path.exists():
+                try:
+                    with open(path, "rb") as f:
+                        entry = pickle.load(f)
+                except Exception:
+                    return None
+                self._put(key, entry)
+                return entry
+        return None
+
+    def _put(self, key: Tuple[int, str], entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def put(self, key: Tuple[int, str], entry: Dict[str, Any]) -> None:
+        self._put(key, entry)
+        if self.persist_dir is not None:
+            self.persist_dir.mkdir(parents=True, exist_ok=True)
+            tmp = self._path(key).with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(entry, f)
+            tmp.replace(self._path(key))
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.stats[name] += value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+MODEL_CACHE = ModelCache(persist_dir=MODEL_DIR if PERSIST_MODELS else None)
+
+def cache_stats(cache: ModelCache = MODEL_CACHE) -> Dict[str, float]:
+    with cache._lock:
+        out = dict(cache.stats)
+        out["entries"] = len(cache._entries)
     return out
 
-def train_and_forecast_per_category(df: pd.DataFrame) -> dict:
+def _fallback_pred(y: pd.Series) -> float:
+    return float(y.tail(14).mean() if len(y) >= 14 else y.mean() if len(y) else 0.0)
 
+def _fit_category(g: pd.DataFrame, prev: Optional[Dict[str, Any]], version: str,
+                  n_jobs: Optional[int] = None) -> Dict[str, Any]:
+    params = XGB_PARAMS if n_jobs is None else {**XGB_PARAMS, "n_jobs": n_jobs}
+    X = g[FEATURES]
+    y = g['amount']
+    n_prev = prev["n"] if prev else 0
+    warm = (prev is not None and prev.get("model") is not None
+            and prev["warm_updates"] < MAX_WARM_UPDATES
+            and 0 < n_prev < len(g) and _digest(g, n_prev) == prev["version"])
+    if warm:
+        model = _xgb().XGBRegressor(**{**params, "n_estimators": WARM_START_TREES})
+        model.fit(X.iloc[n_prev:], y.iloc[n_prev:], xgb_model=prev["model"].get_booster())
+        warm_updates = prev["warm_updates"] + 1
+    else:
+        model = _xgb().XGBRegressor(**params)
+        model.fit(X, y)
+        warm_updates = 0
+    pred = float(model.predict(X.tail(1).values)[0])
+    return {"version": version, "n": len(g), "model": model, "pred": pred,
+            "warm_updates": warm_updates, "warm": warm}
+
+def _fit_task(task: Tuple[pd.DataFrame, Optional[Dict[str, Any]], str, Optional[int]]) -> Tuple[Dict[str, Any], float]:
+    # دالة على مستوى الوحدة لتكون قابلة لـ pickle مع ProcessPoolExecutor
+    t0 = time.perf_counter()
+    entry = _fit_category(*task)
+    return entry, time.perf_counter() - t0
+
+@timed(name="forecast.train")
+def train_and_forecast_per_category(df: pd.DataFrame, user_id: Optional[int] = None,
+                                    cache: Optional[ModelCache] = MODEL_CACHE,
+                                    backend: Optional[str] = None,
+                                    workers: Optional[int] = None) -> dict:
+    """
+    توقع المصروف اليومي لكل تصنيف.
+    مع user_id تُخزَّن النماذج وتوقعاتها ولا يُعاد التدريب إلا إذا تغيّرت بيانات التصنيف.
+    backend/workers: تدريب نماذج التصنيفات بالتوازي (serial | thread | process).
+    """
     if df.empty:
         return {}
 
-    df = build_features(df)
+    has_xgb = _xgb() is not None
+    use_cache = user_id is not None and cache is not None and has_xgb
+    raw = _sorted_by_date(df)
     preds = {}
-
-    for cat, g in df.groupby('category'):
-        X = g[['month','dow','is_weekend','lag7','lag14','lag28','roll7']]
-        y = g['amount']
-
+    versions = {}
+    for cat, g in raw.groupby('category', observed=True):
         # بيانات قليلة → متوسط
-        if len(g) < 40 or not HAS_XGB:
-            preds[cat] = float(y.tail(14).mean() if len(y) >= 14 else y.mean() if len(y) else 0.0)
+        if len(g) < MIN_ROWS_FOR_MODEL or not has_xgb:
+            preds[cat] = _fallback_pred(g['amount'])
             continue
+        preds[cat] = None
+        if use_cache:
+            # فحص البصمة قبل بناء الخصائص: التصنيفات التي لم تتغير لا تُعاد
+            versions[cat] = _digest(g)
+            prev = cache.get((user_id, cat))
+            if prev is not None and prev["version"] == versions[cat]:
+                cache.count("hits")
+                preds[cat] = prev["pred"]
 
-        model = xgb.XGBRegressor(
-            n_estimators=200, max_depth=4, learning_rate=0.07,
-            subsample=0.9, colsample_bytree=0.9, reg_lambda=1.0,
-            objective="reg:squarederror", random_state=42
-        )
-        model.fit(X, y)
-        x_last = X.tail(1).values
-        preds[cat] = float(model.predict(x_last)[0])
+    todo = [cat for cat, p in preds.items() if p is None]
+    if not todo:
+        return preds
+
+    # الخصائص تُحسب لكل تصنيف على حدة، فنبنيها للتصنيفات المطلوبة فقط
+    feats = build_features(raw[raw['category'].isin(todo)])
+    # بالتوازي: خيط XGBoost واحد لكل نموذج لتجنب تزاحم الأنوية
+    n_jobs = 1 if is_parallel(backend, workers) else None
+    groups = list(feats.groupby('category', observed=True))
+    prevs = [cache.get((user_id, cat)) if use_cache else None for cat, _ in groups]
+    tasks = [(g, prev, versions.get(cat, ""), n_jobs) for (cat, g), prev in zip(groups, prevs)]
+    with span("forecast.xgboost_fit", rows=len(feats)):
+        results = map_tasks(_fit_task, tasks, backend, workers)
+
+    for (cat, _), (entry, seconds) in zip(groups, results):
+        preds[cat] = entry["pred"]
+        if not use_cache:
+            continue
+        cache.count("misses")
+        cache.count("train_seconds", seconds)
+        cache.count("warm_starts" if entry.pop("warm") else "full_fits")
+        cache.put((user_id, cat), entry)
 
     return preds
 
 def monthly_projection(preds_daily: dict, days=30) -> dict:
     return {k: float(v) * days for k, v in preds_daily.items()}
+
+# ============= النموذج العام متعدد الآفاق =============
+# نموذج XGBoost واحد لكل المستخدمين والتصنيفات على السلاسل اليومية (daily_totals):
+# صف لكل (سلسلة، يوم أصل، أفق h) والتصنيف والأفق خصائص، فتوقع 30 يومًا = استدعاء predict واحد.
+# القيم مقسومة على مقياس السلسلة (متوسط 90 يومًا) فيتعلم النموذج أنماطًا مشتركة بين مستخدمين
+# بمستويات صرف مختلفة، والتصنيفات قليلة البيانات تستفيد من أنماط غيرها.
+# EXPENSES_FORECAST_MODE=global يجعل jobs.py يستخدمه بدل نموذج لكل تصنيف.
+
+FORECAST_MODES = ("per_category", "global")
+FORECAST_MODE = os.environ.get("EXPENSES_FORECAST_MODE", "per_category")
+GLOBAL_HORIZON = 30
+GLOBAL_HISTORY_DAYS = 365
+# أيام صفرية قبل أول عملية في كل سلسلة: كل النوافذ (حتى 90 يومًا) تبقى داخل السلسلة
+GLOBAL_PAD_DAYS = 90
+GLOBAL_ORIGIN_STRIDE = 7
+GLOBAL_MAX_ORIGINS = 400_000
+GLOBAL_MODEL_MAX_AGE = 24 * 3600
+# كل عملية تفحص mtime ملف النموذج كل هذه المدة على الأكثر لتلتقط تدريبًا من عملية أخرى
+GLOBAL_MODEL_CHECK_SECONDS = 60.0
+GLOBAL_MODEL_PATH = MODEL_DIR / "global_forecast.pkl"
+GLOBAL_XGB_PARAMS = dict(
+    n_estimators=300, max_depth=6, learning_rate=0.08,
+    subsample=0.8, colsample_bytree=0.9, reg_lambda=1.0, tree_method="hist",
+    objective="reg:squarederror", random_state=42
+)
+GLOBAL_FEATURES = ['category', 'h', 'dow', 'month', 'last1', 'roll7', 'roll28',
+                   'same_dow', 'same_dow4', 'log_scale']
+
+def load_daily_series(user_id: Optional[int] = None,
+                      history_days: int = GLOBAL_HISTORY_DAYS) -> pd.DataFrame:
+    """
+    (user_id, category, date, amount) من daily_totals لمستخدم واحد أو لكل المستخدمين
+    في كل ملفات البيانات، لآخر history_days يومًا فقط.
+    """
+    import db
+
+    q = """SELECT user_id, category, date, SUM(total) AS amount FROM daily_totals
+           WHERE date >= date((SELECT MAX(date) FROM daily_totals {w}), ?) {a}
+           GROUP BY user_id, category, date"""
+    cutoff = f"-{int(history_days)} days"
+    if user_id is not None:
+        with db.get_conn(user_id) as conn:
+            rows = conn.execute(q.format(w="WHERE user_id=?", a="AND user_id=?"),
+                                (user_id, cutoff, user_id)).fetchall()
+    else:
+        rows = []
+        for path in db.iter_shard_paths():
+            with db.shard_conn(path) as conn:
+                rows += conn.execute(q.format(w="", a=""), (cutoff,)).fetchall()
+    out = pd.DataFrame([tuple(r) for r in rows], columns=['user_id', 'category', 'date', 'amount'])
+    out['date'] = pd.to_datetime(out['date'])
+    return out
+
+def _resample_series(daily: pd.DataFrame, pad: int = GLOBAL_PAD_DAYS) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    سلسلة يومية كاملة لكل (مستخدم، تصنيف): من أول يوم - pad حتى آخر يوم للمستخدم،
+    والأيام بلا صرف = 0. الناتج مرتب حسب السلسلة ثم التاريخ مع أطوال السلاسل.
+    """
+    daily = daily.assign(date=pd.to_datetime(daily['date']).dt.normalize())
+    s = daily.groupby(['user_id', 'category', 'date'], sort=True)['amount'].sum()
+    keys = s.index.droplevel('date').unique()
+    first = s.index.to_frame(index=False).groupby(['user_id', 'category'], sort=True)['date'].min()
+    end = daily.groupby('user_id')['date'].max()
+    starts = first.to_numpy() - np.timedelta64(pad, 'D')
+    ends = end.reindex(keys.get_level_values('user_id')).to_numpy()
+    sizes = ((ends - starts) // np.timedelta64(1, 'D')).astype(np.int64) + 1
+    n = int(sizes.sum())
+    dates = np.repeat(starts, sizes) + _group_offsets(n, sizes).astype('timedelta64[D]')
+    index = pd.MultiIndex.from_arrays([np.repeat(keys.get_level_values('user_id').to_numpy(), sizes),
+                                       np.repeat(keys.get_level_values('category').to_numpy(), sizes),
+                                       dates], names=['user_id', 'category', 'date'])
+    out = s.reindex(index, fill_value=0.0).reset_index()
+    return out, sizes
+
+def _category_codes(categories: np.ndarray) -> np.ndarray:
+    # ترتيب ثابت من utils (لا يتغير بين التدريب والتوقع)، والتصنيفات الأخرى رمز واحد
+    from utils import CATEGORIES
+
+    lookup = {c: i for i, c in enumerate(CATEGORIES)}
+    return np.fromiter((lookup.get(c, len(CATEGORIES)) for c in categories), dtype=np.int64,
+                       count=len(categories))
+
+def _horizon_features(series: pd.DataFrame, origins: np.ndarray,
+                      horizons: np.ndarray) -> Tuple[pd.DataFrame, np.ndarray]:
+    """(خصائص، مقياس) لكل صف (أصل i، أفق h): نوافذ حتى يوم الأصل مقسومة على المقياس + تقويم يوم الهدف."""
+    y = series['amount'].to_numpy(dtype='float64')
+    c = np.concatenate([[0.0], np.cumsum(y)])
+    i = origins
+    scale = np.maximum((c[i + 1] - c[i - 89]) / 90, 1.0)
+    j = i + horizons - 7 * ((horizons + 6) // 7)  # آخر يوم بنفس يوم أسبوع الهدف حتى الأصل
+    target_day = series['date'].to_numpy()[i] + horizons.astype('timedelta64[D]')
+    target_day = pd.DatetimeIndex(target_day)
+    return pd.DataFrame({
+        'category': _category_codes(series['category'].to_numpy()[i]),
+        'h': horizons,
+        'dow': target_day.dayofweek,
+        'month': target_day.month,
+        'last1': y[i] / scale,
+        'roll7': (c[i + 1] - c[i - 6]) / 7 / scale,
+        'roll28': (c[i + 1] - c[i - 27]) / 28 / scale,
+        'same_dow': y[j] / scale,
+        'same_dow4': (y[j] + y[j - 7] + y[j - 14] + y[j - 21]) / 4 / scale,
+        'log_scale': np.log1p(scale),
+    }), scale
+
+@timed(name="forecast.global_train", rows=lambda m: m["rows"] if m else 0)
+def train_global_model(daily: Optional[pd.DataFrame] = None, horizon: int = GLOBAL_HORIZON,
+                       n_jobs: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    يدرّب النموذج العام على سلاسل كل المستخدمين (أو daily المعطى): أصل كل GLOBAL_ORIGIN_STRIDE
+    يوم بعد بداية السلسلة × الآفاق 1..horizon. None إن لم يتوفر xgboost أو بيانات كافية.
+    """
+    if _xgb() is None:
+        return None
+    t0 = time.perf_counter()
+    daily = load_daily_series() if daily is None else daily
+    if daily.empty:
+        return None
+    series, sizes = _resample_series(daily)
+    pos = _group_offsets(len(series), sizes)
+    size_of = np.repeat(sizes, sizes)
+    # أصول بأفق كامل داخل السلسلة، بخطوة ثابتة عدًّا من نهايتها (آخر أصل = نهاية - horizon)
+    ok = (pos >= GLOBAL_PAD_DAYS) & (pos + horizon < size_of) & ((size_of - 1 - horizon - pos) % GLOBAL_ORIGIN_STRIDE == 0)
+    origins = np.flatnonzero(ok)
+    if len(origins) == 0:
+        return None
+    if len(origins) > GLOBAL_MAX_ORIGINS:
+        origins = np.sort(np.random.default_rng(42).choice(origins, GLOBAL_MAX_ORIGINS, replace=False))
+    hs = np.tile(np.arange(1, horizon + 1), len(origins))
+    idx = np.repeat(origins, horizon)
+    X, scale = _horizon_features(series, idx, hs)
+    y = series['amount'].to_numpy(dtype='float64')[idx + hs] / scale
+
+    params = GLOBAL_XGB_PARAMS if n_jobs is None else {**GLOBAL_XGB_PARAMS, "n_jobs": n_jobs}
+    model = _xgb().XGBRegressor(**params)
+    model.fit(X[GLOBAL_FEATURES], y)
+    return {"model": model, "horizon": horizon, "rows": len(X), "series": len(sizes),
+            "trained_at": time.time(), "seconds": time.perf_counter() - t0}
+
+_global_lock = threading.Lock()
+# {entry, mtime, checked}: النسخة المحمّلة ومتى فُحص الملف آخر مرة
+_global_state: Dict[str, Any] = {"entry": None, "mtime": None, "checked": 0.0}
+
+def get_global_model(path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """
+    النموذج العام المشترك كما حفظه آخر تدريب (manage.py train-forecast أو مهمة global_model)،
+    أو None قبل أول تدريب. لا يدرّب أبدًا: يعيد تحميل الملف متى تغيّر mtime، والفحص نفسه
+    مرة كل GLOBAL_MODEL_CHECK_SECONDS (أو فورًا إن كانت النسخة المحمّلة قديمة).
+    """
+    path = path or GLOBAL_MODEL_PATH
+    with _global_lock:
+        state, now = _global_state, time.time()
+        entry = state["entry"]
+        due = entry is None or global_model_stale(entry) or now - state["checked"] >= GLOBAL_MODEL_CHECK_SECONDS
+        if not due:
+            return entry
+        state["checked"] = now
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            return entry
+        if mtime != state["mtime"]:
+            try:
+                with open(path, "rb") as f:
+                    entry = pickle.load(f)
+            except Exception:
+                return state["entry"]
+            state.update(entry=entry, mtime=mtime)
+        return entry
+
+def global_model_stale(entry: Optional[Dict[str, Any]], max_age: float = GLOBAL_MODEL_MAX_AGE) -> bool:
+    return entry is None or time.time() - entry["trained_at"] > max_age
+
+def refresh_global_model(path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """
+    يدرّب النموذج العام على كل الأجزاء ويحفظه ذريًا؛ للـ CLI ومهمة global_model الخلفية
+    فقط، لا داخل مهمة توقع مستخدم. باقي العمليات تلتقطه من الملف عبر get_global_model.
+    """
+    path = path or GLOBAL_MODEL_PATH
+    entry = train_global_model()
+    if entry is None:
+        return None
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(entry, f)
+    tmp.replace(path)
+    with _global_lock:
+        _global_state.update(entry=entry, mtime=path.stat().st_mtime, checked=time.time())
+    return entry
+
+def predict_paths(entry: Dict[str, Any], daily: pd.DataFrame,
+                  horizon: Optional[int] = None) -> Dict[Tuple[int, str], np.ndarray]:
+    """مسار يومي لـ horizon يومًا بعد آخر يوم لكل سلسلة في daily — كل السلاسل في predict واحد."""
+    horizon = horizon or entry["horizon"]
+    if daily.empty:
+        return {}
+    series, sizes = _resample_series(daily)
+    last = np.cumsum(sizes) - 1
+    hs = np.tile(np.arange(1, horizon + 1), len(last))
+    X, scale = _horizon_features(series, np.repeat(last, horizon), hs)
+    pred = np.maximum(entry["model"].predict(X[GLOBAL_FEATURES]), 0.0) * scale
+    keys = zip(series['user_id'].to_numpy()[last], series['category'].to_numpy()[last])
+    return {k: p for k, p in zip(keys, pred.reshape(len(last), horizon))}
+
+@timed(name="forecast.global_predict")
+def forecast_global(user_id: int, horizon: int = GLOBAL_HORIZON,
+                    entry: Optional[Dict[str, Any]] = None) -> Dict[str, np.ndarray]:
+    """{التصنيف: توقع يومي للأيام 1..horizon} للمستخدم من النموذج العام."""
+    entry = entry or get_global_model()
+    if entry is None:
+        return {}
+    paths = predict_paths(entry, load_daily_series(user_id), horizon)
+    return {cat: p for (_, cat), p in paths.items()}
@@ -0,0 +1,296 @@
+# jobs.py
+"""
+مهام خلفية لحساب التوقعات وتنبيهات الشذوذ خارج سكربت Streamlit.
+
+الطابور جدول jobs في DB_PATH، والنتائج في job_results (ملف بيانات المستخدم).
+بعد كل كتابة تُجدول مهام المستخدم بتأخير JOB_DEBOUNCE_SECONDS، والكتابات المتتالية
+تؤجّل نفس الصف بدل إضافة مهام جديدة. JOB_WORKERS خيطًا (حد التزامن) تنفذ المهام
+المستحقة، والفاشلة تُعاد حتى JOB_MAX_ATTEMPTS بتأخير متضاعف.
+الواجهة تقرأ latest() فقط: آخر نتيجة منتهية مع علامة "قديمة منذ"، وخطأ آخر مهمة
+فاشلة؛ مهمة فشلت على نسخة البيانات الحالية لا تُعاد جدولتها حتى تتغير البيانات.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import db
+from perf import span
+
+log = logging.getLogger(__name__)
+
+JOB_WORKERS = max(1, int(os.environ.get("EXPENSES_JOB_WORKERS", "1")))
+JOB_DEBOUNCE_SECONDS = float(os.environ.get("EXPENSES_JOB_DEBOUNCE", "3"))
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_SECONDS = 10.0
+JOB_POLL_SECONDS = 1.0
+# مهمة running أقدم من هذا تُعتبر يتيمة (عملية توقفت) وتُعاد للطابور؛ العمال يفحصون كل JOB_SWEEP_SECONDS
+JOB_ORPHAN_SECONDS = 900
+JOB_SWEEP_SECONDS = 60.0
+# صفوف done/failed تُحذف بعد يوم
+JOB_KEEP_SECONDS = 24 * 3600
+# نفس نافذة التطبيق (load_expenses_df)
+FRAME_LIMIT = 10_000
+
+# ============= أنواع المهام =============
+
+HANDLERS: Dict[str, Callable[[int], Any]] = {}
+# أنواع لا تخص مستخدمًا (تُجدول بـ GLOBAL_USER ولا تعيدها كتابات المستخدمين)
+GLOBAL_KINDS: set = set()
+GLOBAL_USER = 0
+
+def handler(kind: str, per_user: bool = True):
+    """يسجّل دالة fn(user_id) ترجع نتيجة قابلة لـ JSON."""
+    def deco(fn):
+        HANDLERS[kind] = fn
+        if not per_user:
+            GLOBAL_KINDS.add(kind)
+        return fn
+    return deco
+
+@handler("forecast")
+def _forecast(user_id: int) -> List[Dict[str, Any]]:
+    import forecast
+    from columnar import load_frame
+    from forecast import train_and_forecast_per_category, monthly_projection
+
+    if forecast.FORECAST_MODE == "global":
+        entry = forecast.get_global_model()
+        if forecast.global_model_stale(entry):
+            # التدريب على كل الأجزاء مهمة مستقلة واحدة؛ حتى تنتهي: النسخة القديمة أو نموذج لكل تصنيف
+            enqueue(GLOBAL_USER, "global_model", delay=0)
+        paths = forecast.forecast_global(user_id, entry=entry) if entry is not None else {}
+        if paths:
+            return [{"category": c, "daily": float(p.mean()), "monthly": float(p.sum())} for c, p in paths.items()]
+    df = load_frame(user_id, limit=FRAME_LIMIT)
+    daily = train_and_forecast_per_category(df[["id", "amount", "category", "date"]], user_id=user_id)
+    monthly = monthly_projection(daily, days=30)
+    return [{"category": c, "daily": float(d), "monthly": float(monthly[c])} for c, d in daily.items()]
+
+@handler("global_model", per_user=False)
+def _global_model(user_id: int) -> Optional[Dict[str, Any]]:
+    import forecast
+
+    entry = forecast.refresh_global_model()
+    return None if entry is None else {k: entry[k] for k in ("series", "rows", "seconds", "trained_at")}
+
+@handler("anomalies")
+def _anomalies(user_id: int) -> List[Dict[str, Any]]:
+    from columnar import load_frame
+    from anomalies import detect_anomalies
+
+    df = load_frame(user_id, limit=FRAME_LIMIT)
+    alerts = detect_anomalies(df[["amount", "category", "date"]], window_days=90, contamination=0.06)
+    return [{"category": str(r.category), "date": str(r.date)[:10], "amount": float(r.amount), "level": r.level}
+            for r in alerts.itertuples(index=False)]
+
+# ============= الطابور =============
+
+_wake = threading.Event()
+
+def enqueue(user_id: int, kind: str, delay: float = JOB_DEBOUNCE_SECONDS) -> None:
+    """يجدول مهمة؛ إن كانت مجدولة أصلًا يُؤجَّل موعدها فقط (created_at يبقى = أول طلب)."""
+    if kind not in HANDLERS:
+        raise ValueError(f"unknown job kind {kind!r}; expected one of {tuple(HANDLERS)}")
+    now = time.time()
+    with db.get_conn() as conn:
+        conn.execute(
+            """INSERT INTO jobs(user_id, kind, run_after, created_at) VALUES(?,?,?,?)
+               ON CONFLICT(user_id, kind) WHERE status = 'queued'
+               DO UPDATE SET run_after = excluded.run_after""",
+            (user_id, kind, now + delay, now)
+        )
+    _wake.set()
+
+def schedule_user(user_id: int, delay: float = JOB_DEBOUNCE_SECONDS) -> None:
+    """مستمع الكتابة: كل أنواع مهام المستخدم بعد فترة الهدوء."""
+    for kind in HANDLERS:
+        if kind not in GLOBAL_KINDS:
+            enqueue(user_id, kind, delay)
+
+def _claim() -> Optional[Dict[str, Any]]:
+    # اختيار وحجز في جملة واحدة؛ لا تعمل مهمتان لنفس (مستخدم، نوع) معًا
+    with db.get_conn() as conn:
+        row = conn.execute(
+            """UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = :now
+               WHERE id = (
+                   SELECT j.id FROM jobs j
+                   WHERE j.status = 'queued' AND j.run_after <= :now
+                     AND NOT EXISTS (SELECT 1 FROM jobs r WHERE r.status = 'running'
+                                     AND r.user_id = j.user_id AND r.kind = j.kind)
+                   ORDER BY j.run_after LIMIT 1)
+               RETURNING id, user_id, kind, attempts""",
+            {"now": time.time()}
+        ).fetchone()
+        return dict(row) if row else None
+
+def _finish(job: Dict[str, Any], error: Optional[str], version: int) -> None:
+    now = time.time()
+    with db.get_conn() as conn:
+        if error is None:
+            conn.execute("UPDATE jobs SET status='done', finished_at=?, error=NULL, data_version=? WHERE id=?",
+                         (now, version, job["id"]))
+            return
+        retry = 0
+        if job["attempts"] < JOB_MAX_ATTEMPTS:
+            # إن جُدولت مهمة أحدث لنفس المستخدم والنوع فهي تغني عن الإعادة
+            retry = conn.execute(
+                """UPDATE jobs SET status='queued', run_after=?, error=?, data_version=?
+                   WHERE id=? AND NOT EXISTS (SELECT 1 FROM jobs WHERE status='queued'
+                                              AND user_id=? AND kind=?)""",
+                (now + JOB_RETRY_SECONDS * 2 ** (job["attempts"] - 1), error, version,
+                 job["id"], job["user_id"], job["kind"])
+            ).rowcount
+        if not retry:
+            conn.execute("UPDATE jobs SET status='failed', finished_at=?, error=?, data_version=? WHERE id=?",
+                         (now, error, version, job["id"]))
+
+def run_job(job: Dict[str, Any]) -> None:
+    uid, kind = job["user_id"], job["kind"]
+    version = None
+    try:
+        # النسخة تُقرأ قبل الحساب: كتابة أثناءه تجعل النتيجة قديمة وتجدول مهمة جديدة
+        version = db.get_data_version(uid)
+        with span(f"jobs.{kind}"):
+            payload = json.dumps(HANDLERS[kind](uid), ensure_ascii=False)
+        with db.get_conn(uid) as conn:
+            conn.execute(
+                """INSERT INTO job_results(user_id, kind, data_version, payload, computed_at)
+                   VALUES(?,?,?,?,?)
+                   ON CONFLICT(user_id, kind) DO UPDATE SET data_version=excluded.data_version,
+                       payload=excluded.payload, computed_at=excluded.computed_at""",
+                (uid, kind, version, payload, time.time())
+            )
+    except Exception as e:
+        _finish(job, f"{type(e).__name__}: {e}", version)
+    else:
+        _finish(job, None, version)
+
+def run_pending(limit: Optional[int] = None) -> int:
+    """ينفذ المهام المستحقة الآن في الخيط الحالي (لـ manage.py والقياس)؛ يرجع عددها."""
+    n = 0
+    while limit is None or n < limit:
+        job = _claim()
+        if job is None:
+            break
+        run_job(job)
+        n += 1
+    return n
+
+def requeue_orphans(older_than: float = JOB_ORPHAN_SECONDS) -> int:
+    with db.get_conn() as conn:
+        return conn.execute(
+            """UPDATE jobs SET status='queued', run_after=?
+               WHERE status='running' AND started_at < ?
+                 AND NOT EXISTS (SELECT 1 FROM jobs q WHERE q.status='queued'
+                                 AND q.user_id=jobs.user_id AND q.kind=jobs.kind)""",
+            (time.time(), time.time() - older_than)
+        ).rowcount
+
+def purge_jobs(older_than: float = JOB_KEEP_SECONDS) -> int:
+    with db.get_conn() as conn:
+        return conn.execute("DELETE FROM jobs WHERE status IN ('done','failed') AND finished_at < ?",
+                            (time.time() - older_than,)).rowcount
+
+# ============= مجمّع العمال =============
+
+_threads: List[threading.Thread] = []
+_stop = threading.Event()
+_lock = threading.Lock()
+
+def _worker() -> None:
+    sweep_at = time.monotonic() + JOB_SWEEP_SECONDS
+    while not _stop.is_set():
+        try:
+            if time.monotonic() >= sweep_at:
+                sweep_at = time.monotonic() + JOB_SWEEP_SECONDS
+                requeue_orphans()
+            job = _claim()
+            if job is None:
+                _wake.wait(JOB_POLL_SECONDS)
+                _wake.clear()
+                continue
+            run_job(job)
+        except Exception:
+            # قاعدة مقفلة أو قرص ممتلئ مثلًا: الخيط يبقى حيًا، والمهمة العالقة يعيدها فحص الأيتام
+            log.exception("jobs worker iteration failed")
+            _stop.wait(JOB_POLL_SECONDS)
+
+def start(workers: int = JOB_WORKERS) -> None:
+    """يشغّل العمال مرة واحدة في العملية ويربط الجدولة بكل كتابة في db."""
+    with _lock:
+        if _threads:
+            return
+        db.init_db()
+        requeue_orphans()
+        purge_jobs()
+        db.add_write_hook(schedule_user)
+        _stop.clear()
+        for i in range(workers):
+            t = threading.Thread(target=_worker, name=f"jobs-{i}", daemon=True)
+            t.start()
+            _threads.append(t)
+
+def stop(timeout: float = 5.0) -> None:
+    with _lock:
+        threads = list(_threads)
+        _threads.clear()
+    _stop.set()
+    _wake.set()
+    for t in threads:
+        t.join(timeout)
+
+atexit.register(stop)
+
+# ============= القراءة =============
+
+def latest(user_id: int, kind: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    آخر نتيجة منتهية: {payload, computed_at, stale, stale_since, status, error}، أو None قبل
+    أول حساب. نتيجة أقدم من نسخة البيانات الحالية = stale، وstale_since = أول كتابة لم تُحسب بعد.
+    إن فشلت المهمة ولا نتيجة بعد: payload = None مع الخطأ بدل None.
+    """
+    version = db.get_data_version(user_id) if version is None else version
+    with db.get_conn(user_id) as conn:
+        res = conn.execute("SELECT data_version, payload, computed_at FROM job_results WHERE user_id=? AND kind=?",
+                           (user_id, kind)).fetchone()
+    with db.get_conn() as conn:
+        job = conn.execute(
+            """SELECT status, MIN(created_at) AS since FROM jobs
+               WHERE user_id=? AND kind=? AND status IN ('queued','running')""",
+            (user_id, kind)).fetchone()
+        last = conn.execute(
+            "SELECT status, error, data_version FROM jobs WHERE user_id=? AND kind=? ORDER BY id DESC LIMIT 1",
+            (user_id, kind)).fetchone()
+    pending = job["since"] is not None
+    stale = res is None or res["data_version"] < version
+    # فشلت المحاولات كلها على هذه النسخة نفسها → إعادتها لن تغير شيئًا حتى تتغير البيانات
+    failed = last is not None and last["status"] == "failed" and last["data_version"] == version
+    if stale and not pending and not failed:
+        # كتابة لم تمر بالمستمع (عملية أخرى، manage.py) أو أول زيارة → نجدولها الآن
+        enqueue(user_id, kind, delay=0)
+        status = "queued"
+    else:
+        status = job["status"] if pending else (last["status"] if last else None)
+    if res is None and not failed:
+        return None
+    return {
+        "payload": json.loads(res["payload"]) if res is not None else None,
+        "computed_at": res["computed_at"] if res is not None else None,
+        "stale": stale,
+        "stale_since": (job["since"] if pending else None) if stale else None,
+        "status": status,
+        "error": last["error"] if last else None,
+    }
+
+def job_status(user_id: Optional[int] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    q = "SELECT id, user_id, kind, status, attempts, run_after, created_at, started_at, finished_at, error FROM jobs"
+    params: List[Any] = []
+    if user_id is not None:
+        q += " WHERE user_id=?"
+        params.append(user_id)
+    with db.get_conn() as conn:
+        return [dict(r) for r in conn.execute(q + " ORDER BY id DESC LIMIT ?", (*params, limit))]
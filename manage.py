@@ -0,0 +1,136 @@
+# manage.py
+"""
+أوامر صيانة قاعدة البيانات:
+
+    python manage.py rebuild-rollups [--user ID]
+    python manage.py shard-split --mode hash [--buckets 16] [--delete-source]
+    python manage.py run-jobs [--once] [--workers 2]
+    python manage.py search-index [--optimize-only]
+    python manage.py train-forecast
+    python manage.py archive [--user ID] [--keep-months 12]
+    python manage.py compact [--no-vacuum]
+"""
+import argparse
+import time
+
+import db
+
+
+def cmd_rebuild_rollups(args):
+    db.init_db()
+    db.rebuild_rollups(args.user)
+    print("rollups rebuilt" + (f" for user {args.user}" if args.user is not None else ""))
+
+
+def cmd_shard_split(args):
+    # يُشغَّل والتطبيق متوقف: النسخ من الملف الواحد لا يرى كتابات تحدث أثناءه
+    stats = db.split_into_shards(args.mode, args.buckets, delete_source=args.delete_source)
+    print(f"moved {stats['rows']:,} rows for {stats['users']} users into {stats['shards']} shard files "
+          f"in {stats['seconds']:.1f}s")
+    print(f"now run the app with EXPENSES_SHARD_MODE={args.mode}"
+          + (f" EXPENSES_SHARD_BUCKETS={args.buckets}" if args.mode == "hash" else ""))
+
+
+def cmd_run_jobs(args):
+    # عامل مستقل عن التطبيق: نفس الطابور في DB_PATH، فيمكن تشغيله بجانب Streamlit أو بدلًا من عماله
+    import jobs
+
+    db.init_db()
+    if args.once:
+        print(f"ran {jobs.run_pending()} job(s)")
+        return
+    jobs.start(args.workers)
+    print(f"running {args.workers} job worker(s); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        jobs.stop()
+
+
+def cmd_search_index(args):
+    db.init_db()
+    stats = db.rebuild_search_index(optimize_only=args.optimize_only)
+    what = "optimized" if args.optimize_only else f"rebuilt ({stats['rows']:,} notes)"
+    print(f"search index {what} in {stats['shards']} file(s) in {stats['seconds']:.1f}s")
+
+
+def cmd_train_forecast(args):
+    # النموذج العام يُحفظ في data/models وتلتقطه العمليات الجارية خلال GLOBAL_MODEL_CHECK_SECONDS
+    import forecast
+
+    db.init_db()
+    entry = forecast.refresh_global_model()
+    if entry is None:
+        print("global forecast model not trained (xgboost missing or no data)")
+        return
+    print(f"global forecast model: {entry['series']} series, {entry['rows']:,} rows in {entry['seconds']:.1f}s "
+          f"-> {forecast.GLOBAL_MODEL_PATH}")
+
+
+def cmd_archive(args):
+    import archive
+
+    db.init_db()
+    keep = archive.ARCHIVE_KEEP_MONTHS if args.keep_months is None else args.keep_months
+    if args.user is not None:
+        stats = archive.archive_user(args.user, keep)
+        stats["users"] = 1
+    else:
+        stats = archive.archive_all(keep)
+    print(f"archived {stats['rows']:,} rows in {stats['months']} month(s) for {stats['users']} user(s) "
+          f"({stats['bytes'] / 1e6:.1f} MB parquet) in {stats['seconds']:.1f}s")
+
+
+def cmd_compact(args):
+    # VACUUM يحجب الكتابة حتى ينتهي: يُفضَّل والتطبيق متوقف أو في وقت هادئ
+    import archive
+
+    db.init_db()
+    stats = archive.compact(vacuum=not args.no_vacuum)
+    print(f"removed {stats['files_removed']} orphan archive file(s); {stats['shards']} data file(s) "
+          f"{stats['bytes_before'] / 1e6:.1f} MB -> {stats['bytes_after'] / 1e6:.1f} MB in {stats['seconds']:.1f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-rollups", help="إعادة بناء daily_totals/monthly_totals من expenses")
+    p.add_argument("--user", type=int, default=None)
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = sub.add_parser("shard-split", help="تقسيم قاعدة الملف الواحد إلى ملفات لكل مستخدم/مجموعة")
+    p.add_argument("--mode", choices=["user", "hash"], required=True)
+    p.add_argument("--buckets", type=int, default=db.SHARD_BUCKETS)
+    p.add_argument("--delete-source", action="store_true", help="حذف البيانات المنقولة من الملف الأصلي")
+    p.set_defaults(func=cmd_shard_split)
+
+    p = sub.add_parser("run-jobs", help="تنفيذ المهام الخلفية (توقع / شذوذ)")
+    p.add_argument("--once", action="store_true", help="تنفيذ المستحق الآن ثم الخروج")
+    p.add_argument("--workers", type=int, default=1)
+    p.set_defaults(func=cmd_run_jobs)
+
+    p = sub.add_parser("search-index", help="إعادة بناء فهرس البحث في الملاحظات (FTS5) ودمجه")
+    p.add_argument("--optimize-only", action="store_true", help="دمج أجزاء الفهرس دون إعادة البناء")
+    p.set_defaults(func=cmd_search_index)
+
+    p = sub.add_parser("train-forecast", help="تدريب نموذج التوقع العام على كل المستخدمين")
+    p.set_defaults(func=cmd_train_forecast)
+
+    p = sub.add_parser("archive", help="نقل الأشهر المغلقة إلى ملفات Parquet تحت data/archive")
+    p.add_argument("--user", type=int, default=None)
+    p.add_argument("--keep-months", type=int, default=None,
+                   help="أشهر حية قبل الشهر الحالي (افتراضيًا EXPENSES_ARCHIVE_KEEP_MONTHS)")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("compact", help="حذف ملفات الأرشيف اليتيمة وضغط ملفات SQLite (VACUUM)")
+    p.add_argument("--no-vacuum", action="store_true", help="بلا VACUUM (دمج فهرس البحث والتنظيف فقط)")
+    p.set_defaults(func=cmd_compact)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# online_anomalies.py
+"""
+كشف فوري للمصاريف غير الاعتيادية لكل (مستخدم، تصنيف) بإحصاءات متدفقة:
+متوسط/تباين EWMA ومقدّرا P² للمئينين 90 و97. كل عملية جديدة تُقيَّم وتُحدِّث
+الحالة بتكلفة O(1)، والحالة dict بسيط يُخزَّن JSON في SQLite.
+"""
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+EWMA_ALPHA = 0.1
+MIN_OBS = 20            # لا تنبيهات قبل هذا العدد من العمليات في التصنيف
+Z_THRESHOLD = 2.0       # بوابة أولى: يجب أن يبتعد المبلغ عن المتوسط بهذا القدر
+QUANTILES = (("p90", 0.90), ("p97", 0.97))
+
+# ============= مقدّر P² (Jain & Chlamtac) =============
+
+def _p2_init(samples: List[float], p: float) -> Dict[str, Any]:
+    return {
+        "p": p,
+        "q": sorted(samples),
+        "n": [1, 2, 3, 4, 5],
+        "np": [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5],
+        "dn": [0, p / 2, p, (1 + p) / 2, 1],
+    }
+
+def _p2_add(st: Dict[str, Any], x: float) -> None:
+    q, n, np_, dn = st["q"], st["n"], st["np"], st["dn"]
+    if x < q[0]:
+        q[0] = x
+        k = 0
+    elif x >= q[4]:
+        q[4] = x
+        k = 3
+    else:
+        k = 0
+        while k < 3 and x >= q[k + 1]:
+            k += 1
+    for i in range(k + 1, 5):
+        n[i] += 1
+    for i in range(5):
+        np_[i] += dn[i]
+    for i in (1, 2, 3):
+        d = np_[i] - n[i]
+        if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+            d = 1 if d > 0 else -1
+            qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+            )
+            if not q[i - 1] < qp < q[i + 1]:
+                qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+            q[i] = qp
+            n[i] += d
+
+def _exact_quantile(values: List[float], p: float) -> float:
+    xs = sorted(values)
+    pos = p * (len(xs) - 1)
+    lo = int(math.floor(pos))
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (pos - lo)
+
+# ============= الحالة =============
+
+def new_state() -> Dict[str, Any]:
+    return {"count": 0, "mean": 0.0, "var": 0.0, "buf": []}
+
+def quantile(state: Dict[str, Any], name: str) -> Optional[float]:
+    if state["count"] == 0:
+        return None
+    if name in state:
+        return state[name]["q"][2]
+    p = dict(QUANTILES)[name]
+    return _exact_quantile(state["buf"], p)
+
+def score(state: Dict[str, Any], amount: float) -> Tuple[Optional[str], float]:
+    """مستوى الشذوذ (high/medium أو None) وقيمة z للمبلغ مقارنة بالحالة الحالية."""
+    std = math.sqrt(state["var"])
+    z = (amount - state["mean"]) / std if std > 0 else 0.0
+    if state["count"] < MIN_OBS or z < Z_THRESHOLD:
+        return None, z
+    if amount >= quantile(state, "p97"):
+        return "high", z
+    if amount >= quantile(state, "p90"):
+        return "medium", z
+    return None, z
+
+def update(state: Dict[str, Any], amount: float) -> Dict[str, Any]:
+    """يضيف عملية إلى الحالة (تعديل في المكان) ويرجعها."""
+    x = float(amount)
+    if state["count"] == 0:
+        state["mean"], state["var"] = x, 0.0
+    else:
+        diff = x - state["mean"]
+        state["mean"] += EWMA_ALPHA * diff
+        state["var"] = (1 - EWMA_ALPHA) * (state["var"] + EWMA_ALPHA * diff * diff)
+    state["count"] += 1
+
+    if "buf" in state:
+        state["buf"].append(x)
+        if len(state["buf"]) == 5:
+            for name, p in QUANTILES:
+                state[name] = _p2_init(state["buf"], p)
+            del state["buf"]
+    else:
+        for name, _ in QUANTILES:
+            _p2_add(state[name], x)
+    return state
+
+def score_and_update(state: Optional[Dict[str, Any]], amount: float) -> Tuple[Dict[str, Any], Optional[str], float]:
+    state = state if state is not None else new_state()
+    level, z = score(state, amount)
+    return update(state, amount), level, z
@@ -1,49 +1,113 @@
-import pulp
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
 import pandas as pd
-from db import list_expenses
+from db import get_category_totals
+from perf import span, timed, no_rows
+
+# التصنيفات الأساسية
+CATEGORIES = ["طعام", "مواصلات", "ترفيه", "تسوق", "تعليم", "صحة", "فواتير", "أخرى"]
+# حد أدنى (5%) وحد أقصى (30%) من المتاح لكل تصنيف
+MIN_SHARE = 0.05
+MAX_SHARE = 0.30
+
+Bounds = Dict[str, Tuple[float, float]]
 
-def optimize_budget(income: float, saving_goal: float, user_id: int, month: int = None, year: int = None):
+def category_proportions(user_id: int, month: int = None, year: int = None) -> Optional[Tuple[float, ...]]:
+    """نسب الصرف لكل تصنيف من جدول التجميع، أو None إن لم توجد بيانات."""
+    rows = get_category_totals(user_id, month=month, year=year)
+    if not rows:
+        return None
+    totals = {r["category"]: r["total"] for r in rows}
+    total_spent = sum(totals.values())
+    # تقريب النسب يرفع نسبة الإصابة في الذاكرة دون أثر يُذكر على التوزيع
+    return tuple(round(totals[cat] / total_spent, 6) if cat in totals else round(1 / len(CATEGORIES), 6)
+                 for cat in CATEGORIES)
+
+@lru_cache(maxsize=256)
+def _unit_allocation(proportions: Tuple[float, ...]) -> np.ndarray:
     """
-    مُحسّن الميزانية الذكي مع حدود دنيا وعليا لكل تصنيف.
+    حل مسألة LP لمتاح = 1: تعظيم Σ p·x بشرط Σx = 1 و MIN_SHARE ≤ x ≤ MAX_SHARE.
+    الحل الأمثل مغلق: الجميع عند الحد الأدنى ثم يُملأ الباقي بالترتيب التنازلي للنسب.
     """
+    n = len(proportions)
+    x = np.full(n, MIN_SHARE)
+    remaining = 1.0 - n * MIN_SHARE
+    for i in np.argsort(-np.asarray(proportions), kind="stable"):
+        add = min(MAX_SHARE - MIN_SHARE, remaining)
+        x[i] += add
+        remaining -= add
+        if remaining <= 0:
+            break
+    x.setflags(write=False)
+    return x
+
+@lru_cache(maxsize=1024)
+def _solve(income: float, saving_goal: float, proportions: Optional[Tuple[float, ...]]) -> Tuple[Tuple[str, float], ...]:
     available = income - saving_goal
     if available <= 0:
-        return {}
-
-    rows = list_expenses(limit=1000, month=month, year=year, user_id=user_id)
-    df = pd.DataFrame(rows)
-
-    # التصنيفات الأساسية
-    categories = ["طعام", "مواصلات", "ترفيه", "تسوق", "تعليم", "صحة", "فواتير", "أخرى"]
-
+        return ()
     # لو ما فيه بيانات، وزع بالتساوي
-    if df.empty:
-        share = available / len(categories)
-        return {cat: round(share, 2) for cat in categories}
+    if proportions is None:
+        share = available / len(CATEGORIES)
+        return tuple((cat, round(share, 2)) for cat in CATEGORIES)
+    alloc = available * _unit_allocation(proportions)
+    return tuple((cat, round(float(v), 2)) for cat, v in zip(CATEGORIES, alloc))
 
-    # حساب النسب من البيانات السابقة
-    category_totals = df.groupby("category")["amount"].sum()
-    total_spent = category_totals.sum()
-    proportions = {cat: (category_totals[cat] / total_spent) if cat in category_totals else 1/len(categories) for cat in categories}
+def _solve_with_bounds(available: float, proportions: Tuple[float, ...], bounds: Bounds) -> Dict[str, float]:
+    # حدود يحددها المستخدم (بالمبلغ) → نموذج LP عبر PuLP/CBC
+    import pulp
 
-    # إنشاء نموذج LP
     prob = pulp.LpProblem("BudgetOptimizer", pulp.LpMaximize)
+    alloc = {cat: pulp.LpVariable(f"x{i}", lowBound=0) for i, cat in enumerate(CATEGORIES)}
+    p = dict(zip(CATEGORIES, proportions))
+    prob += pulp.lpSum([alloc[cat] * p[cat] for cat in CATEGORIES])
+    prob += pulp.lpSum([alloc[cat] for cat in CATEGORIES]) == available
+    for cat in CATEGORIES:
+        lo, hi = bounds.get(cat, (MIN_SHARE * available, MAX_SHARE * available))
+        prob += alloc[cat] >= lo
+        prob += alloc[cat] <= hi
+    with span("optimizer.cbc", rows=len(CATEGORIES)):
+        status = prob.solve(pulp.PULP_CBC_CMD(msg=0))
+    if pulp.LpStatus[status] != "Optimal":
+        return {}
+    return {cat: round(alloc[cat].value(), 2) for cat in CATEGORIES}
 
-    # متغيرات التوزيع
-    alloc = {cat: pulp.LpVariable(cat, lowBound=0) for cat in categories}
-
-    # دالة الهدف = تعظيم التوزيع حسب العادات السابقة
-    prob += pulp.lpSum([alloc[cat] * proportions[cat] for cat in categories])
-
-    # مجموع التوزيع = المتاح
-    prob += pulp.lpSum([alloc[cat] for cat in categories]) == available
-
-    # حد أدنى (5%) وحد أقصى (30%)
-    for cat in categories:
-        prob += alloc[cat] >= 0.05 * available
-        prob += alloc[cat] <= 0.30 * available
-
-    # حل المسألة
-    prob.solve(pulp.PULP_CBC_CMD(msg=0))
+@timed(rows=no_rows)
+def optimize_budget(income: float, saving_goal: float, user_id: int, month: int = None, year: int = None,
+                    bounds: Optional[Bounds] = None):
+    """
+    مُحسّن الميزانية الذكي مع حدود دنيا وعليا لكل تصنيف.
+    المسار السريع حل مغلق مخزَّن في الذاكرة؛ CBC يُستخدم فقط مع bounds مخصصة
+    {التصنيف: (حد أدنى, حد أعلى)} بالمبلغ.
+    """
+    proportions = category_proportions(user_id, month, year)
+    if bounds:
+        available = income - saving_goal
+        if available <= 0:
+            return {}
+        p = proportions or tuple(1 / len(CATEGORIES) for _ in CATEGORIES)
+        return _solve_with_bounds(available, p, bounds)
+    return dict(_solve(float(income), float(saving_goal), proportions))
 
-    return {cat: round(alloc[cat].value(), 2) for cat in categories}
+@timed()
+def optimize_budget_grid(incomes: Iterable[float], saving_goals: Iterable[float], user_id: int,
+                         month: int = None, year: int = None) -> pd.DataFrame:
+    """
+    سيناريوهات "ماذا لو": يحل شبكة الدخل × هدف الادخار في استدعاء واحد.
+    الحدود نسبية للمتاح، فالحل = المتاح × حل الوحدة لكل السيناريوهات دفعة واحدة.
+    """
+    inc, goal = np.meshgrid(np.asarray(list(incomes), dtype=float),
+                            np.asarray(list(saving_goals), dtype=float), indexing="ij")
+    inc, goal = inc.ravel(), goal.ravel()
+    available = inc - goal
+    proportions = category_proportions(user_id, month, year)
+    unit = (np.full(len(CATEGORIES), 1 / len(CATEGORIES)) if proportions is None
+            else _unit_allocation(proportions))
+    alloc = np.round(np.where(available[:, None] > 0, available[:, None] * unit, np.nan), 2)
+    out = pd.DataFrame(alloc, columns=CATEGORIES)
+    out.insert(0, "available", available)
+    out.insert(0, "saving_goal", goal)
+    out.insert(0, "income", inc)
+    return out
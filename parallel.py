@@ -0,0 +1,63 @@
+# parallel.py
+import atexit
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+BACKENDS = ("serial", "thread", "process")
+# الافتراضي يمكن ضبطه من البيئة دون تعديل الكود
+DEFAULT_BACKEND = os.environ.get("EXPENSES_BACKEND", "serial")
+DEFAULT_WORKERS = int(os.environ.get("EXPENSES_WORKERS", "0")) or (os.cpu_count() or 1)
+
+_executors: Dict[Tuple[str, int], Executor] = {}
+_lock = threading.Lock()
+
+
+def resolve(backend: Optional[str] = None, workers: Optional[int] = None) -> Tuple[str, int]:
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}; expected one of {BACKENDS}")
+    return backend, max(1, workers or DEFAULT_WORKERS)
+
+
+def is_parallel(backend: Optional[str] = None, workers: Optional[int] = None) -> bool:
+    backend, workers = resolve(backend, workers)
+    return backend != "serial" and workers > 1
+
+
+def _executor(backend: str, workers: int) -> Executor:
+    # المجمّعات تُنشأ مرة واحدة وتُعاد؛ إنشاء عمليات جديدة لكل طلب أغلى من التدريب نفسه
+    key = (backend, workers)
+    with _lock:
+        ex = _executors.get(key)
+        if ex is None:
+            cls = ThreadPoolExecutor if backend == "thread" else ProcessPoolExecutor
+            ex = _executors[key] = cls(max_workers=workers)
+        return ex
+
+
+def map_tasks(fn: Callable[[T], R], tasks: Sequence[T],
+              backend: Optional[str] = None, workers: Optional[int] = None) -> List[R]:
+    """
+    ينفذ fn على كل مهمة ويرجع النتائج بنفس ترتيب المهام أيًّا كانت الواجهة،
+    فتتطابق النتائج مع المسار التسلسلي. مع "process" يجب أن تكون fn والمهام قابلة لـ pickle.
+    """
+    backend, workers = resolve(backend, workers)
+    if backend == "serial" or workers == 1 or len(tasks) <= 1:
+        return [fn(t) for t in tasks]
+    return list(_executor(backend, workers).map(fn, tasks))
+
+
+def shutdown() -> None:
+    with _lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for ex in executors:
+        ex.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown)
@@ -0,0 +1,183 @@
+# perf.py
+"""
+قياس خفيف للمسارات الساخنة: span (context manager) و timed (decorator) يسجلان الزمن
+وعدد الصفوف لكل اسم. التجميع في الذاكرة (عدد، مجموع، مئينات من آخر SAMPLES قياس)،
+وtrace() يجمع spans إعادة تشغيل واحدة. التصدير JSON أو نص Prometheus إلى data/perf.
+EXPENSES_PERF=0 يعطّل كل شيء (timed يرجع الدالة كما هي).
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from utils import DATA_DIR
+
+ENABLED = os.environ.get("EXPENSES_PERF", "1") != "0"
+SAMPLES = 2048
+PERF_DIR = DATA_DIR / "perf"
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+# ============= التجميع =============
+
+class _Stat:
+    __slots__ = ("count", "errors", "total", "rows", "max", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.rows = 0
+        self.max = 0.0
+        self.recent: Deque[float] = deque(maxlen=SAMPLES)
+
+_stats: Dict[str, _Stat] = {}
+_lock = threading.Lock()
+_trace: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar("perf_trace", default=None)
+_depth: contextvars.ContextVar[int] = contextvars.ContextVar("perf_depth", default=0)
+
+def record(name: str, seconds: float, rows: Optional[int] = None, error: bool = False) -> None:
+    with _lock:
+        st = _stats.get(name)
+        if st is None:
+            st = _stats[name] = _Stat()
+        st.count += 1
+        st.errors += error
+        st.total += seconds
+        st.rows += rows or 0
+        st.max = max(st.max, seconds)
+        st.recent.append(seconds)
+
+def _quantile(xs: List[float], q: float) -> float:
+    if not xs:
+        return 0.0
+    pos = q * (len(xs) - 1)
+    lo = int(pos)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (pos - lo)
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """{اسم: {count, errors, total_s, rows, max_ms, p50_ms, p90_ms, p95_ms, p99_ms}}"""
+    with _lock:
+        items = [(name, st.count, st.errors, st.total, st.rows, st.max, sorted(st.recent))
+                 for name, st in _stats.items()]
+    out = {}
+    for name, count, errors, total, rows, mx, xs in sorted(items):
+        row = {"count": count, "errors": errors, "total_s": total, "rows": rows, "max_ms": mx * 1000}
+        for q in QUANTILES:
+            row[f"p{int(q * 100)}_ms"] = _quantile(xs, q) * 1000
+        out[name] = row
+    return out
+
+def reset() -> None:
+    with _lock:
+        _stats.clear()
+
+# ============= spans =============
+
+class Span:
+    """ما يُسجَّل لـ span واحد؛ rows يمكن ضبطه من داخل الكتلة."""
+    __slots__ = ("name", "rows", "seconds", "depth", "error")
+
+    def __init__(self, name: str, rows: Optional[int] = None):
+        self.name = name
+        self.rows = rows
+        self.seconds = 0.0
+        self.depth = 0
+        self.error = False
+
+@contextmanager
+def span(name: str, rows: Optional[int] = None) -> Iterator[Span]:
+    s = Span(name, rows)
+    if not ENABLED:
+        yield s
+        return
+    s.depth = _depth.get()
+    token = _depth.set(s.depth + 1)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException:
+        s.error = True
+        raise
+    finally:
+        s.seconds = time.perf_counter() - t0
+        _depth.reset(token)
+        record(name, s.seconds, s.rows, s.error)
+        spans = _trace.get()
+        if spans is not None:
+            spans.append({"name": name, "ms": s.seconds * 1000, "rows": s.rows,
+                          "depth": s.depth, "error": s.error, "start": t0})
+
+def _result_rows(result: Any) -> Optional[int]:
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+def no_rows(result: Any) -> None:
+    return None
+
+def timed(name: Optional[str] = None, rows: Callable[[Any], Optional[int]] = _result_rows):
+    """decorator: span باسم name (افتراضيًا module.function) وعدد الصفوف rows(النتيجة)."""
+    def deco(fn):
+        if not ENABLED:
+            return fn
+        label = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(label) as s:
+                result = fn(*args, **kwargs)
+                s.rows = rows(result)
+                return result
+        return wrapper
+    return deco
+
+@contextmanager
+def trace() -> Iterator[List[Dict[str, Any]]]:
+    """يجمع كل spans المنفذة داخل الكتلة (في نفس الخيط) بترتيب بدئها."""
+    spans: List[Dict[str, Any]] = []
+    token = _trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _trace.reset(token)
+        spans.sort(key=lambda r: r.pop("start"))
+
+# ============= التصدير =============
+
+def to_prometheus(stats: Optional[Dict[str, Dict[str, float]]] = None, prefix: str = "expenses") -> str:
+    stats = snapshot() if stats is None else stats
+    lines = [f"# HELP {prefix}_span_seconds Wall time of instrumented spans.",
+             f"# TYPE {prefix}_span_seconds summary"]
+    for name, s in stats.items():
+        for q in QUANTILES:
+            lines.append(f'{prefix}_span_seconds{{span="{name}",quantile="{q}"}} {s[f"p{int(q * 100)}_ms"] / 1000:.6f}')
+        lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {s["total_s"]:.6f}')
+        lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {s["count"]}')
+    lines += [f"# HELP {prefix}_span_rows_total Rows processed by instrumented spans.",
+              f"# TYPE {prefix}_span_rows_total counter"]
+    lines += [f'{prefix}_span_rows_total{{span="{name}"}} {s["rows"]}' for name, s in stats.items()]
+    lines += [f"# HELP {prefix}_span_errors_total Spans that raised.",
+              f"# TYPE {prefix}_span_errors_total counter"]
+    lines += [f'{prefix}_span_errors_total{{span="{name}"}} {s["errors"]}' for name, s in stats.items()]
+    return "\n".join(lines) + "\n"
+
+def export(fmt: str = "json", path: Optional[Path] = None) -> Path:
+    """يكتب اللقطة الحالية إلى data/perf/metrics.json أو metrics.prom ويرجع المسار."""
+    path = Path(path) if path else PERF_DIR / ("metrics.prom" if fmt == "prometheus" else "metrics.json")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == "prometheus":
+        text = to_prometheus()
+    else:
+        text = json.dumps({"generated_at": time.time(), "spans": snapshot()}, indent=2, ensure_ascii=False)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(path)
+    return path
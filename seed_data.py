@@ -1,21 +1,19 @@
 # seed_data.py
 import random
 import datetime
-from db import add_expense
+from typing import Dict, Iterator, Tuple
+from db import add_expenses_many
+from utils import CATEGORIES as CATS, PAYMENT_METHODS as PAYS
 
-def seed_demo(user_id: int, n: int = 120):
-    cats = ["طعام", "مواصلات", "فواتير", "تسوق", "صحة", "تعليم", "ترفيه", "أخرى"]
-    pays = ["نقدًا", "بطاقة", "Apple Pay", "STC Pay", "أخرى"]
+NOTES = ["", "قهوة", "سوبرماركت", "أجرة", "فاتورة", "مطعم", "ملابس"]
+
+def demo_rows(n: int, days: int = 120) -> Iterator[Tuple[float, str, str, str, str]]:
     today = datetime.date.today()
     for _ in range(n):
-        days_ago = random.randint(0, 120)
+        days_ago = random.randint(0, days)
         d = today - datetime.timedelta(days=days_ago)
         amount = round(random.uniform(10, 600), 2)
-        add_expense(
-            user_id,
-            amount,
-            random.choice(cats),
-            random.choice(pays),
-            str(d),
-            random.choice(["", "قهوة", "سوبرماركت", "أجرة", "فاتورة", "مطعم", "ملابس"]),
-        )
+        yield (amount, random.choice(CATS), random.choice(PAYS), str(d), random.choice(NOTES))
+
+def seed_demo(user_id: int, n: int = 120) -> Dict[str, float]:
+    return add_expenses_many(user_id, demo_rows(n))
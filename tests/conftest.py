@@ -0,0 +1,30 @@
+# tests/conftest.py
+# قاعدة مؤقتة لكل تشغيل (قبل استيراد أي وحدة تقرأ EXPENSES_DB_PATH) وكلفة PBKDF2 منخفضة
+import itertools
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ["EXPENSES_DB_PATH"] = str(Path(tempfile.mkdtemp(prefix="expenses_tests_")) / "expenses.db")
+os.environ["EXPENSES_PBKDF2_ITERATIONS"] = "1000"
+
+import pytest
+
+_names = itertools.count()
+
+
+@pytest.fixture
+def make_user():
+    """مصنع مستخدمين جدد (اسم فريد في كل استدعاء) يرجع user_id."""
+    import db
+
+    db.init_db()
+
+    def make(password: str = "pw") -> int:
+        name = f"user_{next(_names)}"
+        db.create_user(name, password)
+        return db.verify_user(name, password)
+    return make
@@ -0,0 +1,31 @@
+# tests/test_anomaly_flags.py
+import db
+
+
+def _flagged_user(make_user):
+    uid = make_user()
+    for i in range(30):
+        db.add_expense(uid, 10.0 + i % 3, "طعام", "بطاقة", f"2024-02-{1 + i % 28:02d}")
+    eid = db.add_expense(uid, 5000.0, "طعام", "بطاقة", "2024-02-28")
+    assert db.get_anomaly_flag(uid, eid) is not None
+    return uid, eid
+
+
+def test_editing_flagged_expense_drops_flag(make_user):
+    uid, eid = _flagged_user(make_user)
+    db.update_expenses_many(uid, [(eid, {"amount": 11.0, "category": "تسوق"})])
+    assert db.get_anomaly_flag(uid, eid) is None
+
+
+def test_editing_note_keeps_flag(make_user):
+    uid, eid = _flagged_user(make_user)
+    db.update_expense(uid, eid, {"note": "هدية"})
+    assert db.get_anomaly_flag(uid, eid)["amount"] == 5000.0
+
+
+def test_clear_all_resets_detector_state(make_user):
+    uid, _ = _flagged_user(make_user)
+    db.clear_all_expenses(uid)
+    with db.get_conn(uid) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM anomaly_state WHERE user_id=?", (uid,)).fetchone()[0] == 0
+    assert db.get_anomaly_flags(uid) == []
@@ -0,0 +1,45 @@
+# tests/test_archive.py
+import archive
+import db
+from utils import ARCHIVE_DIR
+
+ROWS = [(10.0 * (i + 1), "طعام", "نقدًا", f"2020-01-0{i + 1}", "") for i in range(5)]
+
+
+def _archived_user(make_user) -> int:
+    uid = make_user()
+    db.add_expenses_many(uid, ROWS)
+    archive.archive_month(uid, "2020-01")
+    db.add_expense(uid, 7.0, "صحة", "بطاقة", "2020-02-01", "حي")
+    return uid
+
+
+def _month_totals(uid):
+    return {r["month"]: r["total"] for r in db.get_monthly_totals(uid)}
+
+
+def test_clear_all_drops_partitions_files_and_rollups(make_user):
+    uid = _archived_user(make_user)
+    assert _month_totals(uid) == {"2020-01": 150.0, "2020-02": 7.0}
+    assert db.clear_all_expenses(uid) == 6
+    assert archive.list_expenses(uid, limit=10) == []
+    assert archive.partitions(uid) == [] and _month_totals(uid) == {}
+    assert not (ARCHIVE_DIR / f"user_id={uid}").exists()
+
+
+def test_delete_archived_ids_rewrites_partition(make_user):
+    uid = _archived_user(make_user)
+    rows = archive.list_expenses(uid, limit=10)
+    assert sum(bool(r.get("archived")) for r in rows) == 5
+    old = [r["id"] for r in rows if r.get("archived")][:2]  # 50 + 40
+    live = [r["id"] for r in rows if not r.get("archived")]
+    assert db.delete_expenses(uid, old + live) == 3
+    left = archive.list_expenses(uid, limit=10)
+    assert sorted(r["amount"] for r in left) == [10.0, 20.0, 30.0]
+    assert _month_totals(uid) == {"2020-01": 60.0}
+    (part,) = archive.partitions(uid)
+    assert part["rows"] == 3 and part["total"] == 60.0
+    assert len(list((ARCHIVE_DIR / f"user_id={uid}" / "month=2020-01").iterdir())) == 1
+
+    assert db.delete_expenses(uid, [r["id"] for r in left]) == 3
+    assert archive.partitions(uid) == [] and _month_totals(uid) == {}
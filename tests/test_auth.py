@@ -0,0 +1,26 @@
+# tests/test_auth.py
+import hashlib
+
+import db
+
+
+def test_unknown_username_still_derives_key(monkeypatch):
+    calls = []
+    real = hashlib.pbkdf2_hmac
+
+    def counting(name, password, salt, iterations, *args):
+        calls.append(iterations)
+        return real(name, password, salt, iterations, *args)
+
+    monkeypatch.setattr(hashlib, "pbkdf2_hmac", counting)
+    assert db.verify_user("__no_such_user__", "pw") is None
+    assert calls == [db.PBKDF2_ITERATIONS]
+
+
+def test_login_async_resolves_to_session():
+    db.init_db()
+    db.create_user("__async_login__", "secret")
+    session = db.login_async("__async_login__", "secret").result(timeout=30)
+    assert session["username"] == "__async_login__"
+    assert db.validate_session(session["token"])["user_id"] == session["user_id"]
+    assert db.login_async("__async_login__", "wrong").result(timeout=30) is None
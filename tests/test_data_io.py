@@ -0,0 +1,113 @@
+# tests/test_data_io.py
+import io
+
+import db
+from data_io import export_csv, import_file
+
+ROWS = [(100.0, "طعام", "بطاقة", "2024-01-05", "غداء"),
+        (50.0, "مواصلات", "نقدًا", "2024-01-06", ""),
+        (200.0, "تسوق", "بطاقة", "2024-01-07", "ملابس")]
+
+
+def _export(user_id: int) -> io.StringIO:
+    buf = io.StringIO()
+    export_csv(user_id, buf)
+    buf.seek(0)
+    return buf
+
+
+def test_import_other_users_export_inserts_fresh_ids(make_user):
+    a, b = make_user(), make_user()
+    db.add_expenses_many(a, ROWS)
+    stats = import_file(b, _export(a), "csv")
+    assert stats["rows"] == 3 and stats["errors"] == []
+    mine = db.list_expenses(b, limit=10)
+    assert sorted(r["amount"] for r in mine) == [50.0, 100.0, 200.0]
+    assert {r["id"] for r in mine}.isdisjoint(r["id"] for r in db.list_expenses(a, limit=10))
+    # صفوف المستخدم الأول لم تتغير
+    assert len(db.list_expenses(a, limit=10)) == 3
+
+
+def test_reimport_own_export_updates_in_place(make_user):
+    a = make_user()
+    db.add_expenses_many(a, ROWS)
+    stats = import_file(a, _export(a), "csv")
+    assert stats["rows"] == 3
+    assert len(db.list_expenses(a, limit=10)) == 3
+    assert sum(r["total"] for r in db.get_monthly_totals(a)) == 350.0
+
+
+def _month_rollup(user_id: int, month: str):
+    with db.get_conn(user_id) as conn:
+        row = conn.execute("SELECT SUM(total), SUM(cnt) FROM monthly_totals WHERE user_id=? AND month=?",
+                           (user_id, month)).fetchone()
+    return row[0], row[1]
+
+
+def test_reimport_after_archive_does_not_double_count(make_user):
+    import archive
+
+    a = make_user()
+    db.add_expenses_many(a, ROWS)
+    archive.archive_month(a, "2024-01")
+    db.add_expense(a, 5.0, "طعام", "نقدًا", "2024-01-20", "متأخر")
+    assert _month_rollup(a, "2024-01") == (355.0, 4)
+
+    stats = import_file(a, _export(a), "csv")
+    assert stats["rows"] == 1 and stats["archived"] == 3
+    assert len(stats["errors"]) == 1
+    assert _month_rollup(a, "2024-01") == (355.0, 4)
+
+    archive.archive_month(a, "2024-01")
+    assert _month_rollup(a, "2024-01") == (355.0, 4)
+    listed = archive.list_expenses(a, limit=10)
+    assert len(listed) == 4 and sum(r["amount"] for r in listed) == 355.0
+
+
+def _editor_frames(user_id: int):
+    import pandas as pd
+
+    original = pd.DataFrame(db.list_expenses(user_id, limit=10))[["id", "amount", "category", "payment_method",
+                                                                     "date", "note"]]
+    return original, original.copy()
+
+
+def test_editor_rejects_invalid_date_and_category(make_user):
+    from data_io import save_editor_changes
+
+    uid = make_user()
+    db.add_expenses_many(uid, ROWS)
+    original, edited = _editor_frames(uid)
+    edited.loc[0, "date"] = "garbage"
+    edited.loc[1, "category"] = "غير موجود"
+    edited.loc[2, "note"] = "تعديل صالح"
+    stats = save_editor_changes(uid, original, edited)
+    assert stats["updated"] == 1 and len(stats["errors"]) == 2
+    assert {r["date"] for r in db.list_expenses(uid, limit=10)} == {"2024-01-05", "2024-01-06", "2024-01-07"}
+    assert [r["month"] for r in db.get_monthly_totals(uid)] == ["2024-01"]
+
+
+def test_unknown_categories_import_and_keep_their_notes_editable(make_user):
+    from data_io import save_editor_changes
+
+    uid = make_user()
+    csv = io.StringIO("amount,category,payment_method,date,note\n"
+                      "12.5,Groceries,بطاقة,2024-02-01,\n8,Coffee,نقدًا,2024-02-02,\n")
+    stats = import_file(uid, csv, "csv")
+    assert stats["rows"] == 2 and stats["errors"] == []
+    original, edited = _editor_frames(uid)
+    edited.loc[edited["category"] == "Coffee", "note"] = "لاتيه"
+    stats = save_editor_changes(uid, original, edited)
+    assert stats["updated"] == 1 and stats["errors"] == []
+    assert {r["category"]: r["note"] for r in db.list_expenses(uid, limit=10)}["Coffee"] == "لاتيه"
+
+
+def test_load_frame_skips_unparseable_dates(make_user):
+    from columnar import load_frame
+
+    uid = make_user()
+    db.add_expenses_many(uid, ROWS)
+    eid = db.list_expenses(uid, limit=1)[0]["id"]
+    db.update_expense(uid, eid, {"date": "garbage"})  # بيانات قديمة كُتبت قبل التحقق
+    df = load_frame(uid)
+    assert len(df) == 2 and eid not in set(df["id"])
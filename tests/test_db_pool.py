@@ -0,0 +1,32 @@
+# tests/test_db_pool.py
+import db_pool
+
+
+def test_idle_shard_pools_are_evicted_lru(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_pool, "SHARD_POOL_CACHE", 3)
+    monkeypatch.setattr(db_pool, "_lru", db_pool.OrderedDict())
+    paths = [tmp_path / f"user_{i}.db" for i in range(6)]
+    for p in paths[:3]:
+        with db_pool.get_pool(p, 1, evictable=True).connection() as conn:
+            conn.execute("SELECT 1")
+    db_pool.get_pool(paths[0], 1, evictable=True)  # الأحدث استخدامًا الآن
+    held = db_pool.get_pool(paths[1], 1, evictable=True).acquire()  # مستعار → لا يُخلى
+
+    for p in paths[3:5]:
+        db_pool.get_pool(p, 1, evictable=True)
+    assert list(db_pool._lru) == [str(paths[i]) for i in (1, 3, 4)]
+    held.execute("SELECT 1")
+    db_pool._lru[str(paths[1])].release(held)
+
+    db_pool.get_pool(paths[5], 1, evictable=True)
+    assert list(db_pool._lru) == [str(paths[i]) for i in (3, 4, 5)]
+
+
+def test_evicted_pool_still_serves_existing_holders(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_pool, "SHARD_POOL_CACHE", 1)
+    monkeypatch.setattr(db_pool, "_lru", db_pool.OrderedDict())
+    first = db_pool.get_pool(tmp_path / "user_1.db", 1, evictable=True)
+    db_pool.get_pool(tmp_path / "user_2.db", 1, evictable=True)
+    assert str(tmp_path / "user_1.db") not in db_pool._lru
+    with first.connection() as conn:
+        assert conn.execute("SELECT 1").fetchone()[0] == 1
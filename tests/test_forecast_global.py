@@ -0,0 +1,53 @@
+# tests/test_forecast_global.py
+import os
+import pickle
+import time
+
+import pytest
+
+import db
+import forecast
+import jobs
+
+
+@pytest.fixture
+def model_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(forecast, "_global_state", {"entry": None, "mtime": None, "checked": 0.0})
+    return tmp_path / "global.pkl"
+
+
+def _save(path, trained_at, mtime):
+    path.write_bytes(pickle.dumps({"model": None, "trained_at": trained_at}))
+    os.utime(path, (mtime, mtime))
+
+
+def test_running_process_picks_up_retrained_file(model_path, monkeypatch):
+    monkeypatch.setattr(forecast, "GLOBAL_MODEL_CHECK_SECONDS", 0.0)
+    now = time.time()
+    _save(model_path, now - 10, now - 10)
+    assert forecast.get_global_model(model_path)["trained_at"] == now - 10
+    _save(model_path, now, now)  # manage.py train-forecast في عملية أخرى
+    assert forecast.get_global_model(model_path)["trained_at"] == now
+
+
+def test_stale_model_is_not_retrained_inside_forecast_job(model_path, make_user, monkeypatch):
+    old = time.time() - forecast.GLOBAL_MODEL_MAX_AGE - 60
+    _save(model_path, old, old)
+    monkeypatch.setattr(forecast, "GLOBAL_MODEL_PATH", model_path)
+    monkeypatch.setattr(forecast, "FORECAST_MODE", "global")
+    monkeypatch.setattr(forecast, "train_global_model", lambda *a, **k: pytest.fail("trained inline"))
+    monkeypatch.setattr(forecast, "forecast_global", lambda uid, entry=None: {})
+    monkeypatch.setattr(forecast, "train_and_forecast_per_category", lambda df, user_id=None: {})
+    uid = make_user()
+
+    assert jobs._forecast(uid) == []
+    queued = [j for j in jobs.job_status(jobs.GLOBAL_USER) if j["kind"] == "global_model"]
+    assert [j["status"] for j in queued] == ["queued"]
+    with db.get_conn() as conn:  # لا تدرّبه run_pending في اختبارات لاحقة
+        conn.execute("DELETE FROM jobs WHERE user_id=?", (jobs.GLOBAL_USER,))
+
+
+def test_user_writes_do_not_schedule_global_jobs(make_user):
+    uid = make_user()
+    jobs.schedule_user(uid)
+    assert {j["kind"] for j in jobs.job_status(uid)} == set(jobs.HANDLERS) - jobs.GLOBAL_KINDS
@@ -0,0 +1,60 @@
+# tests/test_jobs.py
+import db
+import jobs
+
+
+def _boom(user_id):
+    raise RuntimeError("boom")
+
+
+def _jobs(uid):
+    return [j for j in jobs.job_status(uid) if j["kind"] == "boom"]
+
+
+def test_failed_job_is_not_requeued_until_data_changes(make_user, monkeypatch):
+    monkeypatch.setitem(jobs.HANDLERS, "boom", _boom)
+    monkeypatch.setattr(jobs, "JOB_RETRY_SECONDS", 0.0)
+    uid = make_user()
+    db.add_expense(uid, 10.0, "طعام", "نقدًا", "2024-01-01", "")
+
+    for _ in range(6):  # إعادات تشغيل الواجهة
+        jobs.latest(uid, "boom")
+        jobs.run_pending()
+    runs = _jobs(uid)
+    assert len(runs) == 1
+    assert runs[0]["status"] == "failed" and runs[0]["attempts"] == jobs.JOB_MAX_ATTEMPTS
+
+    res = jobs.latest(uid, "boom")
+    assert res["payload"] is None
+    assert res["status"] == "failed" and "boom" in res["error"]
+
+    db.add_expense(uid, 20.0, "طعام", "نقدًا", "2024-01-02", "")
+    assert jobs.latest(uid, "boom") is None  # نسخة جديدة → محاولة جديدة
+    assert [j["status"] for j in _jobs(uid)] == ["queued", "failed"]
+
+
+def test_worker_survives_failing_iteration(monkeypatch):
+    import threading
+
+    claims = iter([{"id": -1, "user_id": 0, "kind": "boom", "attempts": 1}])
+    monkeypatch.setattr(jobs, "_claim", lambda: next(claims, None))
+    monkeypatch.setattr(jobs, "run_job", lambda job: (_ for _ in ()).throw(RuntimeError("disk full")))
+    monkeypatch.setattr(jobs, "JOB_POLL_SECONDS", 0.01)
+    t = threading.Thread(target=jobs._worker, daemon=True)
+    t.start()
+    t.join(0.2)
+    alive = t.is_alive()
+    jobs._stop.set()
+    t.join(2)
+    jobs._stop.clear()
+    assert alive
+
+
+def test_failing_write_hook_does_not_fail_the_write(make_user, monkeypatch):
+    def broken(user_id):
+        raise RuntimeError("queue locked")
+
+    monkeypatch.setattr(db, "_write_hooks", [broken])
+    uid = make_user()
+    assert db.add_expense(uid, 10.0, "طعام", "نقدًا", "2024-01-01", "") is not None
+    assert len(db.list_expenses(uid, limit=10)) == 1
@@ -0,0 +1,53 @@
+# tests/test_search.py
+import pytest
+
+import db
+
+NOTES = ["تسوق من H&M", "غداء #البيك مع الفريق", "مشتريات «سوبرماركت» الحي",
+         "هدية @ميار 🎁كيك", "فاتورة_الكهرباء"]
+
+
+@pytest.fixture
+def user(make_user):
+    uid = make_user()
+    db.add_expenses_many(uid, [(10.0 + i, "أخرى", "نقدًا", "2024-01-0%d" % (i + 1), note)
+                               for i, note in enumerate(NOTES)])
+    return uid
+
+
+@pytest.mark.parametrize("query, note", [
+    ("H&M", NOTES[0]), ("h&m", NOTES[0]), ("البيك", NOTES[1]), ("#البيك", NOTES[1]),
+    ("سوبرماركت", NOTES[2]), ("«سوبرماركت»", NOTES[2]), ("ميار", NOTES[3]), ("كيك", NOTES[3]),
+    ("الكهرباء", NOTES[4]), ("فاتوره", NOTES[4]),
+])
+def test_punctuation_and_symbols_split_words(user, query, note):
+    assert [r["note"] for r in db.search_expenses(user, query)] == [note]
+
+
+def test_other_users_notes_stay_invisible(user, make_user):
+    other = make_user()
+    db.add_expense(other, 5.0, "أخرى", "نقدًا", "2024-01-01", "H&M")
+    assert [r["user_id"] for r in db.search_expenses(other, "H&M")] == [other]
+    assert db.search_expenses(other, "البيك") == []
+
+
+def test_edit_and_delete_keep_index_in_sync(user):
+    (row,) = db.search_expenses(user, "البيك")
+    db.update_expense(user, row["id"], {"note": "عشاء في #ماكدونالدز"})
+    assert db.search_expenses(user, "البيك") == []
+    assert [r["id"] for r in db.search_expenses(user, "ماكدونالدز")] == [row["id"]]
+    db.delete_expenses(user, [row["id"]])
+    assert db.search_expenses(user, "ماكدونالدز") == []
+
+
+def test_index_triggers_need_no_python_functions(user):
+    import sqlite3
+
+    (row,) = db.search_expenses(user, "البيك")
+    conn = sqlite3.connect(db.shard_path(user))  # مثل sqlite3 CLI أو أداة نسخ احتياطي
+    with conn:
+        conn.execute("UPDATE expenses SET note='عشاء #شاورما' WHERE id=?", (row["id"],))
+        conn.execute("DELETE FROM expenses WHERE user_id=? AND note LIKE '%H&M%'", (user,))
+    conn.close()
+    assert [r["id"] for r in db.search_expenses(user, "شاورما")] == [row["id"]]
+    assert db.search_expenses(user, "البيك") == [] and db.search_expenses(user, "H&M") == []
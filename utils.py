@@ -1,9 +1,55 @@
 # utils.py
+import importlib
+import os
+import sys
 from pathlib import Path
 
 ROOT = Path(__file__).parent
 DATA_DIR = ROOT / "data"
-DB_PATH = DATA_DIR / "expenses.db"
+# يمكن توجيه التطبيق (أو سكربتات القياس) لقاعدة أخرى عبر متغير البيئة
+DB_PATH = Path(os.environ.get("EXPENSES_DB_PATH", DATA_DIR / "expenses.db"))
+# تقسيم التخزين (اختياري): off = ملف واحد، user = ملف لكل مستخدم، hash = SHARD_BUCKETS ملفًا.
+# DB_PATH يبقى فهرس المستخدمين العام، وملفات البيانات تحت SHARD_DIR.
+SHARD_MODE = os.environ.get("EXPENSES_SHARD_MODE", "off")
+SHARD_BUCKETS = int(os.environ.get("EXPENSES_SHARD_BUCKETS", "16"))
+SHARD_DIR = DB_PATH.parent / "shards"
+# أقصى عدد لمجمّعات اتصالات ملفات الأجزاء المفتوحة معًا؛ الأقدم استخدامًا (الخامل) يُغلق أولًا
+SHARD_POOL_CACHE = int(os.environ.get("EXPENSES_SHARD_POOL_CACHE", "64"))
+# الأشهر المغلقة المؤرشفة (Parquet مضغوط بـ zstd) لكل مستخدم/شهر — انظر archive.py
+ARCHIVE_DIR = DB_PATH.parent / "archive"
+# كلفة اشتقاق كلمات المرور (PBKDF2-SHA256)؛ الكلمات المخزنة بكلفة أقل تُرقّى عند الدخول
+PBKDF2_ITERATIONS = int(os.environ.get("EXPENSES_PBKDF2_ITERATIONS", "200000"))
+# أسماء المستخدمين (مفصولة بفواصل) الذين يظهر لهم تبويب الأداء المخفي
+ADMIN_USERS = frozenset(u.strip() for u in os.environ.get("EXPENSES_ADMIN_USERS", "").split(",") if u.strip())
+
+CATEGORIES = ["طعام", "مواصلات", "فواتير", "تسوق", "صحة", "تعليم", "ترفيه", "أخرى"]
+PAYMENT_METHODS = ["نقدًا", "بطاقة", "Apple Pay", "STC Pay", "أخرى"]
 
 def ensure_dirs():
     DATA_DIR.mkdir(parents=True, exist_ok=True)
+    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    if SHARD_MODE != "off":
+        SHARD_DIR.mkdir(parents=True, exist_ok=True)
+
+class _LazyModule:
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+def lazy_import(name: str):
+    """
+    يرجع وكيلًا للوحدة؛ الاستيراد الفعلي يحدث عند أول وصول لأي خاصية فيها.
+    يُستخدم للمكتبات الثقيلة التي لا تحتاجها شاشة الدخول.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)